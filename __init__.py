@@ -19,10 +19,7 @@ except:
     try: import llvmlite
     except:
         raise Exception("cannot load llvmlite")
-import llvmlite.binding as llvm
-llvm.initialize()
-llvm.initialize_native_target()
-llvm.initialize_native_asmprinter()
+# llvmlite.binding is loaded and initialized on first use, see lazy_imports.py
 
 
 import importlib
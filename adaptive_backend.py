@@ -0,0 +1,145 @@
+'''
+Chooses the backend for every call based on a simple cost model.
+The estimated time of a call is:
+    compilation time (only if the backend has not compiled the function yet)
+    + call overhead + time per element and node
+
+The compilation time is spread over the expected amount of calls, which
+is assumed to be the amount of calls so far. So a tree that is
+evaluated often ends up being compiled by LLVM.
+'''
+
+from collections import defaultdict
+from . execution import TreeExecutionData
+from . numpy_backend import NumpyExecutionData
+from . python_backend import PythonExecutionData
+from . frame_range import get_frame_range
+from . utils.nodes import iter_compute_nodes_in_tree
+from . utils.timing import prettyTime
+
+execution_data_types = {
+    "LLVM" : TreeExecutionData,
+    "NUMPY" : NumpyExecutionData,
+    "PYTHON" : PythonExecutionData
+}
+
+# backend -> (compile time, compile time per node, overhead per call and node, time per element and node)
+# in seconds, measured on a typical desktop machine
+backend_costs = {
+    "LLVM" : (2e-2, 1e-3, 0, 2e-9),
+    "NUMPY" : (0, 0, 5e-6, 5e-9),
+    "PYTHON" : (2e-4, 2e-5, 0, 3e-7)
+}
+
+function_getter_names = {
+    "single" : "get_function",
+    "batch" : "get_batch_function",
+    "vertex" : "get_vertex_function",
+    "frame_range" : "get_frame_range_function"
+}
+
+class AdaptiveExecutionData:
+    '''Provides the same functions as TreeExecutionData.'''
+    def __init__(self, tree):
+        self.tree = tree
+        self.node_amount = max(1, len(list(iter_compute_nodes_in_tree(tree))))
+        self.execution_data_by_backend = dict()
+        self.compiled_functions = set()
+        self.call_counts = defaultdict(int)
+        self.last_choices = dict()
+        self.disposed = False
+
+        # the wrappers are created once, so that callers can compare them
+        self.py_function = self.create_function()
+        self.py_batch_function = self.create_batch_function()
+        self.py_vertex_function = self.create_vertex_function()
+        self.py_frame_range_function = self.create_frame_range_function()
+
+    def get_function(self):
+        return self.py_function
+
+    def get_batch_function(self):
+        return self.py_batch_function
+
+    def get_vertex_function(self):
+        return self.py_vertex_function
+
+    def get_frame_range_function(self):
+        return self.py_frame_range_function
+
+    def create_function(self):
+        def pywrapper(*args, **kwargs):
+            function = self.get_backend_function("single", 1)
+            return function(*args, **kwargs)
+        return pywrapper
+
+    def create_batch_function(self):
+        def pywrapper(amount, *args, **kwargs):
+            function = self.get_backend_function("batch", amount)
+            return function(amount, *args, **kwargs)
+        return pywrapper
+
+    def create_vertex_function(self):
+        def pywrapper(amount, positions_address, results_address, threads = None):
+            function = self.get_backend_function("vertex", amount)
+            return function(amount, positions_address, results_address, threads)
+        return pywrapper
+
+    def create_frame_range_function(self):
+        def pywrapper(frame_start, frame_end, *args, frame_step = 1, **kwargs):
+            amount = len(get_frame_range(frame_start, frame_end, frame_step))
+            function = self.get_backend_function("frame_range", amount)
+            return function(frame_start, frame_end, *args, frame_step = frame_step, **kwargs)
+        return pywrapper
+
+    def get_backend_function(self, kind, amount):
+        self.call_counts[kind] += 1
+        backend = self.choose_backend(kind, amount)
+        self.compiled_functions.add((backend, kind))
+
+        execution_data = self.get_execution_data(backend)
+        return getattr(execution_data, function_getter_names[kind])()
+
+    def choose_backend(self, kind, amount):
+        expected_calls = self.call_counts[kind]
+        costs = {backend : self.estimate_cost(backend, kind, amount, expected_calls)
+                 for backend in backend_costs}
+        backend = min(costs, key = costs.get)
+
+        if self.last_choices.get(kind) != backend:
+            self.last_choices[kind] = backend
+            print("Compute Nodes: '{}' uses {} for {} calls with {} elements ({} nodes, estimated {} per call)".format(
+                self.tree.name, backend, kind, amount, self.node_amount, prettyTime(costs[backend])))
+        return backend
+
+    def estimate_cost(self, backend, kind, amount, expected_calls):
+        compile_time, node_compile_time, call_overhead, element_time = backend_costs[backend]
+        cost = self.node_amount * (call_overhead + element_time * amount)
+        if (backend, kind) not in self.compiled_functions:
+            cost += (compile_time + self.node_amount * node_compile_time) / expected_calls
+        return cost
+
+    def dispose(self):
+        self.disposed = True
+        for execution_data in self.execution_data_by_backend.values():
+            execution_data.dispose()
+
+    def get_statistics(self):
+        statistics = [data.get_statistics() for data in self.execution_data_by_backend.values()]
+        return {
+            "engines" : sum(s["engines"] for s in statistics),
+            "code_bytes" : sum(s["code_bytes"] for s in statistics)
+        }
+
+    def print_modules(self):
+        self.get_execution_data("LLVM").print_modules()
+
+    def print_module_assembly(self):
+        self.get_execution_data("LLVM").print_module_assembly()
+
+    def get_execution_data(self, backend):
+        if self.disposed:
+            raise Exception("the execution data of '{}' has been disposed".format(self.tree.name))
+        if backend not in self.execution_data_by_backend:
+            self.execution_data_by_backend[backend] = execution_data_types[backend](self.tree)
+        return self.execution_data_by_backend[backend]
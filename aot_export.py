@@ -0,0 +1,167 @@
+'''
+Ahead-of-time compilation of a tree into an object file and a shared library.
+
+The library has a stable C ABI that does not depend on the tree:
+    void cn_evaluate(int32_t amount, const T *inputs..., T *outputs...);
+Every input and output is an array with `amount` elements.
+All unlinked sockets become exported globals called cn_param_<index>.
+The frame and time of Frame Input nodes are parameters as well, their
+values are the ones of the current frame of the scene.
+The manifest describes the types of inputs, outputs and parameters.
+'''
+
+import os
+import json
+import shutil
+from llvmlite import ir
+from . lazy_imports import llvm
+from . tree_info import update_if_necessary
+from . node_parameters import specialize_tree
+from . execution import find_interface_nodes, insert_batch_function, iter_global_inputs
+from . frame_input_node import SceneTimeValue
+from . aot_loader import MANIFEST_VERSION, ENTRY_POINT_NAME
+from . utils.compile_worker import optimize_module
+
+c_type_names = {
+    "cn_FloatSocket" : "float",
+    "cn_VectorSocket" : "float[3]",
+    "cn_ObjectSocket" : "void*"
+}
+
+def export_tree(tree, directory, name = None):
+    name = name or validify_file_name(tree.name)
+    os.makedirs(directory, exist_ok = True)
+
+    # parameters that are runtime data would be part of the ABI
+    specialize_tree(tree)
+    update_if_necessary()
+
+    input_node, output_node, _ = find_interface_nodes(tree)
+    input_sockets = list(getattr(input_node, "outputs", []))
+    output_sockets = list(output_node.inputs)
+    parameters = list(iter_global_inputs(tree))
+    # the addresses of called functions are only known at runtime
+    if not all(is_exportable(value) for node, value, global_name in parameters):
+        raise Exception("trees can only be exported when all called trees are inlined")
+
+    module_ir = generate_export_module(name, input_sockets, output_sockets, parameters)
+    object_code = compile_to_object(module_ir)
+
+    object_path = os.path.join(directory, name + ".o")
+    with open(object_path, "wb") as f:
+        f.write(object_code)
+
+    library_path = os.path.join(directory, name + get_library_extension())
+    if not link_shared_library(object_path, library_path):
+        library_path = None
+
+    manifest = create_manifest(tree, object_path, library_path,
+                               input_sockets, output_sockets, parameters)
+    manifest_path = os.path.join(directory, name + ".json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent = 4)
+
+    return manifest_path
+
+def generate_export_module(name, input_sockets, output_sockets, parameters):
+    module = ir.Module(name)
+
+    names = dict()
+    for i, (node, socket, global_name) in enumerate(parameters):
+        names[global_name] = get_parameter_symbol(i)
+        variable = ir.GlobalVariable(module, socket.ir_type, names[global_name])
+        variable.initializer = ir.Constant(socket.ir_type, None)
+
+    insert_batch_function(module, ENTRY_POINT_NAME, input_sockets, output_sockets,
+                          get_global_name = lambda name: names[name])
+    return module
+
+def compile_to_object(module_ir):
+    module = llvm.parse_assembly(str(module_ir))
+    module.verify()
+
+    target_machine = create_target_machine()
+    module.triple = target_machine.triple
+
+    optimize_module(module, 2, target_machine)
+
+    return target_machine.emit_object(module)
+
+def create_target_machine():
+    # exported libraries should run on any cpu with the same architecture
+    target = llvm.Target.from_default_triple()
+    return target.create_target_machine(reloc = "pic", codemodel = "default")
+
+def link_shared_library(object_path, library_path):
+    '''
+    The object file is always exported. Linking the shared library needs
+    a system compiler and is skipped when none can be found.
+    '''
+    compiler = shutil.which("cc") or shutil.which("gcc") or shutil.which("clang")
+    if compiler is None:
+        print("Cannot find a compiler to link {}".format(library_path))
+        return False
+
+    import subprocess
+    command = [compiler, "-shared", "-o", library_path, object_path, "-lm"]
+    result = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    if result.returncode != 0:
+        print("Linking {} failed:\n{}".format(library_path, result.stderr.decode()))
+        return False
+    return True
+
+def create_manifest(tree, object_path, library_path, input_sockets, output_sockets, parameters):
+    return {
+        "version" : MANIFEST_VERSION,
+        "tree" : tree.name,
+        "triple" : llvm.get_default_triple(),
+        "cpu" : "generic",
+        "object" : os.path.basename(object_path),
+        "library" : None if library_path is None else os.path.basename(library_path),
+        "entry_point" : ENTRY_POINT_NAME,
+        "inputs" : [socket_description(s) for s in input_sockets],
+        "outputs" : [socket_description(s) for s in output_sockets],
+        "parameters" : [parameter_description(i, node, socket)
+                        for i, (node, socket, global_name) in enumerate(parameters)]
+    }
+
+def is_exportable(value):
+    return hasattr(value, "bl_idname") or isinstance(value, SceneTimeValue)
+
+def socket_description(socket):
+    return {
+        "name" : socket.name,
+        "identifier" : socket.identifier,
+        "type" : c_type_names[socket.bl_idname]
+    }
+
+def parameter_description(index, node, value):
+    if isinstance(value, SceneTimeValue):
+        socket = next(s for s in node.outputs if s.identifier == value.identifier)
+        description = socket_description(socket)
+        description["value"] = value.get_value()
+    else:
+        description = socket_description(value)
+        description["value"] = get_portable_value(value)
+    description["node"] = node.name
+    description["symbol"] = get_parameter_symbol(index)
+    return description
+
+def get_portable_value(socket):
+    if socket.bl_idname == "cn_FloatSocket":
+        return socket.value
+    if socket.bl_idname == "cn_VectorSocket":
+        return list(socket.value)
+    # pointers into the current Blender session cannot be exported
+    return None
+
+def get_parameter_symbol(index):
+    return "cn_param_{}".format(index)
+
+def get_library_extension():
+    if os.name == "nt":
+        return ".dll"
+    return ".so"
+
+def validify_file_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
@@ -0,0 +1,83 @@
+'''
+Loads trees that have been exported with aot_export.
+This module must not depend on llvmlite or bpy, so that exported
+trees can be evaluated on machines without them.
+'''
+
+import os
+import json
+from ctypes import CDLL, CFUNCTYPE, POINTER, c_float, c_int, c_void_p, cast
+
+MANIFEST_VERSION = 1
+ENTRY_POINT_NAME = "cn_evaluate"
+
+c_types_by_name = {
+    "float" : c_float,
+    "float[3]" : c_float * 3,
+    "void*" : c_void_p
+}
+
+class CompiledTree:
+    def __init__(self, manifest_path):
+        with open(manifest_path) as f:
+            self.manifest = json.load(f)
+
+        if self.manifest["version"] != MANIFEST_VERSION:
+            raise Exception("unsupported manifest version")
+        if self.manifest["library"] is None:
+            raise Exception("the tree has been exported without shared library")
+
+        directory = os.path.dirname(os.path.abspath(manifest_path))
+        self.library = CDLL(os.path.join(directory, self.manifest["library"]))
+
+        self.input_types = [c_types_by_name[s["type"]] for s in self.manifest["inputs"]]
+        self.output_types = [c_types_by_name[s["type"]] for s in self.manifest["outputs"]]
+
+        address = cast(getattr(self.library, self.manifest["entry_point"]), c_void_p).value
+        array_types = [POINTER(t) for t in self.input_types + self.output_types]
+        self.function = CFUNCTYPE(None, c_int, *array_types)(address)
+
+        self.parameters = self.manifest["parameters"]
+        for index, parameter in enumerate(self.parameters):
+            if parameter["value"] is not None:
+                self.set_parameter(index, parameter["value"])
+
+    def find_parameter(self, node_name, identifier):
+        for index, parameter in enumerate(self.parameters):
+            if parameter["node"] == node_name and parameter["identifier"] == identifier:
+                return index
+        raise KeyError((node_name, identifier))
+
+    def set_parameter(self, index, value):
+        parameter = self.parameters[index]
+        c_type = c_types_by_name[parameter["type"]]
+        variable = c_type.in_dll(self.library, parameter["symbol"])
+        if isinstance(variable, c_void_p):
+            variable.value = value
+        elif isinstance(value, (int, float)):
+            variable.value = value
+        else:
+            variable[:] = value
+
+    def evaluate_batch(self, amount, *args):
+        if len(args) != len(self.input_types):
+            raise Exception("wrong argument amount")
+
+        inputs = []
+        for t, values in zip(self.input_types, args):
+            if len(values) != amount:
+                raise Exception("wrong element amount")
+            inputs.append((t * amount)(*values))
+        outputs = [(t * amount)() for t in self.output_types]
+
+        self.function(amount, *inputs, *outputs)
+        return tuple([as_python_value(v) for v in array] for array in outputs)
+
+    def __call__(self, *args):
+        results = self.evaluate_batch(1, *[[v] for v in args])
+        return tuple(values[0] for values in results)
+
+def as_python_value(cvalue):
+    if isinstance(cvalue, (int, float)) or cvalue is None:
+        return cvalue
+    return tuple(cvalue)
@@ -1,9 +1,47 @@
+from . lazy_imports import numpy
+
 class BaseSocket:
     ir_type = NotImplemented
 
+    # layout of one element in buffers that are passed to compiled code,
+    # the dtype is given by name because numpy is imported lazily
+    buffer_dtype = NotImplemented
+    buffer_shape = ()
+
     def update_at_address(self, address):
         raise NotImplementedError()
 
+    def to_register(self, builder, value):
+        return value
+
+    def from_register(self, builder, value):
+        return value
+
+    def get_property_value(self):
+        return self.value
+
+    def value_from_python(self, value):
+        return value
+
+    def create_buffer(self, amount):
+        return numpy.empty((amount, ) + self.buffer_shape, dtype = self.buffer_dtype)
+
+    def is_valid_buffer(self, buffer, amount):
+        return (isinstance(buffer, numpy.ndarray)
+            and buffer.dtype == self.buffer_dtype
+            and buffer.shape == (amount, ) + self.buffer_shape
+            and buffer.flags.c_contiguous and buffer.flags.writeable)
+
+    def buffer_from_values(self, values):
+        # arrays with the right layout are used without a copy
+        return numpy.ascontiguousarray(values, dtype = self.buffer_dtype)
+
+    def values_from_buffer(self, buffer):
+        return self.values_from_array(buffer, len(buffer))
+
+    def fill_buffer(self, buffer, array):
+        buffer[...] = array
+
     def draw(self, context, layout, node, text):
         if self.is_output or self.is_linked:
             layout.label(text)
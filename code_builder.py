@@ -0,0 +1,314 @@
+'''
+The builder that is passed to the create_llvm_ir methods of the nodes.
+Besides the normal IRBuilder functionality it knows how values are
+represented in registers for the tree that is compiled.
+
+Vectors are stored as [3 x float] at all interfaces (globals, function
+arguments and outputs). When packed vectors are enabled, they are
+represented as <4 x float> in registers instead, which allows LLVM to
+keep them in SIMD registers. The fourth lane is padding.
+'''
+
+from llvmlite import ir
+from . intrinsics import get_float_intrinsic
+
+class PackedVectorType(ir.Type):
+    def __init__(self, element, count):
+        self.element = element
+        self.count = count
+
+    def _to_string(self):
+        return "<{} x {}>".format(self.count, self.element)
+
+    def __eq__(self, other):
+        if isinstance(other, PackedVectorType):
+            return self.element == other.element and self.count == other.count
+        return False
+
+    def __hash__(self):
+        return hash((PackedVectorType, self.count))
+
+    @property
+    def intrinsic_name(self):
+        return "v{}{}".format(self.count, self.element.intrinsic_name)
+
+    def format_constant(self, value):
+        items = ", ".join("{} {}".format(self.element, self.element.format_constant(v))
+                          for v in value)
+        return "<{}>".format(items)
+
+
+class TypedOperandsInstruction(ir.instructions.Instruction):
+    def descr(self, buf):
+        operands = ", ".join("{} {}".format(op.type, op.get_reference()) for op in self.operands)
+        buf.append("{} {}\n".format(self.opname, operands))
+
+
+float_type = ir.FloatType()
+index_type = ir.IntType(32)
+array_vector_type = ir.ArrayType(float_type, 3)
+packed_vector_type = PackedVectorType(float_type, 4)
+
+class CodeBuilder(ir.IRBuilder):
+    def __init__(self, block = None, packed_vectors = False, fast_math = "NONE", branchless = False):
+        super().__init__(block)
+        self.packed_vectors = packed_vectors
+        self.branchless = branchless
+        self.fast_math = fast_math
+        self.float_flags = get_fast_math_flags(fast_math)
+        # values of globals by name, see insert_global_input_loads
+        self.global_inputs = dict()
+
+    @property
+    def vector_type(self):
+        return packed_vector_type if self.packed_vectors else array_vector_type
+
+    # Vectors
+    ##########################################
+
+    def vector_constant(self, values):
+        if self.packed_vectors:
+            return ir.Constant(packed_vector_type, list(values) + [0])
+        return ir.Constant(array_vector_type, list(values))
+
+    def combine_vector(self, x, y, z):
+        vector = ir.Constant(self.vector_type, None)
+        for i, value in enumerate((x, y, z)):
+            vector = self.insert_vector_component(vector, value, i)
+        return vector
+
+    def separate_vector(self, vector):
+        return tuple(self.extract_vector_component(vector, i) for i in range(3))
+
+    def insert_vector_component(self, vector, value, index):
+        if self.packed_vectors:
+            return self.insert_element(vector, value, index_type(index))
+        return self.insert_value(vector, value, index)
+
+    def extract_vector_component(self, vector, index):
+        if self.packed_vectors:
+            return self.extract_element(vector, index_type(index))
+        return self.extract_value(vector, index)
+
+    def vector_from_array(self, array):
+        '''Converts a [3 x float] value into the register representation.'''
+        if not self.packed_vectors:
+            return array
+        vector = ir.Constant(packed_vector_type, None)
+        for i in range(3):
+            component = self.extract_value(array, i)
+            vector = self.insert_element(vector, component, index_type(i))
+        return vector
+
+    def vector_to_array(self, vector):
+        '''Converts a vector register into the [3 x float] interface representation.'''
+        if not self.packed_vectors:
+            return vector
+        array = ir.Constant(array_vector_type, None)
+        for i in range(3):
+            component = self.extract_element(vector, index_type(i))
+            array = self.insert_value(array, component, i)
+        return array
+
+    # Conditionals
+    ##########################################
+
+    def choose(self, condition, compute_then, compute_else, name = ""):
+        '''
+        Returns the value(s) of compute_then() if the condition is true,
+        otherwise the value(s) of compute_else(). Nodes with conditional
+        results should use this instead of creating blocks themselves.
+
+        In branchless mode both sides are computed and a select picks the
+        result. This keeps the code in a single basic block, which allows
+        loops in batch kernels to be vectorized. Both sides must therefore
+        be safe to compute in any case.
+        '''
+        if self.branchless:
+            then_values = as_tuple(compute_then())
+            else_values = as_tuple(compute_else())
+            results = tuple(self.select(condition, a, b, name = name)
+                            for a, b in zip(then_values, else_values))
+        else:
+            with self.if_else(condition) as (then, otherwise):
+                with then:
+                    then_values = as_tuple(compute_then())
+                    then_block = self.block
+                with otherwise:
+                    else_values = as_tuple(compute_else())
+                    else_block = self.block
+
+            results = []
+            for a, b in zip(then_values, else_values):
+                result = self.phi(a.type, name = name)
+                result.add_incoming(a, then_block)
+                result.add_incoming(b, else_block)
+                results.append(result)
+            results = tuple(results)
+
+        return results[0] if len(results) == 1 else results
+
+    def choose_case(self, index, compute_cases, name = ""):
+        '''
+        Returns the value(s) of compute_cases[index](). Every case is
+        computed in its own block, an index out of range picks the first.
+        This is also used in branchless mode, because the cases can be
+        expensive and the index is usually the same for all elements.
+        '''
+        case_blocks = [self.append_basic_block("case") for _ in compute_cases]
+        exit_block = self.append_basic_block("after_cases")
+        switch = self.switch(index, case_blocks[0])
+        for i, block in enumerate(case_blocks[1:], 1):
+            switch.add_case(i, block)
+
+        incoming = []
+        for compute_case, block in zip(compute_cases, case_blocks):
+            self.position_at_end(block)
+            values = as_tuple(compute_case())
+            incoming.append((values, self.block))
+            self.branch(exit_block)
+
+        self.position_at_end(exit_block)
+        results = []
+        for i, value in enumerate(incoming[0][0]):
+            result = self.phi(value.type, name = name)
+            for values, block in incoming:
+                result.add_incoming(values[i], block)
+            results.append(result)
+
+        return results[0] if len(results) == 1 else tuple(results)
+
+    # Float arithmetic
+    ##########################################
+
+    def fadd(self, lhs, rhs, name = "", flags = ()):
+        return super().fadd(lhs, rhs, name, flags or self.float_flags)
+
+    def fsub(self, lhs, rhs, name = "", flags = ()):
+        return super().fsub(lhs, rhs, name, flags or self.float_flags)
+
+    def fmul(self, lhs, rhs, name = "", flags = ()):
+        return super().fmul(lhs, rhs, name, flags or self.float_flags)
+
+    def fdiv(self, lhs, rhs, name = "", flags = ()):
+        return super().fdiv(lhs, rhs, name, flags or self.float_flags)
+
+    def frem(self, lhs, rhs, name = "", flags = ()):
+        return super().frem(lhs, rhs, name, flags or self.float_flags)
+
+    def multiply_add(self, a, b, c):
+        # llvm.fma is always fused, llvm.fmuladd lets the backend decide
+        if self.fast_math == "NONE":
+            return self.call_intrinsic("llvm.fma", [a, b, c])
+        return self.call_intrinsic("llvm.fmuladd", [a, b, c])
+
+    # Intrinsics
+    ##########################################
+
+    def call_intrinsic(self, name, args):
+        '''
+        Calls a float intrinsic like "llvm.sqrt". The overload is chosen
+        based on the type of the first argument, so this works for floats
+        and packed vectors.
+        '''
+        function = get_float_intrinsic(self.module, name, args[0].type)
+        fastmath = ("fast", ) if self.fast_math == "FULL" else ()
+        return self.call(function, args, fastmath = fastmath)
+
+    # Vector math
+    ##########################################
+
+    def vector_add(self, a, b):
+        return self._vector_binop(self.fadd, a, b)
+
+    def vector_sub(self, a, b):
+        return self._vector_binop(self.fsub, a, b)
+
+    def vector_mul(self, a, b):
+        return self._vector_binop(self.fmul, a, b)
+
+    def vector_scale(self, vector, factor):
+        return self.vector_mul(vector, self.vector_splat(factor))
+
+    def vector_splat(self, value):
+        if self.packed_vectors:
+            vector = self.insert_element(ir.Constant(packed_vector_type, None), value, index_type(0))
+            return self.shuffle_vector(vector, vector, [0, 0, 0, 0])
+        return self.combine_vector(value, value, value)
+
+    def vector_dot(self, a, b):
+        x, y, z = self.separate_vector(self.vector_mul(a, b))
+        return self.fadd(self.fadd(x, y), z)
+
+    def vector_cross(self, a, b):
+        if self.packed_vectors:
+            yzx, zxy = [1, 2, 0, 3], [2, 0, 1, 3]
+            left = self.fmul(self.shuffle_vector(a, a, yzx), self.shuffle_vector(b, b, zxy))
+            right = self.fmul(self.shuffle_vector(a, a, zxy), self.shuffle_vector(b, b, yzx))
+            return self.fsub(left, right)
+
+        ax, ay, az = self.separate_vector(a)
+        bx, by, bz = self.separate_vector(b)
+        x = self.fsub(self.fmul(ay, bz), self.fmul(az, by))
+        y = self.fsub(self.fmul(az, bx), self.fmul(ax, bz))
+        z = self.fsub(self.fmul(ax, by), self.fmul(ay, bx))
+        return self.combine_vector(x, y, z)
+
+    def _vector_binop(self, operation, a, b):
+        if self.packed_vectors:
+            return operation(a, b)
+        components = [operation(ca, cb) for ca, cb in zip(self.separate_vector(a), self.separate_vector(b))]
+        return self.combine_vector(*components)
+
+    # Vector instructions
+    ##########################################
+
+    def insert_element(self, vector, value, index, name = ""):
+        instr = TypedOperandsInstruction(self.block, vector.type, "insertelement",
+                                         [vector, value, index], name = name)
+        self._insert(instr)
+        return instr
+
+    def extract_element(self, vector, index, name = ""):
+        instr = TypedOperandsInstruction(self.block, vector.type.element, "extractelement",
+                                         [vector, index], name = name)
+        self._insert(instr)
+        return instr
+
+    def shuffle_vector(self, vector1, vector2, mask, name = ""):
+        mask_type = PackedVectorType(index_type, len(mask))
+        mask = ir.Constant(mask_type, list(mask))
+        result_type = PackedVectorType(vector1.type.element, len(mask.constant))
+        instr = TypedOperandsInstruction(self.block, result_type, "shufflevector",
+                                         [vector1, vector2, mask], name = name)
+        self._insert(instr)
+        return instr
+
+
+def create_builder(block, tree, branchless = False):
+    return CodeBuilder(block,
+        packed_vectors = tree.vector_mode == "SIMD",
+        fast_math = tree.fast_math,
+        branchless = branchless)
+
+def as_tuple(values):
+    return values if isinstance(values, tuple) else (values, )
+
+def get_fast_math_flags(policy):
+    '''
+    NONE:     strict IEEE semantics
+    CONTRACT: allow fusing multiplications and additions
+    FULL:     allow all optimizations including reassociation
+
+    The "contract" flag only exists since LLVM 5. With older versions
+    CONTRACT only affects the Multiply Add operation.
+    '''
+    if policy == "FULL":
+        return ("fast", )
+    if policy == "CONTRACT" and supports_contract_flag():
+        return ("contract", )
+    return ()
+
+def supports_contract_flag():
+    import llvmlite.binding as llvm
+    return llvm.llvm_version_info >= (5, 0)
@@ -1,5 +1,5 @@
 import bpy
-from llvmlite import ir
+from . lazy_imports import numpy
 from . compute_node import ComputeNode
 
 class CombineVectorNode(bpy.types.Node, ComputeNode):
@@ -13,9 +13,11 @@ class CombineVectorNode(bpy.types.Node, ComputeNode):
         self.outputs.new("cn_VectorSocket", "Vector", "vector")
 
     def create_llvm_ir(self, builder, x, y, z):
-        vector_p = builder.alloca(self.outputs[0].ir_type)
-        vector = builder.load(vector_p)
-        vector = builder.insert_value(vector, x, 0)
-        vector = builder.insert_value(vector, y, 1)
-        vector = builder.insert_value(vector, z, 2)
+        vector = builder.combine_vector(x, y, z)
         return builder, vector
+
+    def create_python_code(self, x, y, z):
+        return ("({}, {}, {})".format(x, y, z), )
+
+    def execute_numpy(self, x, y, z):
+        return (numpy.stack(numpy.broadcast_arrays(x, y, z), axis = -1), )
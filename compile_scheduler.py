@@ -0,0 +1,186 @@
+'''
+Editing a tree invalidates its compiled code many times in quick
+succession, e.g. while a link is dragged. Instead of compiling every
+intermediate version, invalidations are coalesced:
+    - every invalidation increments the version of the tree
+    - the tree is compiled in a worker process once it has not been
+      changed for `delay` seconds
+    - a newer invalidation cancels the compilation of older versions,
+      a worker that has not started yet does not start at all
+    - the object code of obsolete versions is never stored
+Until the code is ready, scene updates and drivers evaluate the tree
+with the NumPy backend, which does not need any compilation. All other
+callers wait for the code (see ComputeNodeTree.get_execution_data).
+The finished object code ends up in the object cache, so creating the
+execution data afterwards only has to load it.
+'''
+
+import os
+import bpy
+import time
+from bpy.props import *
+from collections import defaultdict
+from . utils.nodes import iter_compute_node_trees
+from . object_cache import store_object_code
+from . warm_up import TreeSnapshot, compile_in_worker
+
+DEFAULT_DELAY = 0.25
+
+class CompileJob:
+    def __init__(self, tree_hash, version, snapshot):
+        self.tree_hash = tree_hash
+        self.version = version
+        self.modules = snapshot.modules
+        self.cancelled = False
+        self.process = None
+        self.future = None
+
+    def run(self, versions):
+        # runs in another thread, the versions are only read
+        if self.cancelled or versions.get(self.tree_hash) != self.version:
+            return None
+        return compile_in_worker(self.modules, started = self.set_process)
+
+    def set_process(self, process):
+        self.process = process
+        # the job might have been cancelled before the process existed
+        if self.cancelled:
+            process.kill()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+        if self.process is not None:
+            self.process.kill()
+
+
+class RecompileScheduler:
+    def __init__(self):
+        self.enabled = False
+        self.delay = DEFAULT_DELAY
+        self.versions = defaultdict(int)
+        self.changed_at = dict()
+        self.jobs = dict()
+        self.executor = None
+        self.statistics = defaultdict(int)
+
+    def invalidate(self, tree):
+        tree_hash = hash(tree)
+        self.versions[tree_hash] += 1
+        self.statistics["invalidations"] += 1
+        self.cancel(tree_hash)
+        if self.enabled and tree.backend in ("LLVM", "AUTO"):
+            self.changed_at[tree_hash] = time.perf_counter()
+
+    def cancel(self, tree_hash):
+        self.changed_at.pop(tree_hash, None)
+        job = self.jobs.pop(tree_hash, None)
+        if job is not None:
+            job.cancel()
+            self.statistics["cancelled"] += 1
+
+    def is_pending(self, tree):
+        tree_hash = hash(tree)
+        return tree_hash in self.changed_at or tree_hash in self.jobs
+
+    def process(self, enabled = True, delay = DEFAULT_DELAY):
+        '''Has to be called regularly from the main thread, e.g. on every scene update.'''
+        self.enabled = enabled
+        self.delay = delay
+        trees_by_hash = {hash(tree) : tree for tree in iter_compute_node_trees()}
+
+        for tree_hash in set(self.changed_at) | set(self.jobs):
+            if tree_hash not in trees_by_hash or not enabled:
+                self.cancel(tree_hash)
+
+        self.collect_finished_jobs(trees_by_hash)
+        self.start_jobs(trees_by_hash)
+
+    def collect_finished_jobs(self, trees_by_hash):
+        for tree_hash, job in list(self.jobs.items()):
+            if not job.future.done():
+                continue
+            del self.jobs[tree_hash]
+
+            try: objects = job.future.result()
+            except Exception as e:
+                # the code is compiled again when the tree is evaluated, which reports the error
+                print("Compute Nodes: cannot compile '{}' in the background: {}".format(
+                    trees_by_hash[tree_hash].name, e))
+                continue
+
+            if objects is None or job.version != self.versions[tree_hash]:
+                self.statistics["obsolete"] += 1
+                continue
+
+            for (module_name, key, _, _), object_code in zip(job.modules, objects):
+                store_object_code(trees_by_hash[tree_hash], module_name, key, object_code)
+            self.statistics["compiled"] += 1
+
+    def start_jobs(self, trees_by_hash):
+        now = time.perf_counter()
+        for tree_hash, changed_at in list(self.changed_at.items()):
+            if now - changed_at < self.delay:
+                continue
+            del self.changed_at[tree_hash]
+
+            tree = trees_by_hash[tree_hash]
+            try: snapshot = TreeSnapshot(tree)
+            except Exception:
+                continue
+            if len(snapshot.modules) == 0:
+                continue
+
+            job = CompileJob(tree_hash, self.versions[tree_hash], snapshot)
+            job.future = self.get_executor().submit(job.run, self.versions)
+            self.jobs[tree_hash] = job
+            self.statistics["started"] += 1
+
+    def get_executor(self):
+        if self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(os.cpu_count())
+        return self.executor
+
+    def finish(self, tree):
+        '''
+        Waits for the running job of the tree and collects it. A job that
+        has not started yet is cancelled, so that the caller can compile
+        the tree right away.
+        '''
+        tree_hash = hash(tree)
+        self.changed_at.pop(tree_hash, None)
+        job = self.jobs.get(tree_hash)
+        if job is not None:
+            try: job.future.result()
+            except Exception: pass
+            self.collect_finished_jobs({hash(tree) : tree for tree in iter_compute_node_trees()})
+
+    def wait(self):
+        '''Blocks until all started jobs are finished and collects them.'''
+        for job in list(self.jobs.values()):
+            try: job.future.result()
+            except Exception: pass
+        self.collect_finished_jobs({hash(tree) : tree for tree in iter_compute_node_trees()})
+
+    def get_statistics(self):
+        return dict(self.statistics, pending = len(self.changed_at), running = len(self.jobs))
+
+
+recompile_scheduler = RecompileScheduler()
+
+def process_scheduled_compiles(scene):
+    recompile_scheduler.process(
+        enabled = scene.compute_nodes_deferred_compile,
+        delay = scene.compute_nodes_compile_delay)
+
+def register():
+    bpy.types.Scene.compute_nodes_deferred_compile = BoolProperty(name = "Deferred Compile", default = True,
+        description = "Compile edited trees in the background once they have not been changed for a moment")
+    bpy.types.Scene.compute_nodes_compile_delay = FloatProperty(name = "Compile Delay", default = DEFAULT_DELAY,
+        min = 0, description = "Seconds without changes before an edited tree is compiled")
+
+def unregister():
+    del bpy.types.Scene.compute_nodes_deferred_compile
+    del bpy.types.Scene.compute_nodes_compile_delay
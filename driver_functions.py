@@ -0,0 +1,188 @@
+'''
+Trees can replace Python expressions in drivers. Every tree with
+"Driver Function" enabled is a function in bpy.app.driver_namespace,
+named like the tree with all characters that are not allowed in Python
+names replaced by "_". A driver with the expression
+    wiggle(frame, var)
+evaluates the tree "wiggle" and returns the value of its first output.
+Trees whose names lead to the same function name, or to a name that
+is used by drivers already (like "frame" or "sin"), are not available
+and a message is printed.
+
+Trees that can be compiled with LLVM (also with the Auto backend) and
+have only float inputs and a float as first output use the packed
+argument function of TreeExecutionData. A call then only copies the
+arguments into one array and calls the machine code. The socket values
+are uploaded on scene updates when they have changed, and only trees
+with a Frame Input node upload them on every call. All other trees are
+evaluated with the function of their backend.
+'''
+
+import re
+import bpy
+import keyword
+from collections import defaultdict
+from bpy.app.handlers import load_post, persistent
+from . tree_info import get_tree_info, get_nodes_by_type, update_if_necessary
+from . tree_call_node import iter_called_trees
+from . compile_scheduler import recompile_scheduler
+from . utils.nodes import iter_compute_node_trees
+
+# name in the driver namespace -> DriverFunction
+driver_functions = dict()
+
+# names of the variables that drivers provide besides the namespace
+reserved_names = {"frame", "self"}
+
+# conflicts that have been reported already
+_reported_conflicts = set()
+
+class DriverFunction:
+    def __init__(self, tree):
+        self.tree = tree
+        self.infos = None
+        self.is_pending = False
+        self.function = None
+        self.execution_data = None
+        self.is_packed = False
+        self.uploaded_versions = None
+
+    def __call__(self, *args):
+        # the execution data is disposed when the tree changes or the cache limits are enforced
+        if self.function is None or is_disposed(self.execution_data):
+            self.create_function()
+        return self.function(*args)
+
+    def update(self, tree):
+        '''
+        The function is created again when the tree or one of the trees
+        it calls has changed, otherwise changed socket values are uploaded.
+        '''
+        infos = get_tree_infos(tree)
+        is_pending = recompile_scheduler.is_pending(tree)
+        if tree != self.tree or infos != self.infos or is_pending != self.is_pending:
+            self.tree = tree
+            self.infos = infos
+            self.is_pending = is_pending
+            self.function = None
+            self.execution_data = None
+        elif self.is_packed and not is_disposed(self.execution_data):
+            self.upload_changed_values()
+
+    def create_function(self):
+        tree = self.tree
+        self.function = None
+        self.is_packed = False
+        if tree.backend in ("LLVM", "AUTO") and not recompile_scheduler.is_pending(tree):
+            execution_data = tree.get_llvm_execution_data()
+            if execution_data.supports_packed_arguments():
+                self.execution_data = execution_data
+                self.is_packed = True
+                self.function = self.create_packed_function()
+
+        if self.function is None:
+            self.execution_data = tree.get_execution_data(interim = True)
+            function = self.execution_data.get_function()
+            self.function = lambda *args: function(*args)[0]
+
+    def create_packed_function(self):
+        function = self.execution_data.get_packed_function()
+        self.uploaded_versions = None
+        self.upload_changed_values()
+        if not reads_frame(self.tree):
+            return function
+
+        update_globals = self.execution_data.update_globals
+        def pywrapper(*args):
+            update_globals()
+            return function(*args)
+        return pywrapper
+
+    def upload_changed_values(self):
+        versions = [info.values_version for info in get_tree_infos(self.tree)]
+        if versions != self.uploaded_versions:
+            self.execution_data.update_globals()
+            self.uploaded_versions = versions
+
+
+def is_disposed(execution_data):
+    return execution_data is None or getattr(execution_data, "disposed", False)
+
+def get_tree_infos(tree):
+    trees = [tree] + sorted(iter_called_trees(tree), key = lambda t: t.name)
+    return tuple(get_tree_info(t) for t in trees)
+
+def reads_frame(tree):
+    return any(len(get_nodes_by_type(t, "cn_FrameInputNode")) > 0
+               for t in [tree] + list(iter_called_trees(tree)))
+
+def get_driver_function_name(tree):
+    name = re.sub(r"\W", "_", tree.name)
+    return "_" + name if name[:1].isdigit() else name
+
+
+def update_driver_functions():
+    '''Has to be called after the tree infos are updated.'''
+    namespace = bpy.app.driver_namespace
+    trees_by_name = get_driver_trees_by_name(namespace)
+
+    for name in list(driver_functions):
+        if name not in trees_by_name:
+            if namespace.get(name) is driver_functions[name]:
+                del namespace[name]
+            del driver_functions[name]
+
+    for name, tree in trees_by_name.items():
+        if name not in driver_functions:
+            driver_functions[name] = DriverFunction(tree)
+        driver_functions[name].update(tree)
+        namespace[name] = driver_functions[name]
+
+def get_driver_trees_by_name(namespace):
+    '''Trees with conflicting names are left out, every conflict is reported once.'''
+    trees_by_name = defaultdict(list)
+    for tree in iter_compute_node_trees():
+        if tree.driver_function:
+            trees_by_name[get_driver_function_name(tree)].append(tree)
+
+    conflicts = set()
+    available_trees = dict()
+    for name, trees in trees_by_name.items():
+        if len(trees) > 1:
+            conflicts.add("the trees {} have the same driver function name '{}' and are not available in drivers".format(
+                ", ".join(sorted("'{}'".format(tree.name) for tree in trees)), name))
+        elif is_used_name(namespace, name):
+            conflicts.add("the driver function name '{}' of the tree '{}' is used already, the tree is not available in drivers".format(
+                name, trees[0].name))
+        else:
+            available_trees[name] = trees[0]
+
+    for conflict in sorted(conflicts - _reported_conflicts):
+        print("Compute Nodes: {}".format(conflict))
+    _reported_conflicts.clear()
+    _reported_conflicts.update(conflicts)
+    return available_trees
+
+def is_used_name(namespace, name):
+    return (name in reserved_names or keyword.iskeyword(name) or
+            (name in namespace and not isinstance(namespace[name], DriverFunction)))
+
+def remove_driver_functions():
+    for name, function in driver_functions.items():
+        if bpy.app.driver_namespace.get(name) is function:
+            del bpy.app.driver_namespace[name]
+    driver_functions.clear()
+
+@persistent
+def update_driver_functions_after_load(dummy):
+    # the functions of the previous file refer to trees that do not exist anymore
+    remove_driver_functions()
+    update_if_necessary()
+    update_driver_functions()
+
+def register():
+    load_post.append(update_driver_functions_after_load)
+
+def unregister():
+    load_post.remove(update_driver_functions_after_load)
+    remove_driver_functions()
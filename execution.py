@@ -1,9 +1,16 @@
+import os
 import itertools
 from llvmlite import ir
-import llvmlite.binding as llvm
+from . lazy_imports import llvm
 from . utils.timing import measureTime
 from . utils.nodes import iter_base_nodes_in_tree, iter_compute_node_trees
-from . tree_info import iter_unlinked_inputs, get_data_origin_socket, get_nodes_by_type, get_node_by_socket, iter_all_unlinked_inputs
+from . object_cache import TreeObjectCache, get_module_key, load_object_code
+from . code_builder import create_builder
+from . uniformity import find_varying_sockets, find_uniform_sockets_to_hoist
+from . utils.compile_worker import create_target_machine, optimize_module
+from . node_parameters import iter_parameter_globals
+from . frame_range import get_frame_input_sockets, create_frame_range_wrapper
+from . tree_info import get_runtime_parameter_nodes, iter_unlinked_inputs, get_data_origin_socket, get_nodes_by_type, get_node_by_socket, iter_all_unlinked_inputs, get_nodes_to_calculate, is_read_input
 from pprint import pprint
 
 class TreeExecutionData:
@@ -19,82 +26,169 @@ class TreeExecutionData:
         self._create_globals_module()
 
         self.py_function = None
+        self.py_batch_function = None
+        self.py_vertex_function = None
+        self.py_frame_range_function = None
+        self.py_packed_function = None
+        self.global_addresses = None
         self.compute_module = None
+        self.batch_module = None
+        self.vertex_module = None
+        self.frame_range_module = None
+        self.packed_module = None
+        self.call_module = None
+        self.disposed = False
 
     def _find_interface_nodes(self):
-        inputs = get_nodes_by_type(self.tree, "cn_InputNode")
-        outputs = get_nodes_by_type(self.tree, "cn_OutputNode")
-
-        if len(inputs) > 1 or len(outputs) != 1:
-            raise Exception("a tree must have at most one input and exactly one output node")
-
-        self.input_node = None if len(inputs) == 0 else inputs[0]
-        self.output_node = outputs[0]
+        self.input_node, self.output_node, self.vertex_input_node = find_interface_nodes(self.tree)
 
     def _create_target_and_engine(self):
         empty_module = llvm.parse_assembly("")
-        llvm_target = llvm.Target.from_default_triple()
-        self.target_machine = llvm_target.create_target_machine()
+        self.target_machine = create_target_machine()
         self.engine = llvm.create_mcjit_compiler(empty_module, self.target_machine)
+        self.object_cache = TreeObjectCache(self.tree)
+        self.engine.set_object_cache(self.object_cache.notify, self.object_cache.get_buffer)
 
     def _create_globals_module(self):
-        module_ir = self._generate_globals_module()
-        self.globals_module = self._compile_ir_module(module_ir)
+        module_ir = generate_globals_module(self.tree)
+        self.globals_module = self._compile_ir_module(module_ir, GLOBALS_OPT_LEVEL)
+
+    def _compile_ir_module(self, ir_module, opt_level = 0):
+        ir_text = str(ir_module)
+        key = get_module_key(ir_text, opt_level)
+        self.object_cache.register_module(ir_module.name, key)
 
-    def _compile_ir_module(self, ir_module):
-        module = llvm.parse_assembly(str(ir_module))
+        module = llvm.parse_assembly(ir_text)
         module.name = ir_module.name
         module.verify()
+
+        # optimize before the engine generates machine code for the module,
+        # cached object code is used by the engine without looking at the module
+        if load_object_code(self.tree, ir_module.name, key) is None:
+            optimize_module(module, opt_level, self.target_machine)
+
         self.engine.add_module(module)
         self.engine.finalize_object()
 
-        pmb = llvm.PassManagerBuilder()
-        pmb.opt_level = 0
-        pm = llvm.ModulePassManager()
-        pmb.populate(pm)
-        #pm.add_dead_code_elimination_pass()
-        pm.run(module)
-
         return module
 
-    def _generate_globals_module(self):
-        module_ir = ir.Module("Globals")
-        for node, socket in iter_all_unlinked_inputs(self.tree):
-            name = get_global_input_name(node, socket)
-            variable = ir.GlobalVariable(module_ir, socket.ir_type, name)
-            variable.linkage = "internal"
-        return module_ir
-
     def get_function(self):
         if self.py_function is None:
             self.ensure_compute_module()
             address = self.engine.get_function_address("Main")
 
-            from ctypes import CFUNCTYPE, POINTER, pointer
+            from ctypes import CFUNCTYPE, c_void_p
             output_sockets = self.get_all_output_sockets()
             input_types = [s.c_type for s in self.get_all_input_sockets()]
-            output_types = [s.c_type for s in output_sockets]
-            output_pointer_types = [POINTER(t) for t in output_types]
 
-            func_type = CFUNCTYPE(None, *(input_types + output_pointer_types))
+            func_type = CFUNCTYPE(None, *input_types, *[c_void_p] * len(output_sockets))
             function = func_type(address)
-
-            def pywrapper(*args):
+            output_buffers = OutputBuffers(output_sockets, single = True)
+
+            def pywrapper(*args, out = None, view = False):
+                """
+                out: one array per output socket with the shape of a single value
+                view: return views onto persistent output buffers,
+                      which are overwritten by the next call
+                """
                 if len(args) != len(input_types):
                     raise Exception("wrong argument amount")
 
-                inputs = [t(v) for t, v in zip(input_types, args)]
-                outputs = [t() for t in output_types]
-                output_refs = [pointer(v) for v in outputs]
+                outputs, addresses = output_buffers.get(1, out)
                 self.update_globals()
-                function(*args, *output_refs)
-                results = tuple(s.value_from_cvalue(v) for v, s in zip(outputs, output_sockets))
-                return results
+                function(*args, *addresses)
+                if out is not None or view:
+                    return outputs
+                return tuple(s.values_from_buffer(b.reshape((1, ) + b.shape))[0]
+                             for s, b in zip(output_sockets, outputs))
 
             self.py_function = pywrapper
 
         return self.py_function
 
+    def get_packed_function(self):
+        '''
+        Fast path for trees with only float inputs and a float as first output:
+            pywrapper(*args) -> value of the first output
+        The arguments are copied into one persistent array, the native
+        function gets its address and returns the value directly.
+        The globals are not uploaded, update_globals has to be called
+        whenever the socket values have changed.
+        '''
+        if self.py_packed_function is None:
+            if not self.supports_packed_arguments():
+                raise Exception("packed arguments need float inputs and a float as first output")
+            self.ensure_packed_module()
+            address = self.engine.get_function_address("MainPacked")
+
+            from ctypes import CFUNCTYPE, c_float, c_void_p, addressof
+            amount = len(self.get_all_input_sockets())
+            function = CFUNCTYPE(c_float, c_void_p)(address)
+            arguments = (c_float * max(amount, 1))()
+            arguments_address = addressof(arguments)
+
+            def pywrapper(*args):
+                if len(args) != amount:
+                    raise Exception("wrong argument amount")
+                arguments[:amount] = args
+                return function(arguments_address)
+
+            self.py_packed_function = pywrapper
+
+        return self.py_packed_function
+
+    def supports_packed_arguments(self):
+        return supports_packed_arguments(self.get_all_input_sockets(), self.get_all_output_sockets())
+
+    def get_batch_function(self):
+        if self.py_batch_function is None:
+            self.ensure_batch_module()
+            self.py_batch_function = self.create_batch_wrapper("MainBatch", self.get_all_input_sockets())
+        return self.py_batch_function
+
+    def get_frame_range_function(self):
+        if self.py_frame_range_function is None:
+            self.ensure_frame_range_module()
+            input_sockets = self.get_all_input_sockets() + get_frame_input_sockets(self.tree)
+            batch_function = self.create_batch_wrapper("FrameRangeBatch", input_sockets)
+            self.py_frame_range_function = create_frame_range_wrapper(self.tree, batch_function)
+        return self.py_frame_range_function
+
+    def create_batch_wrapper(self, function_name, input_sockets):
+        address = self.engine.get_function_address(function_name)
+
+        from ctypes import CFUNCTYPE, c_void_p, c_int
+        output_sockets = self.get_all_output_sockets()
+
+        func_type = CFUNCTYPE(None, c_int, *[c_void_p] * (len(input_sockets) + len(output_sockets)))
+        function = func_type(address)
+        output_buffers = OutputBuffers(output_sockets)
+
+        def pywrapper(amount, *args, out = None, view = False):
+            """
+            Every argument is a sequence with one value per element.
+            NumPy arrays with the buffer layout of the socket are not copied.
+            Returns one list with `amount` values per output socket.
+            out: one array per output socket, the results are written into them
+            view: return NumPy views onto persistent output buffers,
+                  which are overwritten by the next call
+            """
+            if len(args) != len(input_sockets):
+                raise Exception("wrong argument amount")
+
+            inputs = [s.buffer_from_values(values) for s, values in zip(input_sockets, args)]
+            if any(len(buffer) != amount for buffer in inputs):
+                raise Exception("wrong element amount")
+
+            outputs, addresses = output_buffers.get(amount, out)
+            self.update_globals()
+            function(amount, *[buffer.ctypes.data for buffer in inputs], *addresses)
+            if out is not None or view:
+                return outputs
+            return tuple(s.values_from_buffer(b) for s, b in zip(output_sockets, outputs))
+
+        return pywrapper
+
 
     def ensure_compute_module(self):
         if self.compute_module is None:
@@ -102,6 +196,72 @@ class TreeExecutionData:
             module = self.create_partial_compute_module([True] * output_amount)
             self.compute_module = module
 
+    def get_vertex_function(self):
+        if self.py_vertex_function is None:
+            self.ensure_vertex_module()
+            address = self.engine.get_function_address("VertexBatch")
+
+            from ctypes import CFUNCTYPE, c_int, c_void_p
+            func_type = CFUNCTYPE(None, c_int, c_void_p, c_void_p)
+            function = func_type(address)
+            vector_size = 3 * 4
+
+            def call_chunk(chunk, positions_address, results_address):
+                start, end = chunk
+                function(end - start,
+                         positions_address + start * vector_size,
+                         results_address + start * vector_size)
+
+            def pywrapper(amount, positions_address, results_address, threads = None):
+                """
+                The addresses point to contiguous arrays of `amount` float triples.
+                ctypes releases the GIL during the call, so the chunks run in parallel.
+                """
+                self.update_globals()
+                chunks = list(split_range(amount, threads or os.cpu_count()))
+                if len(chunks) == 1:
+                    call_chunk(chunks[0], positions_address, results_address)
+                else:
+                    pool = get_thread_pool()
+                    for _ in pool.map(call_chunk, chunks,
+                                      itertools.repeat(positions_address),
+                                      itertools.repeat(results_address)):
+                        pass
+
+            self.py_vertex_function = pywrapper
+
+        return self.py_vertex_function
+
+    def ensure_batch_module(self):
+        if self.batch_module is None:
+            used_inputs = self.get_all_input_sockets()
+            used_outputs = self.get_all_output_sockets()
+            module_ir = generate_batch_module("batch module", "MainBatch", used_inputs, used_outputs)
+            self.batch_module = self._compile_ir_module(module_ir, BATCH_OPT_LEVEL)
+
+    def ensure_frame_range_module(self):
+        if self.frame_range_module is None:
+            used_inputs = self.get_all_input_sockets() + get_frame_input_sockets(self.tree)
+            used_outputs = self.get_all_output_sockets()
+            module_ir = generate_batch_module("frame range module", "FrameRangeBatch", used_inputs, used_outputs)
+            self.frame_range_module = self._compile_ir_module(module_ir, BATCH_OPT_LEVEL)
+
+    def ensure_packed_module(self):
+        if self.packed_module is None:
+            used_inputs = self.get_all_input_sockets()
+            used_output = self.get_all_output_sockets()[0]
+            module_ir = generate_packed_module("packed module", "MainPacked", used_inputs, used_output)
+            self.packed_module = self._compile_ir_module(module_ir, PACKED_OPT_LEVEL)
+
+    def ensure_vertex_module(self):
+        if self.vertex_module is None:
+            if self.vertex_input_node is None:
+                raise Exception("the tree has no vertex input node")
+            used_inputs = list(self.vertex_input_node.outputs)
+            used_outputs = [self.get_vertex_output_socket()]
+            module_ir = generate_batch_module("vertex module", "VertexBatch", used_inputs, used_outputs)
+            self.vertex_module = self._compile_ir_module(module_ir, BATCH_OPT_LEVEL)
+
     def create_partial_compute_module(self, output_mask):
         output_mask = tuple(output_mask)
 
@@ -113,10 +273,10 @@ class TreeExecutionData:
 
         used_outputs = list(itertools.compress(all_outputs, output_mask))
 
-        module_name = "module {}".format(output_mask)
+        module_name = get_partial_module_name(output_mask)
         function_name = "Main"
         module_ir = generate_compute_module(module_name, function_name, used_inputs, used_outputs)
-        module = self._compile_ir_module(module_ir)
+        module = self._compile_ir_module(module_ir, COMPUTE_OPT_LEVEL)
 
         return module
 
@@ -126,11 +286,48 @@ class TreeExecutionData:
     def get_all_output_sockets(self):
         return list(self.output_node.inputs)
 
+    def get_vertex_output_socket(self):
+        for socket in self.output_node.inputs:
+            if socket.bl_idname == "cn_VectorSocket":
+                return socket
+        raise Exception("the output node has no vector socket for the new vertex positions")
+
     def update_globals(self):
-        for node, socket in iter_all_unlinked_inputs(self.tree):
-            name = get_global_input_name(node, socket)
-            address = self.engine.get_global_value_address(name)
-            socket.update_at_address(address)
+        '''Uploads the socket values captured by the last tree info update.'''
+        if self.disposed:
+            raise Exception("the compiled code of '{}' has been disposed".format(self.tree.name))
+        if self.global_addresses is None:
+            self.global_addresses = [
+                (value, self.engine.get_global_value_address(name))
+                for node, value, name in iter_global_inputs(self.tree)]
+
+        for value, address in self.global_addresses:
+            value.update_at_address(address)
+
+    def get_call_address(self):
+        '''Address of the function that is called by trees that call this tree.'''
+        if self.call_module is None:
+            module_ir = generate_compute_module("call module", "Call",
+                self.get_all_input_sockets(), self.get_all_output_sockets())
+            self.call_module = self._compile_ir_module(module_ir, CALL_OPT_LEVEL)
+        return self.engine.get_function_address("Call")
+
+    def dispose(self):
+        '''Frees the engine with all modules, the functions cannot be called afterwards.'''
+        if not self.disposed:
+            self.disposed = True
+            self.engine.close()
+            self.py_function = None
+            self.py_batch_function = None
+            self.py_vertex_function = None
+            self.py_frame_range_function = None
+            self.py_packed_function = None
+
+    def get_statistics(self):
+        return {
+            "engines" : 0 if self.disposed else 1,
+            "code_bytes" : 0 if self.disposed else self.object_cache.get_code_size()
+        }
 
     def print_modules(self):
         print(self.globals_module)
@@ -140,10 +337,121 @@ class TreeExecutionData:
         print(self.target_machine.emit_assembly(self.compute_module))
 
 
-def generate_compute_module(module_name, function_name, input_sockets, output_sockets):
-    assert len(output_sockets) > 0
+GLOBALS_OPT_LEVEL = 0
+COMPUTE_OPT_LEVEL = 0
+BATCH_OPT_LEVEL = 2
+CALL_OPT_LEVEL = 2
+PACKED_OPT_LEVEL = 2
+
+def generate_warm_up_modules(tree):
+    '''
+    Returns (module_ir, opt_level) pairs for the modules that are compiled
+    when the tree is evaluated for the first time. Besides the globals,
+    compute and batch modules these are the modules for the ways the
+    tree is used:
+        - vertex module: trees with a Vertex Input node
+        - frame range module: trees with Frame Input nodes
+        - packed module: driver functions
+        - call module: trees that are called and not inlined by other trees
+    They have to match the modules created by TreeExecutionData exactly.
+    '''
+    from . tree_call_node import is_called_without_inlining
+
+    input_node, output_node, vertex_input_node = find_interface_nodes(tree)
+    used_inputs = list(getattr(input_node, "outputs", []))
+    used_outputs = list(output_node.inputs)
+    module_name = get_partial_module_name([True] * len(used_outputs))
 
+    modules = [
+        (generate_globals_module(tree), GLOBALS_OPT_LEVEL),
+        (generate_compute_module(module_name, "Main", used_inputs, used_outputs), COMPUTE_OPT_LEVEL),
+        (generate_batch_module("batch module", "MainBatch", used_inputs, used_outputs), BATCH_OPT_LEVEL)
+    ]
+
+    vertex_outputs = [s for s in used_outputs if s.bl_idname == "cn_VectorSocket"]
+    if vertex_input_node is not None and len(vertex_outputs) > 0:
+        modules.append((generate_batch_module("vertex module", "VertexBatch",
+            list(vertex_input_node.outputs), vertex_outputs[:1]), BATCH_OPT_LEVEL))
+
+    frame_inputs = get_frame_input_sockets(tree)
+    if len(frame_inputs) > 0:
+        modules.append((generate_batch_module("frame range module", "FrameRangeBatch",
+            used_inputs + frame_inputs, used_outputs), BATCH_OPT_LEVEL))
+
+    if tree.driver_function and supports_packed_arguments(used_inputs, used_outputs):
+        modules.append((generate_packed_module("packed module", "MainPacked",
+            used_inputs, used_outputs[0]), PACKED_OPT_LEVEL))
+
+    if is_called_without_inlining(tree):
+        modules.append((generate_compute_module("call module", "Call",
+            used_inputs, used_outputs), CALL_OPT_LEVEL))
+
+    return modules
+
+def supports_packed_arguments(input_sockets, output_sockets):
+    '''Packed functions need float inputs and a float as first output.'''
+    return (len(output_sockets) > 0 and output_sockets[0].bl_idname == "cn_FloatSocket" and
+            all(s.bl_idname == "cn_FloatSocket" for s in input_sockets))
+
+def get_partial_module_name(output_mask):
+    return "module {}".format(tuple(output_mask))
+
+
+def find_interface_nodes(tree):
+    inputs = get_nodes_by_type(tree, "cn_InputNode")
+    outputs = get_nodes_by_type(tree, "cn_OutputNode")
+    vertex_inputs = get_nodes_by_type(tree, "cn_VertexInputNode")
+
+    if len(inputs) > 1 or len(outputs) != 1:
+        raise Exception("a tree must have at most one input and exactly one output node")
+    if len(vertex_inputs) > 1:
+        raise Exception("a tree must have at most one vertex input node")
+
+    input_node = None if len(inputs) == 0 else inputs[0]
+    vertex_input_node = None if len(vertex_inputs) == 0 else vertex_inputs[0]
+    return input_node, outputs[0], vertex_input_node
+
+
+def iter_global_inputs(tree):
+    '''
+    Yields (node, value, name) for every value that is uploaded to a global
+    before the compiled code of the tree runs:
+        - the unlinked sockets of the tree and of all trees inlined into it
+        - node parameters that are runtime data, see node_parameters.py
+        - the frame and time of the scene
+        - the addresses of the functions of called trees
+    Every value has an ir_type and the methods update_at_address and
+    to_register like a socket.
+    '''
+    names = set()
+    for node, value, name in iter_global_inputs_recursive(tree, ""):
+        if name not in names:
+            names.add(name)
+            yield node, value, name
+
+def iter_global_inputs_recursive(tree, prefix):
+    for node, socket in iter_all_unlinked_inputs(tree):
+        yield node, socket, prefix + get_global_input_name(node, socket)
+    yield from iter_parameter_globals(tree, get_runtime_parameter_nodes(tree))
+    for node in get_nodes_by_type(tree, "cn_FrameInputNode"):
+        yield from node.iter_global_inputs()
+    for node in get_nodes_by_type(tree, "cn_TreeCallNode"):
+        yield from node.iter_global_inputs()
+
+def generate_globals_module(tree):
+    module_ir = ir.Module("Globals")
+    for node, value, name in iter_global_inputs(tree):
+        variable = ir.GlobalVariable(module_ir, value.ir_type, name)
+        variable.linkage = "internal"
+    return module_ir
+
+def generate_compute_module(module_name, function_name, input_sockets, output_sockets):
     module = ir.Module(module_name)
+    insert_compute_function(module, function_name, input_sockets, output_sockets)
+    return module
+
+def insert_compute_function(module, function_name, input_sockets, output_sockets, get_global_name = None):
+    assert len(output_sockets) > 0
 
     input_types = [s.ir_type for s in input_sockets]
     output_pointer_types = [s.ir_type.as_pointer() for s in output_sockets]
@@ -154,60 +462,236 @@ def generate_compute_module(module_name, function_name, input_sockets, output_so
     output_args = function.args[len(input_types):]
 
     block = function.append_basic_block("entry")
-    builder = ir.IRBuilder(block)
-
-    input_vregisters = {}
     tree = output_sockets[0].id_data
-    for node, socket in iter_all_unlinked_inputs(tree):
-        name = get_global_input_name(node, socket)
-        source_variable = ir.GlobalVariable(module, socket.ir_type, name)
-        source_variable.linkage = "available_externally"
-        vregister = builder.load(source_variable)
-        input_vregisters[socket] = vregister
+    builder = create_builder(block, tree)
+
+    input_vregisters = insert_global_input_loads(builder, tree, get_global_name)
 
     for socket, vregister in zip(input_sockets, input_args):
-        input_vregisters[socket] = vregister
+        input_vregisters[socket] = socket.to_register(builder, vregister)
 
     outputs = generate_function_code(builder, input_vregisters, output_sockets)
-    for vregister, pointer_vregister in zip(outputs, output_args):
-        builder.store(vregister, pointer_vregister)
+    for socket, vregister, pointer_vregister in zip(output_sockets, outputs, output_args):
+        builder.store(socket.from_register(builder, vregister), pointer_vregister)
 
     builder.ret_void()
 
+    return function
+
+
+def generate_packed_module(module_name, function_name, input_sockets, output_socket):
+    '''
+    The generated function gets all float inputs in one array and
+    returns the value of a single float output:
+        float MainPacked(float* inputs)
+    '''
+    module = ir.Module(module_name)
+    float_type = ir.FloatType()
+    function_type = ir.FunctionType(float_type, [float_type.as_pointer()])
+    function = ir.Function(module, function_type, name = function_name)
+    inputs_pointer = function.args[0]
+
+    block = function.append_basic_block("entry")
+    tree = output_socket.id_data
+    builder = create_builder(block, tree)
+
+    input_vregisters = insert_global_input_loads(builder, tree)
+    for i, socket in enumerate(input_sockets):
+        vregister = builder.load(builder.gep(inputs_pointer, [ir.IntType(32)(i)]))
+        input_vregisters[socket] = socket.to_register(builder, vregister)
+
+    output, = generate_function_code(builder, input_vregisters, [output_socket])
+    builder.ret(output_socket.from_register(builder, output))
+    return module
+
+def generate_batch_module(module_name, function_name, input_sockets, output_sockets, branchless = True):
+    '''
+    The generated function computes the tree for many elements at once:
+        void MainBatch(i32 amount, <input arrays>..., <output arrays>...)
+    Global inputs and everything that does not depend on the
+    per-element inputs is computed only once before the loop.
+    Conditional nodes are lowered without branches by default, so that
+    the loop can be vectorized.
+    '''
+    module = ir.Module(module_name)
+    insert_batch_function(module, function_name, input_sockets, output_sockets, branchless = branchless)
     return module
 
+def insert_batch_function(module, function_name, input_sockets, output_sockets,
+                          get_global_name = None, branchless = True):
+    assert len(output_sockets) > 0
+
+    index_type = ir.IntType(32)
+    input_types = [s.ir_type.as_pointer() for s in input_sockets]
+    output_types = [s.ir_type.as_pointer() for s in output_sockets]
+    function_type = ir.FunctionType(ir.VoidType(), [index_type] + input_types + output_types)
+
+    function = ir.Function(module, function_type, name = function_name)
+    amount = function.args[0]
+    input_args = function.args[1:len(input_types) + 1]
+    output_args = function.args[len(input_types) + 1:]
+
+    entry_block = function.append_basic_block("entry")
+    condition_block = function.append_basic_block("condition")
+    body_block = function.append_basic_block("body")
+    exit_block = function.append_basic_block("exit")
+
+    tree = output_sockets[0].id_data
+    builder = create_builder(entry_block, tree, branchless = branchless)
+    uniform_vregisters = insert_global_input_loads(builder, tree, get_global_name)
+    varying_sockets = find_varying_sockets(input_sockets)
+    uniform_sockets = find_uniform_sockets_to_hoist(output_sockets, varying_sockets)
+    builder = insert_code_to_calculate_sockets(uniform_sockets, builder, uniform_vregisters)
+    loop_entry_block = builder.block
+    builder.branch(condition_block)
+
+    builder.position_at_end(condition_block)
+    index = builder.phi(index_type, name = "index")
+    index.add_incoming(index_type(0), loop_entry_block)
+    is_in_range = builder.icmp_signed("<", index, amount, name = "is_in_range")
+    builder.cbranch(is_in_range, body_block, exit_block)
+
+    builder.position_at_end(body_block)
+    input_vregisters = dict(uniform_vregisters)
+    for socket, array in zip(input_sockets, input_args):
+        vregister = builder.load(builder.gep(array, [index]))
+        input_vregisters[socket] = socket.to_register(builder, vregister)
+
+    outputs = generate_function_code(builder, input_vregisters, output_sockets)
+    for socket, vregister, array in zip(output_sockets, outputs, output_args):
+        builder.store(socket.from_register(builder, vregister), builder.gep(array, [index]))
+
+    next_index = builder.add(index, index_type(1), name = "next_index")
+    index.add_incoming(next_index, builder.block)
+    builder.branch(condition_block)
+
+    builder.position_at_end(exit_block)
+    builder.ret_void()
+
+    return function
+
+def insert_global_input_loads(builder, tree, get_global_name = None):
+    '''
+    Globals that are not defined in the module already are expected
+    to be provided by another module in the same engine.
+    get_global_name maps the names of iter_global_inputs to the names
+    of the globals in the module.
+    All loaded values are stored in builder.global_inputs by name, the
+    returned dict contains the values of the unlinked sockets.
+    '''
+    get_global_name = get_global_name or (lambda name: name)
+
+    for node, value, name in iter_global_inputs(tree):
+        global_name = get_global_name(name)
+        source_variable = builder.module.globals.get(global_name)
+        if source_variable is None:
+            source_variable = ir.GlobalVariable(builder.module, value.ir_type, global_name)
+            source_variable.linkage = "available_externally"
+        builder.global_inputs[name] = value.to_register(builder, builder.load(source_variable))
+
+    return {socket : builder.global_inputs[get_global_input_name(node, socket)]
+            for node, socket in iter_all_unlinked_inputs(tree)}
+
 
 def generate_function_code(builder, input_vregisters, required_sockets):
     vregisters = dict()
     vregisters.update(input_vregisters)
 
-    for socket in required_sockets:
-        builder = insert_code_to_calculate_socket(socket, builder, vregisters)
+    builder = insert_code_to_calculate_sockets(required_sockets, builder, vregisters)
 
     outputs = [vregisters[s] for s in required_sockets]
     return outputs
 
-def insert_code_to_calculate_socket(socket, builder, vregisters):
-    if socket in vregisters:
+def insert_code_to_calculate_sockets(sockets, builder, vregisters):
+    '''
+    Emits the code for all nodes that are needed in a single pass over
+    the topological order of the tree. Afterwards vregisters contains
+    the values for all given sockets.
+    '''
+    if len(sockets) == 0:
         return builder
+    tree = sockets[0].id_data
 
-    if socket.is_output:
-        node = get_node_by_socket(socket)
-        for input_socket in node.inputs:
-            builder = insert_code_to_calculate_socket(input_socket, builder, vregisters)
-
-        input_vregisters = [vregisters[s] for s in node.inputs]
+    for node in get_nodes_to_calculate(tree, sockets, vregisters):
+        input_vregisters = get_input_values(node, vregisters)
         builder, *output_vregisters = node.create_llvm_ir(builder, *input_vregisters)
 
         for socket, vregister in zip(node.outputs, output_vregisters):
             vregisters[socket] = vregister
-    else:
-        origin_socket = get_data_origin_socket(socket)
-        builder = insert_code_to_calculate_socket(origin_socket, builder, vregisters)
-        vregisters[socket] = vregisters[origin_socket]
+
+    for socket in sockets:
+        vregisters[socket] = vregisters[get_value_socket(socket, vregisters)]
 
     return builder
 
+def get_value_socket(socket, known_sockets):
+    '''Linked input sockets get their value from the origin socket.'''
+    if socket in known_sockets:
+        return socket
+    return get_data_origin_socket(socket)
+
+def get_input_values(node, values):
+    '''The values of the inputs of the node, None for inputs the node does not read.'''
+    return [values[get_value_socket(s, values)] if is_read_input(s) else None for s in node.inputs]
+
+
+def split_range(amount, parts, min_chunk_size = 10000):
+    parts = max(1, min(parts, amount // min_chunk_size))
+    chunk_size = max(1, -(-amount // parts))
+    for start in range(0, max(amount, 1), chunk_size):
+        yield start, min(start + chunk_size, amount)
+
+_thread_pool = None
+
+def get_thread_pool():
+    global _thread_pool
+    if _thread_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _thread_pool = ThreadPoolExecutor(os.cpu_count())
+    return _thread_pool
+
+class OutputBuffers:
+    '''
+    Persistent arrays the compiled code writes the results into.
+    They only grow, so calls with the same or a smaller amount of
+    elements do not allocate. With single = True the arrays have the
+    shape of one value instead of one value per element.
+    '''
+    def __init__(self, sockets, single = False):
+        self.sockets = sockets
+        self.single = single
+        self.capacity = -1
+        self.amount = -1
+
+    def get(self, amount, out = None):
+        if out is not None:
+            return self.check_out_arrays(amount, out)
+
+        if amount > self.capacity:
+            self.buffers = [socket.create_buffer(amount) for socket in self.sockets]
+            self.capacity = amount
+            self.amount = -1
+        if amount != self.amount:
+            self.views = tuple(self.as_result(buffer[:amount]) for buffer in self.buffers)
+            self.addresses = [buffer.ctypes.data for buffer in self.buffers]
+            self.amount = amount
+        return self.views, self.addresses
+
+    def check_out_arrays(self, amount, out):
+        out = tuple(out)
+        if len(out) != len(self.sockets):
+            raise Exception("wrong amount of output arrays")
+        for socket, array in zip(self.sockets, out):
+            if self.single and hasattr(array, "reshape"):
+                array = array.reshape((1, ) + array.shape)
+            if not socket.is_valid_buffer(array, amount):
+                raise Exception("output array for '{}' needs shape {}, dtype {} and has to be contiguous".format(
+                    socket.name, (amount, ) + socket.buffer_shape, socket.buffer_dtype))
+        return out, [array.ctypes.data for array in out]
+
+    def as_result(self, buffer):
+        return buffer[0, ...] if self.single else buffer
+
 
 def get_global_input_name(node, socket):
     return validify_name(node.name) + " - " + validify_name(socket.identifier)
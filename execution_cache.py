@@ -0,0 +1,76 @@
+'''
+Every execution data can hold an engine with compiled code. They are
+kept in a cache with a limited amount of entries and a limited amount
+of native code. When a limit is exceeded, the least recently used
+entries are disposed.
+
+Limits are only enforced between updates (see update.py), so that code
+is never removed while it might be running.
+'''
+
+from collections import OrderedDict
+
+MAX_ENTRY_AMOUNT = 64
+MAX_CODE_SIZE = 64 * 1024 * 1024
+
+class ExecutionDataCache:
+    def __init__(self, max_entry_amount = MAX_ENTRY_AMOUNT, max_code_size = MAX_CODE_SIZE):
+        self.max_entry_amount = max_entry_amount
+        self.max_code_size = max_code_size
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.disposals = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        self.entries.move_to_end(key)
+        return self.entries[key][1]
+
+    def set(self, key, tree_hash, execution_data):
+        self.remove(key)
+        self.entries[key] = (tree_hash, execution_data)
+
+    def remove(self, key):
+        if key in self.entries:
+            tree_hash, execution_data = self.entries.pop(key)
+            self.dispose(execution_data)
+
+    def remove_tree(self, tree_hash):
+        for key in [key for key, (h, _) in self.entries.items() if h == tree_hash]:
+            self.remove(key)
+
+    def remove_unused(self, used_tree_hashes):
+        '''Disposes the execution data of trees that do not exist anymore.'''
+        used_tree_hashes = set(used_tree_hashes)
+        for key in [key for key, (h, _) in self.entries.items() if h not in used_tree_hashes]:
+            self.remove(key)
+
+    def enforce_limits(self):
+        while len(self.entries) > 0 and (len(self.entries) > self.max_entry_amount
+                                         or self.get_code_size() > self.max_code_size):
+            key, (tree_hash, execution_data) = self.entries.popitem(last = False)
+            self.dispose(execution_data)
+            self.evictions += 1
+
+    def dispose(self, execution_data):
+        execution_data.dispose()
+        self.disposals += 1
+
+    def get_code_size(self):
+        return sum(data.get_statistics()["code_bytes"] for _, data in self.entries.values())
+
+    def clear(self):
+        for key in list(self.entries):
+            self.remove(key)
+
+    def get_statistics(self):
+        statistics = [data.get_statistics() for _, data in self.entries.values()]
+        return {
+            "entries" : len(self.entries),
+            "live_engines" : sum(s["engines"] for s in statistics),
+            "code_bytes" : sum(s["code_bytes"] for s in statistics),
+            "evictions" : self.evictions,
+            "disposals" : self.disposals
+        }
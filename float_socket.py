@@ -1,4 +1,5 @@
 import bpy
+from . lazy_imports import numpy
 from bpy.props import *
 from llvmlite import ir
 from ctypes import c_float
@@ -9,6 +10,7 @@ class FloatSocket(bpy.types.NodeSocket, BaseSocket):
     bl_idname = "cn_FloatSocket"
     ir_type = ir.FloatType()
     c_type = c_float
+    buffer_dtype = "float32"
 
     value = FloatProperty(name = "Value")
 
@@ -23,3 +25,18 @@ class FloatSocket(bpy.types.NodeSocket, BaseSocket):
 
     def value_from_cvalue(self, cvalue):
         return cvalue.value
+
+    def cvalue_from_value(self, value):
+        return value
+
+    def value_from_python(self, value):
+        return float(value)
+
+    def array_from_property(self):
+        return numpy.float32(self.value)
+
+    def array_from_values(self, values):
+        return numpy.asarray(values, dtype = numpy.float32)
+
+    def values_from_array(self, array, amount):
+        return numpy.broadcast_to(array, (amount, )).tolist()
@@ -0,0 +1,61 @@
+'''
+Outputs the frame and the time in seconds. Normally both are read from
+the scene and uploaded like socket values. When a tree is evaluated for
+a frame range (see frame_range.py), they are inputs of the batch kernel
+instead, so that every element gets its own frame.
+Trees that are called by other trees always use the frame of the scene.
+'''
+
+import bpy
+from ctypes import c_float
+from llvmlite import ir
+from . lazy_imports import numpy
+from . node_base import NodeBase
+
+class FrameInputNode(bpy.types.Node, NodeBase):
+    bl_idname = "cn_FrameInputNode"
+    bl_label = "Frame Input"
+
+    def init(self, context):
+        self.outputs.new("cn_FloatSocket", "Frame", "frame")
+        self.outputs.new("cn_FloatSocket", "Time", "time")
+
+    def iter_global_inputs(self):
+        # the same for all nodes and inlined trees
+        yield self, SceneTimeValue(get_current_frame, "frame"), "scene frame"
+        yield self, SceneTimeValue(get_current_time, "time"), "scene time"
+
+    def create_llvm_ir(self, builder):
+        return builder, builder.global_inputs["scene frame"], builder.global_inputs["scene time"]
+
+    def create_python_code(self):
+        return ("current_frame()", "current_time()")
+
+    def execute_numpy(self):
+        return (numpy.float32(get_current_frame()), numpy.float32(get_current_time()))
+
+
+class SceneTimeValue:
+    ir_type = ir.FloatType()
+
+    def __init__(self, get_value, identifier):
+        self.get_value = get_value
+        # of the output socket that has the value
+        self.identifier = identifier
+
+    def to_register(self, builder, value):
+        return value
+
+    def update_at_address(self, address):
+        c_float.from_address(address).value = self.get_value()
+
+
+def get_current_frame():
+    return bpy.context.scene.frame_current_final
+
+def get_current_time():
+    return get_current_frame() / get_frames_per_second()
+
+def get_frames_per_second():
+    render = bpy.context.scene.render
+    return render.fps / render.fps_base
@@ -0,0 +1,156 @@
+'''
+Evaluates a tree for many frames with a single call of a batch kernel.
+The outputs of the Frame Input nodes are the per-element inputs of the
+kernel, the inputs of the tree are the same for all frames:
+    function = tree.get_frame_range_function()
+    locations, = function(1, 250, *inputs)
+The result contains one list with a value per frame for every output.
+
+The results of tree contexts are stored per frame, so that playing back
+an animation again does not evaluate unchanged trees at all.
+'''
+
+import bpy
+from collections import OrderedDict
+from . frame_input_node import get_frames_per_second
+from . tree_info import get_tree_info, get_nodes_by_type
+from . utils.nodes import iter_compute_node_trees
+
+MAX_FRAMES_PER_TREE = 10000
+
+def get_frame_range(frame_start, frame_end, frame_step = 1):
+    '''Both ends are included.'''
+    if frame_step <= 0:
+        raise Exception("the frame step has to be positive")
+    amount = int((frame_end - frame_start) / frame_step + 1e-6) + 1
+    return [float(frame_start + i * frame_step) for i in range(max(0, amount))]
+
+def get_frame_input_sockets(tree):
+    '''Frame and time of every Frame Input node, the per-element inputs of the kernel.'''
+    sockets = []
+    for node in get_nodes_by_type(tree, "cn_FrameInputNode"):
+        sockets.extend(node.outputs)
+    return sockets
+
+def create_frame_range_wrapper(tree, batch_function):
+    '''batch_function has to take the frame input sockets after the tree inputs.'''
+    frame_node_amount = len(get_nodes_by_type(tree, "cn_FrameInputNode"))
+
+    def pywrapper(frame_start, frame_end, *args, frame_step = 1, out = None, view = False):
+        """
+        Every argument is one value, which is used for all frames.
+        Returns one list with a value per frame for every output socket,
+        out and view work like for the batch function.
+        """
+        frames = get_frame_range(frame_start, frame_end, frame_step)
+        fps = get_frames_per_second()
+        times = [frame / fps for frame in frames]
+        amount = len(frames)
+
+        inputs = [[value] * amount for value in args]
+        inputs.extend([frames, times] * frame_node_amount)
+        return batch_function(amount, *inputs, out = out, view = view)
+
+    return pywrapper
+
+
+class FrameResultCache:
+    '''
+    The results of a tree per frame and input values. They are dropped
+    when the tree or one of the trees it calls is changed in any way,
+    including socket values and node parameters. Trees that read objects
+    are not cached, because objects can change at any time.
+    '''
+    def __init__(self, max_frames = MAX_FRAMES_PER_TREE):
+        self.max_frames = max_frames
+        # tree hash -> (tree state, OrderedDict((frame, fps, inputs) -> results))
+        self.entries = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tree, frame, inputs):
+        results_by_key = self.get_results_by_key(tree)
+        if results_by_key is None:
+            return None
+        key = get_result_key(frame, inputs)
+        results = results_by_key.get(key)
+        if results is None:
+            self.misses += 1
+        else:
+            results_by_key.move_to_end(key)
+            self.hits += 1
+        return results
+
+    def set(self, tree, frame, inputs, results):
+        results_by_key = self.get_results_by_key(tree)
+        if results_by_key is None:
+            return
+        results_by_key[get_result_key(frame, inputs)] = results
+        while len(results_by_key) > self.max_frames:
+            results_by_key.popitem(last = False)
+
+    def get_results_by_key(self, tree):
+        state = get_tree_state(tree)
+        if state is None:
+            return None
+        entry = self.entries.get(hash(tree))
+        if entry is None or entry[0] != state:
+            entry = (state, OrderedDict())
+            self.entries[hash(tree)] = entry
+        return entry[1]
+
+    def remove_unused(self, used_hashes):
+        used_hashes = set(used_hashes)
+        for tree_hash in list(self.entries):
+            if tree_hash not in used_hashes:
+                del self.entries[tree_hash]
+
+    def clear(self):
+        self.entries.clear()
+
+    def get_statistics(self):
+        return {
+            "trees" : len(self.entries),
+            "frames" : sum(len(results) for _, results in self.entries.values()),
+            "hits" : self.hits,
+            "misses" : self.misses
+        }
+
+
+frame_result_cache = FrameResultCache()
+
+def remove_unused_frame_results():
+    frame_result_cache.remove_unused(hash(tree) for tree in iter_compute_node_trees())
+
+def get_tree_state(tree):
+    '''
+    A new tree info is created for every structural change, the values
+    version counts the changes of socket values and node parameters.
+    '''
+    from . tree_call_node import iter_called_trees
+    trees = [tree] + sorted(iter_called_trees(tree), key = lambda t: t.name)
+    infos = [get_tree_info(t) for t in trees]
+    if any(reads_objects(info) for info in infos):
+        return None
+    return tuple((info, info.values_version) for info in infos)
+
+def reads_objects(info):
+    return any(socket.bl_idname == "cn_ObjectSocket" for socket in info.sockets)
+
+def get_result_key(frame, inputs):
+    return (frame, get_frames_per_second(), tuple(as_hashable(values) for values in inputs))
+
+def as_hashable(value):
+    if isinstance(value, (str, bytes)):
+        return value
+    try: return tuple(as_hashable(v) for v in value)
+    except TypeError: return value
+
+def get_current_frame_results(tree, inputs, compute_results):
+    '''Returns the cached results of the current frame or computes and stores them.'''
+    frame = bpy.context.scene.frame_current_final
+    results = frame_result_cache.get(tree, frame, inputs)
+    if results is None:
+        results = compute_results()
+        frame_result_cache.set(tree, frame, inputs, results)
+    return results
@@ -0,0 +1,32 @@
+'''
+Registry of the LLVM intrinsics that nodes can use.
+Declarations are deduplicated per module, so that any amount of nodes
+can use the same intrinsic in one tree.
+'''
+
+from llvmlite import ir
+
+# intrinsic name -> amount of arguments with the same type as the result
+float_intrinsics = {
+    "llvm.sin" : 1,
+    "llvm.cos" : 1,
+    "llvm.sqrt" : 1,
+    "llvm.exp" : 1,
+    "llvm.log" : 1,
+    "llvm.fabs" : 1,
+    "llvm.floor" : 1,
+    "llvm.ceil" : 1,
+    "llvm.pow" : 2,
+    "llvm.minnum" : 2,
+    "llvm.maxnum" : 2,
+    "llvm.fma" : 3,
+    "llvm.fmuladd" : 3
+}
+
+def get_float_intrinsic(module, name, type = ir.FloatType()):
+    if name not in float_intrinsics:
+        raise Exception("unknown intrinsic: {}".format(name))
+
+    argument_amount = float_intrinsics[name]
+    function_type = ir.FunctionType(type, [type] * argument_amount)
+    return module.declare_intrinsic(name, [type], function_type)
@@ -0,0 +1,34 @@
+'''
+Modules that take long to import are only loaded when they are used
+for the first time, so that enabling the add-on stays fast:
+    from . lazy_imports import numpy, llvm
+They are used like the normal modules. LLVM is initialized before the
+first access to llvmlite.binding.
+
+Module level code must not access them, otherwise the import happens
+when the add-on is loaded again (see utils/benchmark.py).
+'''
+
+import sys
+import importlib
+from . utils.compile_worker import initialize_llvm
+
+class LazyModule:
+    def __init__(self, name, setup = None):
+        self._lazy_name = name
+        self._lazy_setup = setup
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._lazy_name)
+        if self._lazy_setup is not None:
+            self._lazy_setup()
+        value = getattr(module, attribute)
+        # found by the normal attribute lookup next time
+        setattr(self, attribute, value)
+        return value
+
+    def is_loaded(self):
+        return self._lazy_name in sys.modules
+
+numpy = LazyModule("numpy")
+llvm = LazyModule("llvmlite.binding", setup = initialize_llvm)
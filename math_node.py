@@ -1,38 +1,127 @@
 import bpy
+from . lazy_imports import numpy
 from bpy.props import *
 from llvmlite import ir
 from . compute_node import ComputeNode
+from . intrinsics import float_intrinsics
+from . node_parameters import parameter_changed, insert_parameter_switch
 
 operation_items = [
     ("ADD", "Add", "", "NONE", 0),
     ("SUBTRACT", "Subtract", "", "NONE", 1),
     ("MULTIPLY", "Multiply", "", "NONE", 2),
     ("DIVIDE", "Divide", "", "NONE", 3),
-    ("SIN", "Sin", "", "NONE", 4)
+    ("SIN", "Sin", "", "NONE", 4),
+    ("COS", "Cos", "", "NONE", 5),
+    ("POWER", "Power", "A to the power of B", "NONE", 6),
+    ("SQRT", "Square Root", "", "NONE", 7),
+    ("EXP", "Exponential", "e to the power of A", "NONE", 8),
+    ("LOG", "Logarithm", "Natural logarithm of A", "NONE", 9),
+    ("ABSOLUTE", "Absolute", "", "NONE", 10),
+    ("MINIMUM", "Minimum", "", "NONE", 11),
+    ("MAXIMUM", "Maximum", "", "NONE", 12),
+    ("FLOOR", "Floor", "", "NONE", 13),
+    ("CEIL", "Ceil", "", "NONE", 14),
+    ("MULTIPLY_ADD", "Multiply Add", "A * B + C as a single fused operation", "NONE", 15)
 ]
 
+# operation -> intrinsic name, the amount of arguments is in intrinsics.py
+intrinsic_operations = {
+    "SIN" : "llvm.sin",
+    "COS" : "llvm.cos",
+    "POWER" : "llvm.pow",
+    "SQRT" : "llvm.sqrt",
+    "EXP" : "llvm.exp",
+    "LOG" : "llvm.log",
+    "ABSOLUTE" : "llvm.fabs",
+    "MINIMUM" : "llvm.minnum",
+    "MAXIMUM" : "llvm.maxnum",
+    "FLOOR" : "llvm.floor",
+    "CEIL" : "llvm.ceil"
+}
+
+# operation -> name of the NumPy ufunc
+numpy_operations = {
+    "ADD" : "add",
+    "SUBTRACT" : "subtract",
+    "MULTIPLY" : "multiply",
+    "SIN" : "sin",
+    "COS" : "cos",
+    "POWER" : "power",
+    "SQRT" : "sqrt",
+    "EXP" : "exp",
+    "LOG" : "log",
+    "ABSOLUTE" : "absolute",
+    "MINIMUM" : "fmin",
+    "MAXIMUM" : "fmax",
+    "FLOOR" : "floor",
+    "CEIL" : "ceil"
+}
+
+# operation -> expression in the generated Python code
+python_expressions = {
+    "ADD" : "{a} + {b}",
+    "SUBTRACT" : "{a} - {b}",
+    "MULTIPLY" : "{a} * {b}",
+    "DIVIDE" : "safe_divide({a}, {b})",
+    "SIN" : "sine({a})",
+    "COS" : "cosine({a})",
+    "POWER" : "power({a}, {b})",
+    "SQRT" : "square_root({a})",
+    "EXP" : "exponential({a})",
+    "LOG" : "logarithm({a})",
+    "ABSOLUTE" : "abs({a})",
+    "MINIMUM" : "minimum({a}, {b})",
+    "MAXIMUM" : "maximum({a}, {b})",
+    "FLOOR" : "round_down({a})",
+    "CEIL" : "round_up({a})",
+    "MULTIPLY_ADD" : "{a} * {b} + {c}"
+}
+
 class FloatMathNode(bpy.types.Node, ComputeNode):
     bl_idname = "cn_FloatMathNode"
     bl_label = "Float Math"
 
     def propChanged(self, context):
-        self.id_data.update()
+        self.update_socket_visibility()
+        parameter_changed(self)
 
     operation = EnumProperty(name = "Operation", items = operation_items, update = propChanged)
+    enum_parameters = {"operation" : operation_items}
 
     def init(self, context):
         self.inputs.new("cn_FloatSocket", "A", "a")
         self.inputs.new("cn_FloatSocket", "B", "b")
+        self.inputs.new("cn_FloatSocket", "C", "c")
         self.outputs.new("cn_FloatSocket", "Result", "result")
+        self.update_socket_visibility()
+
+    def update_socket_visibility(self):
+        # nodes created with older versions only have two inputs
+        if len(self.inputs) > 2:
+            self.inputs[2].hide = self.operation != "MULTIPLY_ADD"
+
+    def get_unused_inputs(self):
+        # runtime parameters can switch to Multiply Add without new code
+        if len(self.inputs) < 3 or self.has_runtime_parameters or self.operation == "MULTIPLY_ADD":
+            return []
+        return [self.inputs[2]]
 
     def draw(self, layout):
         layout.prop(self, "operation", text = "")
 
-    def create_llvm_ir(self, builder, a, b):
-        op = self.operation
+    def create_llvm_ir(self, builder, a, b, c = None):
+        result = insert_parameter_switch(builder, self, "operation",
+            lambda op: self.create_operation_ir(builder, op, a, b, c))
+        return builder, result
+
+    def create_operation_ir(self, builder, op, a, b, c):
         out_name = "result"
 
         zero = ir.Constant(ir.FloatType(), 0)
+        if c is None:
+            c = zero
+
         if op == "ADD":
             result = builder.fadd(a, b, name = out_name)
         elif op == "SUBTRACT":
@@ -41,20 +130,29 @@ class FloatMathNode(bpy.types.Node, ComputeNode):
             result = builder.fmul(a, b, name = out_name)
         elif op == "DIVIDE":
             is_not_zero = builder.fcmp_ordered("!=", b, zero, name = "is_not_zero")
-            with builder.if_else(is_not_zero) as (then, otherwise):
-                with then:
-                    then_block = builder.block
-                    normal_result = builder.fdiv(a, b)
-                with otherwise:
-                    else_block = builder.block
-                    zero_result = zero
-
-            result = builder.phi(ir.FloatType(), name = out_name)
-            result.add_incoming(normal_result, then_block)
-            result.add_incoming(zero_result, else_block)
-        elif op == "SIN":
-            f_type = ir.FunctionType(ir.FloatType(), [ir.FloatType()])
-            f = ir.Function(builder.module, f_type, "llvm.sin.f32")
-            result = builder.call(f, [a], name = out_name)
+            result = builder.choose(is_not_zero, lambda: builder.fdiv(a, b), lambda: zero, name = out_name)
+        elif op == "MULTIPLY_ADD":
+            result = builder.multiply_add(a, b, c)
+        elif op in intrinsic_operations:
+            name = intrinsic_operations[op]
+            result = builder.call_intrinsic(name, [a, b, c][:float_intrinsics[name]])
 
-        return builder, result
+        return result
+
+    def execute_numpy(self, a, b, c = None):
+        op = self.operation
+
+        if op == "DIVIDE":
+            # nan is no valid divisor either, like the ordered comparison in the compiled code
+            result = numpy.where((b != 0) & (b == b), a / b, numpy.float32(0))
+        elif op == "MULTIPLY_ADD":
+            # not fused, so the last bit can differ from the compiled code
+            result = a * b + c
+        else:
+            function = getattr(numpy, numpy_operations[op])
+            result = function(*[a, b][:function.nin])
+
+        return (result, )
+
+    def create_python_code(self, a, b, c = "0.0"):
+        return (python_expressions[self.operation].format(a = a, b = b, c = c), )
@@ -7,10 +7,14 @@ def drawMenu(self, context):
     layout = self.layout
     layout.operator_context = "INVOKE_DEFAULT"
     insertNode(layout, "cn_FloatMathNode", "Math")
+    insertNode(layout, "cn_VectorMathNode", "Vector Math")
     insertNode(layout, "cn_CombineVectorNode", "Combine Vector")
     insertNode(layout, "cn_SeparateVectorNode", "Separate Vector")
     insertNode(layout, "cn_ObjectTransformsNode", "Object Transforms")
+    insertNode(layout, "cn_TreeCallNode", "Tree Call")
     insertNode(layout, "cn_InputNode", "Input")
+    insertNode(layout, "cn_VertexInputNode", "Vertex Input")
+    insertNode(layout, "cn_FrameInputNode", "Frame Input")
     insertNode(layout, "cn_OutputNode", "Output")
 
 def insertNode(layout, type, text, settings = {}, icon = "NONE"):
@@ -0,0 +1,35 @@
+from . lazy_imports import numpy
+
+buffers_by_name = dict()
+
+def get_buffer(name, length):
+    '''
+    The buffers are kept alive between calls, so that evaluating the same
+    mesh on every frame does not allocate new memory.
+    '''
+    buffer = buffers_by_name.get(name)
+    if buffer is None or len(buffer) != length:
+        buffer = numpy.empty(length, dtype = numpy.float32)
+        buffers_by_name[name] = buffer
+    return buffer
+
+def deform_mesh(tree, source_mesh, target_mesh = None, threads = None):
+    '''
+    Evaluates the tree for every vertex of the source mesh and writes
+    the new positions into the target mesh (defaults to the source mesh).
+    '''
+    if target_mesh is None:
+        target_mesh = source_mesh
+
+    amount = len(source_mesh.vertices)
+    if len(target_mesh.vertices) != amount:
+        raise Exception("source and target mesh have a different vertex amount")
+
+    positions = get_buffer("positions", amount * 3)
+    results = get_buffer("results", amount * 3)
+
+    source_mesh.vertices.foreach_get("co", positions)
+    function = tree.get_vertex_function()
+    function(amount, positions.ctypes.data, results.ctypes.data, threads)
+    target_mesh.vertices.foreach_set("co", results)
+    target_mesh.update()
@@ -0,0 +1,99 @@
+'''
+Changes of a tree are classified by what they invalidate:
+    - structural changes (nodes, links, sockets and tree settings)
+      need new code, they call tree.update()
+    - socket values are uploaded before every call, they are captured
+      on every tree info update and need nothing else
+    - node parameters, the enum properties in `enum_parameters` of a
+      node class, are constants in the generated code
+
+The first time a parameter of a node changes, the tree is built again
+with the parameters of this node as runtime data: the index of the
+current item is uploaded like a socket value and the node selects its
+code with a switch. Further changes of the node are value changes.
+When no parameter of the tree has changed for SPECIALIZE_DELAY seconds,
+the parameters become constants again, so the final code is as fast as
+before. The edit latency does therefore not depend on the tree size.
+'''
+
+import time
+from ctypes import c_int32
+from llvmlite import ir
+from collections import defaultdict
+from . utils.nodes import iter_compute_node_trees
+
+SPECIALIZE_DELAY = 2.0
+
+# tree hash -> names of the nodes whose parameters are runtime data
+runtime_parameter_nodes = defaultdict(set)
+# tree hash -> time of the last parameter change
+changed_at = dict()
+
+def parameter_changed(node):
+    '''Has to be called instead of tree.update() when a parameter of the node changes.'''
+    tree = node.id_data
+    tree_hash = hash(tree)
+    changed_at[tree_hash] = time.perf_counter()
+    if node.name not in runtime_parameter_nodes[tree_hash]:
+        runtime_parameter_nodes[tree_hash].add(node.name)
+        tree.update()
+
+def has_runtime_parameters(tree, node):
+    return node.name in runtime_parameter_nodes.get(hash(tree), ())
+
+def specialize_tree(tree):
+    '''Turns the runtime parameters of the tree into constants again.'''
+    changed_at.pop(hash(tree), None)
+    if len(runtime_parameter_nodes.pop(hash(tree), ())) > 0:
+        tree.update()
+
+def specialize_unchanged_trees(delay = SPECIALIZE_DELAY):
+    now = time.perf_counter()
+    for tree in iter_compute_node_trees():
+        if now - changed_at.get(hash(tree), now) >= delay:
+            specialize_tree(tree)
+
+
+class EnumParameter:
+    '''The index of the current item of an enum parameter, uploaded like a socket value.'''
+    ir_type = ir.IntType(32)
+
+    def __init__(self, node, name):
+        self.node = node
+        self.name = name
+        self.index_by_identifier = {identifier : i for i, identifier in enumerate(get_enum_identifiers(node, name))}
+
+    def to_register(self, builder, value):
+        return value
+
+    def update_at_address(self, address):
+        c_int32.from_address(address).value = self.index_by_identifier[getattr(self.node, self.name)]
+
+
+def iter_parameter_globals(tree, nodes):
+    '''
+    The names contain the tree name, so that they stay the same when
+    the tree is inlined into another tree.
+    '''
+    for node in nodes:
+        for name in node.enum_parameters:
+            yield node, EnumParameter(node, name), get_parameter_global_name(tree, node, name)
+
+def get_parameter_global_name(tree, node, name):
+    return "{}/{} - {}".format(tree.name, node.name, name).replace('"', "")
+
+def get_enum_identifiers(node, name):
+    return [item[0] for item in node.enum_parameters[name]]
+
+def insert_parameter_switch(builder, node, name, create_case):
+    '''
+    Returns the value(s) of create_case(identifier) for the current item
+    of the parameter. Constant parameters need no switch.
+    '''
+    if not getattr(node, "has_runtime_parameters", False):
+        return create_case(getattr(node, name))
+
+    index = builder.global_inputs[get_parameter_global_name(node.id_data, node, name)]
+    identifiers = get_enum_identifiers(node, name)
+    return builder.choose_case(index, [lambda identifier = identifier: create_case(identifier)
+                                       for identifier in identifiers], name = name)
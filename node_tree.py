@@ -1,33 +1,144 @@
 import bpy
+from bpy.props import *
 from . tree_info import tag_update
-from . execution import TreeExecutionData
+from . tree_call_node import update_calling_trees
+from . execution_cache import ExecutionDataCache
+from . compile_scheduler import recompile_scheduler
+from . utils.nodes import iter_compute_node_trees
+from . adaptive_backend import AdaptiveExecutionData, execution_data_types
 
-execution_data_by_hash = dict()
+# keys are the tree hash, and (tree hash, "LLVM") for the compiled code
+# of trees that are called by other trees but use another backend,
+# and (tree hash, "NUMPY") while the compiled code is not ready yet
+execution_data_cache = ExecutionDataCache()
+
+class CompiledCodeItem(bpy.types.PropertyGroup):
+    module_name = StringProperty()
+    key = StringProperty()
+    data = StringProperty()
 
 class ComputeNodeTree(bpy.types.NodeTree):
     bl_idname = "cn_ComputeNodeTree"
     bl_label = "Compute"
     bl_icon = "SCRIPTPLUGINS"
 
+    def settingChanged(self, context):
+        self.update()
+
+    vector_mode = EnumProperty(name = "Vector Mode", default = "ARRAY", update = settingChanged,
+        items = [
+            ("ARRAY", "Array", "Keep vectors as float arrays in registers", "NONE", 0),
+            ("SIMD", "SIMD", "Keep vectors as packed 4 float vectors in registers", "NONE", 1)])
+
+    fast_math = EnumProperty(name = "Fast Math", default = "NONE", update = settingChanged,
+        items = [
+            ("NONE", "None", "Strict IEEE float semantics", "NONE", 0),
+            ("CONTRACT", "Contract", "Allow fusing multiplications and additions", "NONE", 1),
+            ("FULL", "Full", "Allow reassociation, reciprocals and ignoring NaN/Inf", "NONE", 2)])
+
+    backend = EnumProperty(name = "Backend", default = "LLVM", update = settingChanged,
+        items = [
+            ("LLVM", "LLVM", "Compile the tree to machine code", "NONE", 0),
+            ("NUMPY", "NumPy", "Evaluate the tree with NumPy operations, no compilation needed", "NONE", 1),
+            ("PYTHON", "Python", "Evaluate the tree with generated Python code, fast to compile", "NONE", 2),
+            ("AUTO", "Auto", "Choose the backend based on the tree size and how it is called", "NONE", 3)])
+
+    compiled_code = CollectionProperty(type = CompiledCodeItem)
+    embed_compiled_code = BoolProperty(name = "Embed Compiled Code", default = True,
+        description = "Store the compiled code in the .blend file to avoid compilation after loading")
+    driver_function = BoolProperty(name = "Driver Function", default = False,
+        description = "Make the tree available as function in driver expressions, the name is the tree name")
+
     def update(self):
         tag_update(self)
         self.remove_execution_data()
+        recompile_scheduler.invalidate(self)
+        update_calling_trees(self)
 
     def remove_execution_data(self):
-        execution_data_by_hash.pop(hash(self), None)
+        execution_data_cache.remove_tree(hash(self))
 
     def ensure_execution_data(self):
-        if hash(self) not in execution_data_by_hash:
-            execution_data_by_hash[hash(self)] = TreeExecutionData(self)
+        if hash(self) not in execution_data_cache:
+            if self.backend == "AUTO":
+                execution_data = AdaptiveExecutionData(self)
+            else:
+                execution_data = execution_data_types[self.backend](self)
+            execution_data_cache.set(hash(self), hash(self), execution_data)
+
+    def get_execution_data(self, interim = False):
+        '''
+        While the tree is compiled in the background, interim calls get
+        the NumPy backend. Only scene updates and drivers, which must not
+        block, use them. All other calls wait for the compilation.
+        '''
+        interim_key = (hash(self), "NUMPY")
+        if recompile_scheduler.is_pending(self):
+            if interim:
+                if interim_key not in execution_data_cache:
+                    execution_data_cache.set(interim_key, hash(self), execution_data_types["NUMPY"](self))
+                return execution_data_cache.get(interim_key)
+            recompile_scheduler.finish(self)
+        execution_data_cache.remove(interim_key)
 
-    def get_function(self):
         self.ensure_execution_data()
-        return execution_data_by_hash[hash(self)].get_function()
+        return execution_data_cache.get(hash(self))
+
+    def get_llvm_execution_data(self):
+        '''The compiled code of this tree, shared by all trees that call it.'''
+        if self.backend in ("LLVM", "AUTO"):
+            self.ensure_execution_data()
+            execution_data = execution_data_cache.get(hash(self))
+            if self.backend == "AUTO":
+                execution_data = execution_data.get_execution_data("LLVM")
+            return execution_data
+        key = (hash(self), "LLVM")
+        if key not in execution_data_cache:
+            execution_data_cache.set(key, hash(self), execution_data_types["LLVM"](self))
+        return execution_data_cache.get(key)
+
+    def get_function(self, interim = False):
+        return self.get_execution_data(interim).get_function()
+
+    def get_batch_function(self, interim = False):
+        return self.get_execution_data(interim).get_batch_function()
+
+    def get_vertex_function(self, interim = False):
+        return self.get_execution_data(interim).get_vertex_function()
+
+    def get_frame_range_function(self, interim = False):
+        return self.get_execution_data(interim).get_frame_range_function()
+
+    def get_compiled_code(self, module_name, key):
+        for item in self.compiled_code:
+            if item.module_name == module_name and item.key == key:
+                return item.data
+        return None
+
+    def set_compiled_code(self, module_name, key, data):
+        for item in self.compiled_code:
+            if item.module_name == module_name:
+                break
+        else:
+            item = self.compiled_code.add()
+            item.module_name = module_name
+        item.key = key
+        item.data = data
+
+    def clear_compiled_code(self):
+        self.compiled_code.clear()
 
     def print_modules(self):
-        self.ensure_execution_data()
-        execution_data_by_hash[hash(self)].print_modules()
+        self.get_execution_data().print_modules()
 
     def print_assembly(self):
-        self.ensure_execution_data()
-        execution_data_by_hash[hash(self)].print_module_assembly()
+        self.get_execution_data().print_module_assembly()
+
+
+def update_execution_data_cache():
+    '''Removes the execution data of deleted trees and enforces the cache limits.'''
+    execution_data_cache.remove_unused(hash(tree) for tree in iter_compute_node_trees())
+    execution_data_cache.enforce_limits()
+
+def get_execution_data_statistics():
+    return execution_data_cache.get_statistics()
@@ -0,0 +1,143 @@
+'''
+Evaluates trees with NumPy instead of compiling them with LLVM.
+There is no compilation latency, which makes this backend a better fit
+for one-shot evaluations of large trees.
+
+Every node provides an execute_numpy method next to create_llvm_ir.
+It gets one array per input and returns one array per output:
+    float  -> shape (amount, ) or ()
+    vector -> shape (amount, 3) or (3, )
+    object -> object array with shape (amount, ) or ()
+Unlinked inputs stay scalars and are broadcast by NumPy.
+'''
+
+from . lazy_imports import numpy
+from ctypes import c_float
+from . execution import find_interface_nodes, get_value_socket, get_input_values, OutputBuffers
+from . tree_info import iter_all_unlinked_inputs, get_nodes_to_calculate
+from . frame_range import get_frame_input_sockets, create_frame_range_wrapper
+
+class NumpyExecutionData:
+    '''Provides the same functions as TreeExecutionData.'''
+    def __init__(self, tree):
+        self.tree = tree
+        self.input_node, self.output_node, self.vertex_input_node = find_interface_nodes(tree)
+
+        self.py_function = None
+        self.py_batch_function = None
+        self.py_frame_range_function = None
+
+    def get_function(self):
+        if self.py_function is None:
+            self.py_function = self.create_function()
+        return self.py_function
+
+    def get_batch_function(self):
+        if self.py_batch_function is None:
+            self.py_batch_function = self.create_batch_function(self.get_all_input_sockets())
+        return self.py_batch_function
+
+    def get_frame_range_function(self):
+        if self.py_frame_range_function is None:
+            input_sockets = self.get_all_input_sockets() + get_frame_input_sockets(self.tree)
+            batch_function = self.create_batch_function(input_sockets)
+            self.py_frame_range_function = create_frame_range_wrapper(self.tree, batch_function)
+        return self.py_frame_range_function
+
+    def create_function(self):
+        batch_function = self.get_batch_function()
+        output_buffers = OutputBuffers(self.get_all_output_sockets(), single = True)
+
+        def pywrapper(*args, out = None, view = False):
+            if out is not None or view:
+                outputs, _ = output_buffers.get(1, out)
+                batch_function(1, *[[value] for value in args],
+                               out = [b.reshape((1, ) + b.shape) for b in outputs])
+                return outputs
+            results = batch_function(1, *[[value] for value in args])
+            return tuple(values[0] for values in results)
+
+        return pywrapper
+
+    def create_batch_function(self, input_sockets):
+        output_sockets = self.get_all_output_sockets()
+        output_buffers = OutputBuffers(output_sockets)
+
+        def pywrapper(amount, *args, out = None, view = False):
+            if len(args) != len(input_sockets):
+                raise Exception("wrong argument amount")
+
+            input_arrays = {}
+            for socket, values in zip(input_sockets, args):
+                if len(values) != amount:
+                    raise Exception("wrong element amount")
+                input_arrays[socket] = socket.array_from_values(values)
+
+            output_arrays = evaluate_sockets(self.tree, input_arrays, output_sockets)
+            if out is not None or view:
+                outputs, _ = output_buffers.get(amount, out)
+                for socket, buffer, array in zip(output_sockets, outputs, output_arrays):
+                    socket.fill_buffer(buffer, array)
+                return outputs
+            return tuple(socket.values_from_array(array, amount)
+                         for socket, array in zip(output_sockets, output_arrays))
+
+        return pywrapper
+
+    def get_vertex_function(self):
+        if self.vertex_input_node is None:
+            raise Exception("the tree has no vertex input node")
+        position_socket = self.vertex_input_node.outputs[0]
+        output_socket = self.get_vertex_output_socket()
+
+        def pywrapper(amount, positions_address, results_address, threads = None):
+            """
+            The addresses point to contiguous arrays of `amount` float triples.
+            NumPy evaluates every node in one go, so threads is ignored.
+            """
+            positions = array_from_address(positions_address, amount)
+            results = array_from_address(results_address, amount)
+            input_arrays = {position_socket : positions}
+            result, = evaluate_sockets(self.tree, input_arrays, [output_socket])
+            results[:] = result
+
+        return pywrapper
+
+    def dispose(self):
+        pass
+
+    def get_statistics(self):
+        return {"engines" : 0, "code_bytes" : 0}
+
+    def get_all_input_sockets(self):
+        return list(getattr(self.input_node, "outputs", []))
+
+    def get_all_output_sockets(self):
+        return list(self.output_node.inputs)
+
+    def get_vertex_output_socket(self):
+        for socket in self.output_node.inputs:
+            if socket.bl_idname == "cn_VectorSocket":
+                return socket
+        raise Exception("the output node has no vector socket for the new vertex positions")
+
+
+def evaluate_sockets(tree, input_arrays, required_sockets):
+    arrays = dict(input_arrays)
+    for node, socket in iter_all_unlinked_inputs(tree):
+        arrays[socket] = socket.array_from_property()
+
+    # same semantics as the compiled code: no exceptions, just inf and nan
+    with numpy.errstate(all = "ignore"):
+        for node in get_nodes_to_calculate(tree, required_sockets, arrays):
+            input_arrays = get_input_values(node, arrays)
+            output_arrays = node.execute_numpy(*input_arrays)
+
+            for socket, array in zip(node.outputs, output_arrays):
+                arrays[socket] = array
+
+    return [arrays[get_value_socket(socket, arrays)] for socket in required_sockets]
+
+def array_from_address(address, amount):
+    buffer = (c_float * (amount * 3)).from_address(address)
+    return numpy.ctypeslib.as_array(buffer).reshape(amount, 3)
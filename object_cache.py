@@ -0,0 +1,120 @@
+'''
+Compiled object code is cached by a key that combines the hash of the
+generated IR with the features of the cpu it has been compiled for.
+The code is stored on the trees as well, so that it is saved in the
+.blend file and does not have to be compiled again after loading.
+Code can be compiled while drivers are evaluated, where ID data must
+not be changed. So it is written to the trees on the next scene update
+(see write_pending_object_code).
+
+The cache in memory is limited to MAX_CODE_SIZE bytes, the least
+recently used code is removed first. Code that is embedded in a tree
+is decoded again when it is needed.
+'''
+
+import base64
+import hashlib
+from collections import OrderedDict, defaultdict
+from . lazy_imports import llvm
+from . utils.nodes import iter_compute_node_trees
+from . utils.compile_worker import get_host_cpu_features
+
+MAX_CODE_SIZE = 64 * 1024 * 1024
+
+object_code_by_key = OrderedDict()
+
+# tree hash -> {module name : (key, object code)} that has to be written to the tree
+pending_code_by_tree = defaultdict(dict)
+
+_cpu_key = None
+
+def get_cpu_key():
+    global _cpu_key
+    if _cpu_key is None:
+        parts = (llvm.get_default_triple(), llvm.get_host_cpu_name(), get_host_cpu_features())
+        _cpu_key = " ".join(parts)
+    return _cpu_key
+
+def get_module_key(ir_text, opt_level):
+    text = "{}\n{}\n{}".format(get_cpu_key(), opt_level, ir_text)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class TreeObjectCache:
+    '''
+    Callbacks for the object cache of the engine that belongs to a tree.
+    '''
+    def __init__(self, tree):
+        self.tree = tree
+        self.key_by_module_name = dict()
+        self.code_size_by_module_name = dict()
+
+    def register_module(self, module_name, key):
+        self.key_by_module_name[module_name] = key
+
+    def get_buffer(self, module):
+        key = self.key_by_module_name.get(module.name)
+        if key is None:
+            return None
+        buffer = load_object_code(self.tree, module.name, key)
+        if buffer is not None:
+            self.code_size_by_module_name[module.name] = len(buffer)
+        return buffer
+
+    def notify(self, module, buffer):
+        self.code_size_by_module_name[module.name] = len(buffer)
+        key = self.key_by_module_name.get(module.name)
+        if key is None:
+            return
+        store_object_code(self.tree, module.name, key, buffer)
+
+    def get_code_size(self):
+        '''Size of the object code of all modules in the engine.'''
+        return sum(self.code_size_by_module_name.values())
+
+
+def load_object_code(tree, module_name, key):
+    buffer = object_code_by_key.get(key)
+    if buffer is None:
+        buffer = get_pending_object_code(tree, module_name, key)
+    if buffer is None:
+        data = tree.get_compiled_code(module_name, key)
+        if data is None:
+            return None
+        buffer = decode_object_code(data)
+    add_object_code(key, buffer)
+    return buffer
+
+def store_object_code(tree, module_name, key, buffer):
+    add_object_code(key, buffer)
+    if tree.embed_compiled_code:
+        pending_code_by_tree[hash(tree)][module_name] = (key, buffer)
+
+def get_pending_object_code(tree, module_name, key):
+    pending_key, buffer = pending_code_by_tree.get(hash(tree), {}).get(module_name, (None, None))
+    return buffer if pending_key == key else None
+
+def write_pending_object_code():
+    '''Has to be called where ID data can be changed, e.g. on scene updates.'''
+    if len(pending_code_by_tree) == 0:
+        return
+    for tree in iter_compute_node_trees():
+        for module_name, (key, buffer) in pending_code_by_tree.get(hash(tree), {}).items():
+            if tree.embed_compiled_code:
+                tree.set_compiled_code(module_name, key, encode_object_code(buffer))
+    pending_code_by_tree.clear()
+
+def add_object_code(key, buffer):
+    object_code_by_key[key] = buffer
+    object_code_by_key.move_to_end(key)
+    code_size = sum(len(b) for b in object_code_by_key.values())
+    while code_size > MAX_CODE_SIZE and len(object_code_by_key) > 1:
+        _, removed_buffer = object_code_by_key.popitem(last = False)
+        code_size -= len(removed_buffer)
+
+
+def encode_object_code(buffer):
+    return base64.b64encode(buffer).decode("ascii")
+
+def decode_object_code(data):
+    return base64.b64decode(data.encode("ascii"))
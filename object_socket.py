@@ -1,4 +1,5 @@
 import bpy
+from . lazy_imports import numpy
 from bpy.props import *
 from llvmlite import ir
 from ctypes import c_float, c_void_p, c_size_t
@@ -15,6 +16,8 @@ class ObjectSocket(bpy.types.NodeSocket, BaseSocket):
                     ir.ArrayType(ir.FloatType(), 3)     # scale
                 ]).as_pointer()
     c_type = c_void_p
+    # buffers contain the object pointers
+    buffer_dtype = "uintp"
 
     value = PointerProperty(name = "Value", type = bpy.types.Object)
 
@@ -37,3 +40,31 @@ class ObjectSocket(bpy.types.NodeSocket, BaseSocket):
                 return object
 
         raise Exception("cannot find object")
+
+    def cvalue_from_value(self, value):
+        return None if value is None else value.as_pointer()
+
+    def array_from_property(self):
+        return self.array_from_values([self.value]).reshape(())
+
+    def array_from_values(self, values):
+        # numpy.array would try to iterate over the objects
+        array = numpy.empty(len(values), dtype = object)
+        array[:] = values
+        return array
+
+    def values_from_array(self, array, amount):
+        return numpy.broadcast_to(array, (amount, )).tolist()
+
+    def buffer_from_values(self, values):
+        if isinstance(values, numpy.ndarray) and values.dtype != object:
+            return numpy.ascontiguousarray(values, dtype = numpy.uintp)
+        return numpy.array([0 if v is None else v.as_pointer() for v in values], dtype = numpy.uintp)
+
+    def values_from_buffer(self, buffer):
+        objects_by_pointer = {object.as_pointer() : object for object in bpy.data.objects}
+        return [objects_by_pointer[pointer] if pointer != 0 else None for pointer in buffer.tolist()]
+
+    def fill_buffer(self, buffer, array):
+        values = numpy.broadcast_to(array, buffer.shape).reshape(-1).tolist()
+        buffer[...] = self.buffer_from_values(values).reshape(buffer.shape)
@@ -1,4 +1,5 @@
 import bpy
+from . lazy_imports import numpy
 from llvmlite import ir
 from . compute_node import ComputeNode
 
@@ -12,27 +13,51 @@ class ObjectTransformsNode(bpy.types.Node, ComputeNode):
         self.outputs.new("cn_VectorSocket", "Scale", "scale")
 
     def create_llvm_ir(self, builder, object_p):
-        vector_type = ir.ArrayType(ir.FloatType(), 3)
         pointer_value = builder.ptrtoint(object_p, ir.IntType(64))
         zero = ir.IntType(64)(0)
         is_not_zero = builder.icmp_unsigned("!=", pointer_value, zero)
-        with builder.if_else(is_not_zero) as (then, otherwise):
-            with then:
-                then_block = builder.block
-                object = builder.load(object_p)
-                _location = builder.extract_value(object, 1)
-                _scale = builder.extract_value(object, 3)
-            with otherwise:
-                else_block = builder.block
-                _default_location = vector_type([0, 0, 0])
-                _default_scale = vector_type([1, 1, 1])
-
-        location = builder.phi(vector_type)
-        location.add_incoming(_location, then_block)
-        location.add_incoming(_default_location, else_block)
-
-        scale = builder.phi(vector_type)
-        scale.add_incoming(_scale, then_block)
-        scale.add_incoming(_default_scale, else_block)
 
+        if builder.branchless:
+            # the object is loaded in any case, so it must never be a null pointer
+            fallback_p = get_fallback_object(builder.module, object_p.type.pointee)
+            object_p = builder.select(is_not_zero, object_p, fallback_p)
+
+        def load_transforms():
+            location = load_vector_field(builder, object_p, 1)
+            scale = load_vector_field(builder, object_p, 3)
+            return location, scale
+
+        def default_transforms():
+            return builder.vector_constant([0, 0, 0]), builder.vector_constant([1, 1, 1])
+
+        location, scale = builder.choose(is_not_zero, load_transforms, default_transforms)
         return builder, location, scale
+
+    def create_python_code(self, object):
+        return "object_location({})".format(object), "object_scale({})".format(object)
+
+    def execute_numpy(self, objects):
+        transforms = [get_object_transforms(object) for object in objects.flat]
+        shape = objects.shape + (3, )
+        location = numpy.array([t[0] for t in transforms], dtype = numpy.float32).reshape(shape)
+        scale = numpy.array([t[1] for t in transforms], dtype = numpy.float32).reshape(shape)
+        return location, scale
+
+def get_object_transforms(object):
+    if object is None:
+        return (0, 0, 0), (1, 1, 1)
+    return tuple(object.location), tuple(object.scale)
+
+def load_vector_field(builder, object_p, index):
+    i32 = ir.IntType(32)
+    field_p = builder.gep(object_p, [i32(0), i32(index)])
+    return builder.vector_from_array(builder.load(field_p))
+
+def get_fallback_object(module, object_type):
+    name = "fallback object"
+    if name not in module.globals:
+        variable = ir.GlobalVariable(module, object_type, name)
+        variable.initializer = ir.Constant(object_type, None)
+        variable.linkage = "internal"
+        variable.global_constant = True
+    return module.globals[name]
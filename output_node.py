@@ -9,3 +9,6 @@ class OutputNode(bpy.types.Node, NodeBase):
         self.inputs.new("cn_FloatSocket", "Output 1", "out1")
         self.inputs.new("cn_VectorSocket", "Output 2", "out2")
         self.inputs.new("cn_ObjectSocket", "Output 3", "out3")
+
+    def draw(self, layout):
+        layout.prop(self.id_data, "driver_function")
@@ -0,0 +1,226 @@
+'''
+Evaluates trees with generated Python code. For trees with only a few
+nodes compiling the source takes less than a millisecond, while LLVM
+needs much longer than the tree will ever run.
+
+Every node provides a create_python_code method. It gets the variable
+names of the inputs and returns one Python expression per output, or a
+single expression that evaluates to a tuple with all outputs. The
+expressions can use everything in python_functions and the functions
+of called trees (see tree_call_node.py). The inputs and
+the result of every node are rounded to single precision, so that the
+results match the other backends, which compute with 32 bit floats.
+
+The generated function for a tree looks like this:
+    def evaluate(input_0, input_1, parameter_0, parameter_1, ...):
+        input_0 = float32(input_0)
+        value_0 = float32(...)
+        value_1 = vector_float32(...)
+        return (value_1, ...)
+Parameters are the values of unlinked sockets, which are passed in on
+every call, so that changing them does not require new code. Node
+parameters that are runtime data (see node_parameters.py) select one of
+the generated functions instead.
+'''
+
+from ctypes import c_float
+from . import python_functions
+from . execution import find_interface_nodes, get_value_socket, get_input_values, OutputBuffers
+from . tree_info import (iter_all_unlinked_inputs, get_nodes_to_calculate,
+                         get_runtime_parameter_nodes, get_nodes_by_type)
+from . frame_range import get_frame_input_sockets, create_frame_range_wrapper
+
+class PythonExecutionData:
+    '''Provides the same functions as TreeExecutionData.'''
+    def __init__(self, tree):
+        self.tree = tree
+        self.input_node, self.output_node, self.vertex_input_node = find_interface_nodes(tree)
+        self.parameter_sockets = [socket for node, socket in iter_all_unlinked_inputs(tree)]
+
+        self.py_function = None
+        self.py_batch_function = None
+        self.py_vertex_function = None
+        self.py_frame_range_function = None
+        self.python_functions = dict()
+        self.called_functions = None
+
+    def get_function(self):
+        if self.py_function is None:
+            input_sockets = self.get_all_input_sockets()
+            output_sockets = self.get_all_output_sockets()
+            output_buffers = OutputBuffers(output_sockets, single = True)
+
+            def pywrapper(*args, out = None, view = False):
+                if len(args) != len(input_sockets):
+                    raise Exception("wrong argument amount")
+                function = self.get_python_function(input_sockets, output_sockets)
+                results = function(*args, *self.get_parameters())
+                if out is not None or view:
+                    outputs, _ = output_buffers.get(1, out)
+                    for socket, buffer, value in zip(output_sockets, outputs, results):
+                        socket.fill_buffer(buffer, socket.array_from_values([value]).reshape(buffer.shape))
+                    return outputs
+                return tuple(socket.value_from_python(value)
+                             for socket, value in zip(output_sockets, results))
+
+            self.py_function = pywrapper
+
+        return self.py_function
+
+    def get_batch_function(self):
+        if self.py_batch_function is None:
+            self.py_batch_function = self.create_batch_function(self.get_all_input_sockets())
+        return self.py_batch_function
+
+    def get_frame_range_function(self):
+        if self.py_frame_range_function is None:
+            input_sockets = self.get_all_input_sockets() + get_frame_input_sockets(self.tree)
+            batch_function = self.create_batch_function(input_sockets)
+            self.py_frame_range_function = create_frame_range_wrapper(self.tree, batch_function)
+        return self.py_frame_range_function
+
+    def create_batch_function(self, input_sockets):
+        output_sockets = self.get_all_output_sockets()
+        output_buffers = OutputBuffers(output_sockets)
+
+        def pywrapper(amount, *args, out = None, view = False):
+            """
+            Every argument is a sequence with one value per element.
+            Returns one list with `amount` values per output socket.
+            """
+            if len(args) != len(input_sockets):
+                raise Exception("wrong argument amount")
+            if any(len(values) != amount for values in args):
+                raise Exception("wrong element amount")
+
+            function = self.get_python_function(input_sockets, output_sockets)
+            parameters = self.get_parameters()
+            if len(args) == 0:
+                results = [function(*parameters)] * amount
+            else:
+                results = [function(*values, *parameters) for values in zip(*args)]
+            if out is not None or view:
+                outputs, _ = output_buffers.get(amount, out)
+                for i, (socket, buffer) in enumerate(zip(output_sockets, outputs)):
+                    socket.fill_buffer(buffer, socket.array_from_values([values[i] for values in results]))
+                return outputs
+            return tuple([socket.value_from_python(values[i]) for values in results]
+                         for i, socket in enumerate(output_sockets))
+
+        return pywrapper
+
+    def get_vertex_function(self):
+        if self.py_vertex_function is None:
+            if self.vertex_input_node is None:
+                raise Exception("the tree has no vertex input node")
+            input_sockets = list(self.vertex_input_node.outputs)
+            output_sockets = [self.get_vertex_output_socket()]
+
+            def pywrapper(amount, positions_address, results_address, threads = None):
+                """
+                The addresses point to contiguous arrays of `amount` float triples.
+                The generated code holds the GIL, so threads is ignored.
+                """
+                positions = (c_float * (amount * 3)).from_address(positions_address)
+                results = (c_float * (amount * 3)).from_address(results_address)
+                function = self.get_python_function(input_sockets, output_sockets)
+                parameters = self.get_parameters()
+                for i in range(0, amount * 3, 3):
+                    position = (positions[i], positions[i + 1], positions[i + 2])
+                    results[i:i + 3] = function(position, *parameters)[0]
+
+            self.py_vertex_function = pywrapper
+
+        return self.py_vertex_function
+
+    def dispose(self):
+        pass
+
+    def get_statistics(self):
+        return {"engines" : 0, "code_bytes" : 0}
+
+    def get_python_function(self, input_sockets, output_sockets):
+        # the code is generated again when a called tree got a new function
+        called_functions = self.get_called_functions()
+        if called_functions != self.called_functions:
+            self.python_functions.clear()
+            self.called_functions = called_functions
+        key = (tuple(input_sockets), tuple(output_sockets), self.get_runtime_parameter_values())
+        if key not in self.python_functions:
+            self.python_functions[key] = self.create_python_function(input_sockets, output_sockets)
+        return self.python_functions[key]
+
+    def get_runtime_parameter_values(self):
+        return tuple(getattr(node, name) for node in get_runtime_parameter_nodes(self.tree)
+                     for name in node.enum_parameters)
+
+    def get_called_functions(self):
+        functions = dict()
+        for node in get_nodes_by_type(self.tree, "cn_TreeCallNode"):
+            functions.update(node.iter_python_functions())
+        return functions
+
+    def create_python_function(self, input_sockets, output_sockets):
+        source = generate_python_source("evaluate", input_sockets, output_sockets, self.parameter_sockets)
+        namespace = dict(vars(python_functions))
+        namespace.update(self.called_functions)
+        exec(compile(source, "<compute tree '{}'>".format(self.tree.name), "exec"), namespace)
+        return namespace["evaluate"]
+
+    def get_parameters(self):
+        return [socket.get_property_value() for socket in self.parameter_sockets]
+
+    def get_all_input_sockets(self):
+        return list(getattr(self.input_node, "outputs", []))
+
+    def get_all_output_sockets(self):
+        return list(self.output_node.inputs)
+
+    def get_vertex_output_socket(self):
+        for socket in self.output_node.inputs:
+            if socket.bl_idname == "cn_VectorSocket":
+                return socket
+        raise Exception("the output node has no vector socket for the new vertex positions")
+
+    def print_source(self):
+        print(generate_python_source("evaluate", self.get_all_input_sockets(),
+                                     self.get_all_output_sockets(), self.parameter_sockets))
+
+
+# names of the functions in python_functions that round values of a socket type to single precision
+float32_functions = {
+    "cn_FloatSocket" : "float32",
+    "cn_VectorSocket" : "vector_float32"
+}
+
+def generate_python_source(function_name, input_sockets, output_sockets, parameter_sockets):
+    variables = dict()
+    arguments = []
+    lines = []
+    for prefix, sockets in (("input", input_sockets), ("parameter", parameter_sockets)):
+        for i, socket in enumerate(sockets):
+            variables[socket] = "{}_{}".format(prefix, i)
+            arguments.append(variables[socket])
+            if socket.bl_idname in float32_functions:
+                lines.append("{0} = {1}({0})".format(variables[socket], float32_functions[socket.bl_idname]))
+
+    tree = output_sockets[0].id_data
+    for node in get_nodes_to_calculate(tree, output_sockets, variables):
+        input_variables = get_input_values(node, variables)
+        expressions = node.create_python_code(*input_variables)
+        if isinstance(expressions, str):
+            # evaluated once, the outputs are the items of the tuple
+            variable = "result_{}".format(len(lines))
+            lines.append("{} = {}".format(variable, expressions))
+            expressions = tuple("{}[{}]".format(variable, i) for i in range(len(node.outputs)))
+
+        for socket, expression in zip(node.outputs, expressions):
+            if socket.bl_idname in float32_functions:
+                expression = "{}({})".format(float32_functions[socket.bl_idname], expression)
+            variables[socket] = "value_{}".format(len(lines))
+            lines.append("{} = {}".format(variables[socket], expression))
+
+    outputs = [variables[get_value_socket(s, variables)] for s in output_sockets]
+    lines.append("return ({}, )".format(", ".join(outputs)))
+    return "def {}({}):\n{}\n".format(function_name, ", ".join(arguments),
+                                      "\n".join("    " + line for line in lines))
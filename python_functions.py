@@ -0,0 +1,143 @@
+'''
+Functions that can be used by the Python code generated for a tree.
+They behave like the compiled code: no exceptions, just inf and nan.
+Vectors are tuples with three floats.
+'''
+
+import math
+from ctypes import c_float
+from . frame_input_node import get_current_frame, get_current_time
+
+inf = math.inf
+nan = math.nan
+
+# Precision
+##########################################
+
+def float32(a):
+    '''Rounds to the nearest single precision float, too large values become inf.'''
+    return c_float(a).value
+
+def vector_float32(a):
+    return (c_float(a[0]).value, c_float(a[1]).value, c_float(a[2]).value)
+
+
+# Float Math
+##########################################
+
+def safe_divide(a, b):
+    # nan is not a valid divisor either, like the ordered comparison in the compiled code
+    return a / b if b != 0 and b == b else 0.0
+
+def sine(a):
+    return math.sin(a) if math.isfinite(a) else nan
+
+def cosine(a):
+    return math.cos(a) if math.isfinite(a) else nan
+
+def power(a, b):
+    '''Special cases like C pow, which is used by the compiled code.'''
+    try: return math.pow(a, b)
+    except ValueError:
+        if a == 0 and b < 0:
+            return math.copysign(inf, a) if is_odd_integer(b) else inf
+        return nan
+    except OverflowError:
+        return -inf if a < 0 and is_odd_integer(b) else inf
+
+def is_odd_integer(a):
+    return math.isfinite(a) and float(a).is_integer() and a % 2 == 1
+
+def square_root(a):
+    return math.sqrt(a) if a >= 0 else nan
+
+def exponential(a):
+    try: return math.exp(a)
+    except OverflowError: return inf
+
+def logarithm(a):
+    if a > 0: return math.log(a)
+    if a == 0: return -inf
+    return nan
+
+def minimum(a, b):
+    if a != a: return b
+    if b != b: return a
+    return min(a, b)
+
+def maximum(a, b):
+    if a != a: return b
+    if b != b: return a
+    return max(a, b)
+
+def round_down(a):
+    # the sign is kept for zero results, e.g. floor(-0.0) is -0.0
+    return math.copysign(math.floor(a), a) if math.isfinite(a) else a
+
+def round_up(a):
+    # ceil(-0.5) is -0.0
+    return math.copysign(math.ceil(a), a) if math.isfinite(a) else a
+
+
+# Vector Math
+##########################################
+
+def vector_add(a, b, factor):
+    return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+
+def vector_subtract(a, b, factor):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+def vector_scale(a, b, factor):
+    return (a[0] * factor, a[1] * factor, a[2] * factor)
+
+def vector_dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def vector_cross(a, b, factor):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+def vector_length(a, b):
+    return math.sqrt(vector_dot(a, a))
+
+def vector_normalize(a, b, factor):
+    # scaled with the inverse length like in the compiled code
+    length = vector_length(a, None)
+    inverse_length = 1 / length if length != 0 and length == length else 0.0
+    return vector_scale(a, None, inverse_length)
+
+def vector_distance(a, b):
+    return vector_length(vector_subtract(a, b, None), None)
+
+def vector_lerp(a, b, factor):
+    return (a[0] + (b[0] - a[0]) * factor,
+            a[1] + (b[1] - a[1]) * factor,
+            a[2] + (b[2] - a[2]) * factor)
+
+def vector_reflect(a, b, factor):
+    normal = vector_normalize(b, None, None)
+    double_dot = 2 * vector_dot(a, normal)
+    return vector_subtract(a, vector_scale(normal, None, double_dot), None)
+
+
+# Objects
+##########################################
+
+def object_location(object):
+    return (0.0, 0.0, 0.0) if object is None else tuple(object.location)
+
+def object_scale(object):
+    return (1.0, 1.0, 1.0) if object is None else tuple(object.scale)
+
+
+# Frame
+##########################################
+
+def current_frame():
+    return get_current_frame()
+
+def current_time():
+    return get_current_time()
+
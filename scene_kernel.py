@@ -0,0 +1,201 @@
+'''
+Compiles all trees that are used by tree contexts into one module, so
+that a scene update needs only one call into compiled code and LLVM can
+optimize across the trees.
+
+Every tree gets its own module with a batch function and its globals,
+whose names are prefixed to be unique. The modules are linked into the
+scene module, which has a single entry point:
+    void SceneUpdate(i32* amounts, i8** arrays)
+`amounts` contains the amount of contexts per tree. `arrays` contains
+for every tree the input arrays, the array for the first output and an
+array of object pointers. When the first output is a vector, it is
+also stored as location of the objects that are not null. Trees are
+called in dependency order, so trees that read the location of an
+object see the new value already.
+'''
+
+from . lazy_imports import numpy
+from llvmlite import ir
+from . lazy_imports import llvm
+from ctypes import CFUNCTYPE, c_void_p
+from . object_socket import ObjectSocket
+from . tree_info import get_tree_info
+from . utils.compile_worker import create_target_machine, optimize_module
+from . execution import (find_interface_nodes, insert_batch_function, iter_global_inputs,
+                         OutputBuffers, BATCH_OPT_LEVEL)
+
+# high enough to inline the batch functions of all trees
+INLINING_THRESHOLD = 1000
+
+class SceneKernel:
+    def __init__(self, trees):
+        self.trees = list(trees)
+        self.tree_infos = [get_tree_info(tree) for tree in self.trees]
+        self.tree_kernels = [TreeKernel(tree, "tree {} ".format(i)) for i, tree in enumerate(self.trees)]
+        self._compile()
+        self.global_addresses = None
+
+    def _compile(self):
+        self.target_machine = create_target_machine()
+        module = llvm.parse_assembly(str(generate_scene_module(self.tree_kernels)))
+        for tree_kernel in self.tree_kernels:
+            tree_module = llvm.parse_assembly(str(tree_kernel.generate_module()))
+            module.link_in(tree_module)
+            # only used by SceneUpdate, can be removed after inlining
+            module.get_function(tree_kernel.function_name).linkage = "internal"
+        module.verify()
+        optimize_module(module, BATCH_OPT_LEVEL, self.target_machine, INLINING_THRESHOLD)
+
+        self.module = module
+        self.engine = llvm.create_mcjit_compiler(module, self.target_machine)
+        self.engine.finalize_object()
+        address = self.engine.get_function_address("SceneUpdate")
+        self.function = CFUNCTYPE(None, c_void_p, c_void_p)(address)
+
+    def is_valid_for(self, trees):
+        '''The kernel has to be recompiled when a tree or the order of the trees changes.'''
+        trees = list(trees)
+        return (trees == self.trees and
+            all(get_tree_info(tree) is info for tree, info in zip(trees, self.tree_infos)))
+
+    def execute(self, contexts_by_tree):
+        '''
+        Returns the values of the first output per tree,
+        with one value per context.
+        '''
+        amounts = numpy.array([len(contexts_by_tree[tree]) for tree in self.trees], dtype = numpy.int32)
+        buffers = []
+        for tree_kernel in self.tree_kernels:
+            buffers.extend(tree_kernel.prepare_buffers(contexts_by_tree[tree_kernel.tree]))
+        addresses = numpy.array([buffer.ctypes.data for buffer in buffers], dtype = numpy.uintp)
+
+        self.update_globals()
+        self.function(amounts.ctypes.data, addresses.ctypes.data)
+        return [tree_kernel.get_results() for tree_kernel in self.tree_kernels]
+
+    def update_globals(self):
+        if self.global_addresses is None:
+            self.global_addresses = [
+                (value, self.engine.get_global_value_address(name))
+                for tree_kernel in self.tree_kernels
+                for value, name in tree_kernel.iter_global_names()]
+
+        for value, address in self.global_addresses:
+            value.update_at_address(address)
+
+    def print_module(self):
+        print(self.module)
+
+
+class TreeKernel:
+    def __init__(self, tree, prefix):
+        self.tree = tree
+        self.prefix = prefix
+        self.function_name = prefix + "Batch"
+
+        input_node, output_node, _ = find_interface_nodes(tree)
+        self.input_sockets = list(getattr(input_node, "outputs", []))
+        self.output_socket = output_node.inputs[0]
+        self.sets_location = self.output_socket.bl_idname == "cn_VectorSocket"
+        self.output_buffers = OutputBuffers([self.output_socket])
+
+    def get_global_name(self, name):
+        return self.prefix + name
+
+    def iter_global_names(self):
+        for node, value, name in iter_global_inputs(self.tree):
+            yield value, self.get_global_name(name)
+
+    def generate_module(self):
+        module = ir.Module(self.prefix + "module")
+        for value, name in self.iter_global_names():
+            # not internal, so that the optimizer does not assume constant values
+            variable = ir.GlobalVariable(module, value.ir_type, name)
+            variable.initializer = ir.Constant(value.ir_type, None)
+        insert_batch_function(module, self.function_name, self.input_sockets, [self.output_socket],
+                              get_global_name = self.get_global_name)
+        return module
+
+    def get_array_types(self):
+        types = [s.ir_type.as_pointer() for s in self.input_sockets + [self.output_socket]]
+        return types + [ObjectSocket.ir_type.as_pointer()]
+
+    def prepare_buffers(self, contexts):
+        input_values = [item.get_input_values(object) for object, item in contexts]
+        if any(len(values) != len(self.input_sockets) for values in input_values):
+            raise Exception("wrong argument amount")
+        input_arrays = list(zip(*input_values)) or [[]] * len(self.input_sockets)
+        input_buffers = [s.buffer_from_values(values) for s, values in zip(self.input_sockets, input_arrays)]
+
+        (self.output_buffer, ), _ = self.output_buffers.get(len(contexts))
+        objects = numpy.array([object.as_pointer() if self.sets_location and item.path == "location" else 0
+                               for object, item in contexts], dtype = numpy.uintp)
+        return input_buffers + [self.output_buffer, objects]
+
+    def get_results(self):
+        return self.output_socket.values_from_buffer(self.output_buffer)
+
+
+def generate_scene_module(tree_kernels):
+    i32 = ir.IntType(32)
+    byte_pointer = ir.IntType(8).as_pointer()
+
+    module = ir.Module("scene module")
+    function_type = ir.FunctionType(ir.VoidType(), [i32.as_pointer(), byte_pointer.as_pointer()])
+    function = ir.Function(module, function_type, name = "SceneUpdate")
+    amounts, arrays = function.args
+
+    builder = ir.IRBuilder(function.append_basic_block("entry"))
+    array_index = 0
+    for i, tree_kernel in enumerate(tree_kernels):
+        array_types = tree_kernel.get_array_types()
+        batch_type = ir.FunctionType(ir.VoidType(), [i32] + array_types[:-1])
+        batch_function = ir.Function(module, batch_type, name = tree_kernel.function_name)
+
+        amount = builder.load(builder.gep(amounts, [i32(i)]))
+        tree_arrays = []
+        for array_type in array_types:
+            pointer = builder.load(builder.gep(arrays, [i32(array_index)]))
+            tree_arrays.append(builder.bitcast(pointer, array_type))
+            array_index += 1
+
+        builder.call(batch_function, [amount] + tree_arrays[:-1])
+        if tree_kernel.sets_location:
+            insert_location_stores(builder, amount, tree_arrays[-2], tree_arrays[-1])
+
+    builder.ret_void()
+    return module
+
+def insert_location_stores(builder, amount, locations, objects):
+    i32 = ir.IntType(32)
+    entry_block = builder.block
+    condition_block = builder.append_basic_block("condition")
+    body_block = builder.append_basic_block("body")
+    exit_block = builder.append_basic_block("exit")
+    builder.branch(condition_block)
+
+    builder.position_at_end(condition_block)
+    index = builder.phi(i32, name = "index")
+    index.add_incoming(i32(0), entry_block)
+    builder.cbranch(builder.icmp_signed("<", index, amount), body_block, exit_block)
+
+    builder.position_at_end(body_block)
+    object_p = builder.load(builder.gep(objects, [index]))
+    with builder.if_then(builder.icmp_unsigned("!=", object_p, ir.Constant(object_p.type, None))):
+        location = builder.load(builder.gep(locations, [index]))
+        builder.store(location, builder.gep(object_p, [i32(0), i32(1)]))
+    next_index = builder.add(index, i32(1))
+    index.add_incoming(next_index, builder.block)
+    builder.branch(condition_block)
+
+    builder.position_at_end(exit_block)
+
+
+_scene_kernel = None
+
+def get_scene_kernel(trees):
+    global _scene_kernel
+    if _scene_kernel is None or not _scene_kernel.is_valid_for(trees):
+        _scene_kernel = SceneKernel(trees)
+    return _scene_kernel
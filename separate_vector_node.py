@@ -1,5 +1,4 @@
 import bpy
-from llvmlite import ir
 from . compute_node import ComputeNode
 
 class SeparateVectorNode(bpy.types.Node, ComputeNode):
@@ -13,7 +12,11 @@ class SeparateVectorNode(bpy.types.Node, ComputeNode):
         self.outputs.new("cn_FloatSocket", "Z", "z")
 
     def create_llvm_ir(self, builder, vector):
-        x = builder.extract_value(vector, 0)
-        y = builder.extract_value(vector, 1)
-        z = builder.extract_value(vector, 2)
+        x, y, z = builder.separate_vector(vector)
         return builder, x, y, z
+
+    def create_python_code(self, vector):
+        return tuple("{}[{}]".format(vector, i) for i in range(3))
+
+    def execute_numpy(self, vector):
+        return vector[..., 0], vector[..., 1], vector[..., 2]
@@ -0,0 +1,80 @@
+'''
+Accessing nodes and sockets through RNA is slow from Python. Instead of
+the Blender objects, compilation and parameter upload work with these
+snapshots, which are created once per tree update.
+
+Attributes of a snapshot are read from the Blender object only the
+first time they are used, afterwards they are plain Python attributes.
+Methods of the node and socket classes are called with the snapshot as
+self, so `self.operation` inside create_llvm_ir does not touch RNA.
+
+Socket values can change without a tree update. They are captured for
+all input sockets at once on every update with update_values. The same
+happens for node parameters that are runtime data (see node_parameters.py).
+'''
+
+import inspect
+from array import array
+from types import MethodType
+
+class AttributeSnapshot:
+    def __getattr__(self, name):
+        # only called when the attribute is not cached yet
+        source = self.__dict__["source"]
+        function = getattr(type(source), name, None)
+        if inspect.isfunction(function):
+            return MethodType(function, self)
+        value = getattr(source, name)
+        self.__dict__[name] = value
+        return value
+
+
+class NodeSnapshot(AttributeSnapshot):
+    def __init__(self, node, tree):
+        self.source = node
+        self.id_data = tree
+        self.name = node.name
+        self.bl_idname = node.bl_idname
+        self.has_runtime_parameters = False
+        self.inputs = SocketSnapshotList(SocketSnapshot(socket, self, False) for socket in node.inputs)
+        self.outputs = SocketSnapshotList(SocketSnapshot(socket, self, True) for socket in node.outputs)
+
+    def update_values(self):
+        if self.has_runtime_parameters:
+            for name in self.enum_parameters:
+                self.__dict__[name] = getattr(self.source, name)
+        if len(self.inputs) == 0:
+            return
+        if all(socket.bl_idname == "cn_FloatSocket" for socket in self.inputs):
+            values = array("f", [0]) * len(self.inputs)
+            self.source.inputs.foreach_get("value", values)
+        else:
+            values = [socket.source.get_property_value() for socket in self.inputs]
+        for socket, value in zip(self.inputs, values):
+            socket.value = value
+
+    def __repr__(self):
+        return "<NodeSnapshot '{}'>".format(self.name)
+
+class SocketSnapshot(AttributeSnapshot):
+    def __init__(self, socket, node, is_output):
+        self.source = socket
+        self.node = node
+        self.id_data = node.id_data
+        self.is_output = is_output
+        self.name = socket.name
+        self.identifier = socket.identifier
+        self.bl_idname = socket.bl_idname
+
+    def __repr__(self):
+        return "<SocketSnapshot '{}' of '{}'>".format(self.identifier, self.node.name)
+
+class SocketSnapshotList(list):
+    '''Sockets can be accessed by index, identifier or name like in Blender.'''
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            for socket in self:
+                if socket.identifier == key or socket.name == key:
+                    return socket
+            raise KeyError(key)
+        return super().__getitem__(key)
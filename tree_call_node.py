@@ -0,0 +1,227 @@
+'''
+Calls another compute tree. The sockets of the node mirror the input
+and output node of the called tree.
+
+Small trees are inlined, their nodes are generated directly into the
+code of the calling tree. Larger trees are compiled once into a "Call"
+function that is shared by all callers. The address of this function
+is uploaded to a global like the socket values, so the calling code
+does not depend on where the called tree has been compiled to.
+
+The unlinked sockets of inlined trees become globals of the calling
+tree, prefixed with the name of the called tree.
+
+The Python code of the calling tree calls the function of the called
+tree once per node and takes all outputs from its result. The function
+is bound to a name when the code is generated.
+'''
+
+import bpy
+from bpy.props import *
+from llvmlite import ir
+from ctypes import c_void_p
+from . compute_node import ComputeNode
+from . numpy_backend import evaluate_sockets
+from . tree_info import iter_all_unlinked_inputs, get_nodes_by_type, get_nodes_to_calculate
+from . utils.nodes import iter_compute_node_trees
+from . execution import (find_interface_nodes, insert_code_to_calculate_sockets,
+                         iter_global_inputs_recursive, get_global_input_name, validify_name)
+
+# trees with more nodes are called instead of inlined
+INLINE_NODE_LIMIT = 16
+
+class TreeCallNode(bpy.types.Node, ComputeNode):
+    bl_idname = "cn_TreeCallNode"
+    bl_label = "Tree Call"
+
+    def is_compute_tree(self, tree):
+        return tree.bl_idname == "cn_ComputeNodeTree"
+
+    def treeChanged(self, context):
+        self.sync_sockets()
+        # the interface might be the same, but the code has to call the new tree
+        self.id_data.update()
+
+    def callModeChanged(self, context):
+        self.id_data.update()
+
+    tree = PointerProperty(name = "Tree", type = bpy.types.NodeTree,
+        poll = is_compute_tree, update = treeChanged)
+
+    call_mode = EnumProperty(name = "Call Mode", default = "AUTO", update = callModeChanged,
+        items = [
+            ("AUTO", "Auto", "Inline small trees, call larger trees", "NONE", 0),
+            ("INLINE", "Inline", "Generate the nodes of the tree into the calling tree", "NONE", 1),
+            ("CALL", "Call", "Call the compiled function of the tree", "NONE", 2)])
+
+    def draw(self, layout):
+        layout.prop(self, "tree", text = "")
+        layout.prop(self, "call_mode", text = "")
+
+    def sync_sockets(self):
+        input_descriptions, output_descriptions = get_interface_descriptions(self.tree)
+        for sockets, descriptions in ((self.inputs, input_descriptions), (self.outputs, output_descriptions)):
+            if [describe_socket(socket) for socket in sockets] != descriptions:
+                sockets.clear()
+                for idname, name, identifier in descriptions:
+                    sockets.new(idname, name, identifier)
+
+    def get_called_tree(self):
+        if self.tree is None:
+            return None
+        if self.tree == self.id_data or self.id_data in iter_called_trees(self.tree):
+            raise Exception("recursive tree calls are not supported ('{}')".format(self.tree.name))
+        return self.tree
+
+    def should_inline(self):
+        if self.call_mode != "AUTO":
+            return self.call_mode == "INLINE"
+        input_sockets, output_sockets = get_interface_sockets(self.tree)
+        return len(get_nodes_to_calculate(self.tree, output_sockets, input_sockets)) <= INLINE_NODE_LIMIT
+
+    def iter_global_inputs(self):
+        tree = self.get_called_tree()
+        if tree is None:
+            return
+        if self.should_inline():
+            yield from iter_global_inputs_recursive(tree, get_inline_prefix(tree))
+        else:
+            yield self, CalledTreeFunction(tree), get_function_global_name(tree)
+
+    def iter_python_functions(self):
+        '''Yields (name, function) for the names used by the Python code.'''
+        tree = self.get_called_tree()
+        if tree is not None:
+            yield get_python_function_name(tree), tree.get_function()
+
+    def create_llvm_ir(self, builder, *inputs):
+        tree = self.get_called_tree()
+        if tree is None:
+            return (builder, )
+
+        input_sockets, output_sockets = get_interface_sockets(tree)
+        if self.should_inline():
+            vregisters = dict(zip(input_sockets, inputs))
+            prefix = get_inline_prefix(tree)
+            for node, socket in iter_all_unlinked_inputs(tree):
+                vregisters[socket] = builder.global_inputs[prefix + get_global_input_name(node, socket)]
+            builder = insert_code_to_calculate_sockets(output_sockets, builder, vregisters)
+            outputs = [vregisters[socket] for socket in output_sockets]
+        else:
+            function_p = builder.global_inputs[get_function_global_name(tree)]
+            arguments = [s.from_register(builder, v) for s, v in zip(input_sockets, inputs)]
+            output_pointers = insert_entry_allocas(builder, [s.ir_type for s in output_sockets])
+            builder.call(function_p, arguments + output_pointers)
+            outputs = [s.to_register(builder, builder.load(p)) for s, p in zip(output_sockets, output_pointers)]
+
+        return (builder, *outputs)
+
+    def create_python_code(self, *inputs):
+        tree = self.get_called_tree()
+        if tree is None:
+            return ()
+        # one expression for all outputs, so that the tree is evaluated only once
+        return "{}({})".format(get_python_function_name(tree), ", ".join(inputs))
+
+    def execute_numpy(self, *inputs):
+        tree = self.get_called_tree()
+        if tree is None:
+            return ()
+        input_sockets, output_sockets = get_interface_sockets(tree)
+        return evaluate_sockets(tree, dict(zip(input_sockets, inputs)), output_sockets)
+
+
+class CalledTreeFunction:
+    '''The address of the shared Call function of a tree, uploaded like a socket value.'''
+    def __init__(self, tree):
+        self.tree = tree
+        input_sockets, output_sockets = get_interface_sockets(tree)
+        input_types = [s.ir_type for s in input_sockets]
+        output_pointer_types = [s.ir_type.as_pointer() for s in output_sockets]
+        self.ir_type = ir.FunctionType(ir.VoidType(), input_types + output_pointer_types).as_pointer()
+
+    def to_register(self, builder, value):
+        return value
+
+    def update_at_address(self, address):
+        execution_data = self.tree.get_llvm_execution_data()
+        function_address = execution_data.get_call_address()
+        execution_data.update_globals()
+        c_void_p.from_address(address).value = function_address
+
+
+def get_interface_sockets(tree):
+    input_node, output_node, _ = find_interface_nodes(tree)
+    return list(getattr(input_node, "outputs", [])), list(output_node.inputs)
+
+def get_interface_descriptions(tree):
+    input_descriptions, output_descriptions = [], []
+    if tree is not None:
+        for node in tree.nodes:
+            if node.bl_idname == "cn_InputNode":
+                input_descriptions = [describe_socket(socket) for socket in node.outputs]
+            elif node.bl_idname == "cn_OutputNode":
+                output_descriptions = [describe_socket(socket) for socket in node.inputs]
+    return input_descriptions, output_descriptions
+
+def describe_socket(socket):
+    return (socket.bl_idname, socket.name, socket.identifier)
+
+def get_inline_prefix(tree):
+    return validify_name(tree.name) + "/"
+
+def get_function_global_name(tree):
+    return "call " + validify_name(tree.name)
+
+def get_python_function_name(tree):
+    # the hex encoding is a valid identifier for every tree name
+    return "call_tree_" + tree.name.encode().hex()
+
+def insert_entry_allocas(builder, types):
+    # allocas in the entry block are only executed once, also in loops
+    block = builder.block
+    builder.position_at_start(builder.function.entry_basic_block)
+    pointers = [builder.alloca(t) for t in types]
+    builder.position_at_end(block)
+    return pointers
+
+def is_called_without_inlining(tree):
+    '''True when another tree calls the shared Call function of the tree.'''
+    for caller in iter_compute_node_trees():
+        for node in get_nodes_by_type(caller, "cn_TreeCallNode"):
+            if node.tree == tree and caller != tree and not node.should_inline():
+                return True
+    return False
+
+def iter_called_trees(tree):
+    '''All trees that are called by the tree, directly or indirectly.'''
+    found = set()
+    trees_to_check = [tree]
+    while len(trees_to_check) > 0:
+        for node in get_nodes_by_type(trees_to_check.pop(), "cn_TreeCallNode"):
+            if node.tree is not None and node.tree not in found:
+                found.add(node.tree)
+                trees_to_check.append(node.tree)
+    return found
+
+
+_updating_trees = set()
+
+def update_calling_trees(tree):
+    '''
+    Call nodes of the tree get the new interface, and the trees that
+    contain them are updated as well, which continues up the call graph.
+    '''
+    if hash(tree) in _updating_trees:
+        return
+    _updating_trees.add(hash(tree))
+    try:
+        for caller in iter_compute_node_trees():
+            call_nodes = [node for node in caller.nodes
+                          if node.bl_idname == "cn_TreeCallNode" and node.tree == tree]
+            if len(call_nodes) > 0 and caller != tree:
+                for node in call_nodes:
+                    node.sync_sockets()
+                caller.update()
+    finally:
+        _updating_trees.discard(hash(tree))
@@ -1,6 +1,10 @@
 import bpy
 from bpy.props import *
+from collections import defaultdict, OrderedDict
 from . node_tree import ComputeNodeTree
+from . compile_scheduler import recompile_scheduler
+from . tree_info import iter_all_unlinked_inputs
+from . frame_range import frame_result_cache, get_current_frame_results, get_frame_range, as_hashable
 
 class TreeContext:
     def is_compute_tree(self, object):
@@ -8,6 +12,9 @@ class TreeContext:
 
     tree = PointerProperty(name = "Node Tree", type = bpy.types.NodeTree, poll = is_compute_tree)
 
+    def get_input_values(self, object):
+        return ()
+
 
 class PropertyTreeContext(bpy.types.PropertyGroup, TreeContext):
     path = StringProperty(name = "Path")
@@ -30,6 +37,16 @@ class ObjectTreeContextManagerPanel(bpy.types.Panel):
         layout = self.layout
         object = context.active_object
 
+        layout.prop(context.scene, "compute_nodes_fused_update")
+        row = layout.row()
+        row.prop(context.scene, "compute_nodes_deferred_compile")
+        row.prop(context.scene, "compute_nodes_compile_delay")
+
+        row = layout.row(align = True)
+        row.prop(context.scene, "frame_start", text = "Start")
+        row.prop(context.scene, "frame_end", text = "End")
+        row.operator("cn.bake_tree_contexts")
+
         props = layout.operator("cn.new_object_property_tree_context")
         props.object_name = object.name
         props.path = "location"
@@ -65,15 +82,132 @@ class NewObjectPropertyTreeContext(bpy.types.Operator):
         return {"FINISHED"}
 
 
-def update_contexts():
+class BakeTreeContexts(bpy.types.Operator):
+    bl_idname = "cn.bake_tree_contexts"
+    bl_label = "Bake"
+    bl_description = "Evaluate all tree contexts for the frame range of the scene in advance"
+
+    def execute(self, context):
+        scene = context.scene
+        bake_contexts(scene.frame_start, scene.frame_end)
+        return {"FINISHED"}
+
+
+def update_contexts(fused = False):
+    contexts_by_tree = get_contexts_by_tree()
+    if fused:
+        update_contexts_fused(contexts_by_tree)
+    else:
+        for tree, contexts in contexts_by_tree.items():
+            update_contexts_of_tree(tree, contexts)
+
+def get_contexts_by_tree():
+    '''The trees are in the order in which they have to be evaluated.'''
+    contexts_by_tree = defaultdict(list)
     for object in bpy.data.objects:
         for item in object.tree_contexts.property_contexts:
-            new_value = item.tree.get_function()()[0]
-            exec("object.{} = value".format(item.path), {"object" : object, "value" : new_value})
+            if item.tree is not None:
+                contexts_by_tree[item.tree].append((object, item))
+    return sort_by_dependencies(contexts_by_tree)
+
+def sort_by_dependencies(contexts_by_tree):
+    '''
+    A tree that reads an object, whose location is set by a context
+    of another tree, is evaluated after that tree.
+    '''
+    writers_by_object = defaultdict(set)
+    for tree, contexts in contexts_by_tree.items():
+        for object, item in contexts:
+            if item.path == "location":
+                writers_by_object[object].add(tree)
+
+    dependencies = {}
+    for tree in contexts_by_tree:
+        dependencies[tree] = set()
+        for node, socket in iter_all_unlinked_inputs(tree):
+            if socket.bl_idname == "cn_ObjectSocket" and socket.value is not None:
+                dependencies[tree].update(writers_by_object[socket.value])
+        dependencies[tree].discard(tree)
+
+    sorted_contexts = OrderedDict()
+    remaining = list(contexts_by_tree)
+    while len(remaining) > 0:
+        ready = [tree for tree in remaining if dependencies[tree].issubset(sorted_contexts)]
+        if len(ready) == 0:
+            print("Tree context cycle detected")
+            ready = remaining
+        for tree in ready:
+            sorted_contexts[tree] = contexts_by_tree[tree]
+        remaining = [tree for tree in remaining if tree not in sorted_contexts]
+    return sorted_contexts
+
+def update_contexts_fused(contexts_by_tree):
+    '''
+    All trees that are compiled with LLVM are evaluated with a single
+    call of the scene kernel. Trees that use another backend, or whose
+    deferred compilation is still pending, are evaluated separately
+    before, so that editing a tree does not compile the kernel on every
+    change.
+    '''
+    from . scene_kernel import get_scene_kernel
+
+    fused_trees = [tree for tree in contexts_by_tree
+                   if tree.backend in ("LLVM", "AUTO") and not recompile_scheduler.is_pending(tree)]
+    for tree, contexts in contexts_by_tree.items():
+        if tree not in fused_trees:
+            update_contexts_of_tree(tree, contexts)
+
+    if len(fused_trees) > 0:
+        kernel = get_scene_kernel(fused_trees)
+        for tree, new_values in zip(fused_trees, kernel.execute(contexts_by_tree)):
+            assign_context_values(contexts_by_tree[tree], new_values)
+
+def update_contexts_of_tree(tree, contexts):
+    '''
+    All contexts that use the same tree are evaluated with a single call.
+    The results are cached per frame, see frame_range.py.
+    '''
+    input_values = [item.get_input_values(object) for object, item in contexts]
+    input_arrays = list(zip(*input_values))
+
+    def compute_values():
+        function = tree.get_batch_function(interim = True)
+        return function(len(contexts), *input_arrays)[0]
+
+    new_values = get_current_frame_results(tree, input_values, compute_values)
+    assign_context_values(contexts, new_values)
+
+def bake_contexts(frame_start, frame_end):
+    '''
+    Fills the frame result cache for all contexts with one call per
+    tree and distinct input values, so that the playback of the frames
+    does not evaluate any tree.
+    '''
+    for tree, contexts in get_contexts_by_tree().items():
+        input_values = [item.get_input_values(object) for object, item in contexts]
+        function = tree.get_frame_range_function()
+
+        values_by_inputs = dict()
+        for values in input_values:
+            key = as_hashable(values)
+            if key not in values_by_inputs:
+                values_by_inputs[key] = function(frame_start, frame_end, *values)[0]
+
+        frames = get_frame_range(frame_start, frame_end)
+        for i, frame in enumerate(frames):
+            new_values = [values_by_inputs[as_hashable(values)][i] for values in input_values]
+            frame_result_cache.set(tree, frame, input_values, new_values)
+
+def assign_context_values(contexts, new_values):
+    for (object, item), new_value in zip(contexts, new_values):
+        exec("object.{} = value".format(item.path), {"object" : object, "value" : new_value})
 
 
 def register():
     bpy.types.Object.tree_contexts = PointerProperty(type = TreeContexts)
+    bpy.types.Scene.compute_nodes_fused_update = BoolProperty(name = "Fused Scene Update", default = False,
+        description = "Compile all trees used by tree contexts into one module and evaluate them with a single call")
 
 def unregister():
     del bpy.types.Object.tree_contexts
+    del bpy.types.Scene.compute_nodes_fused_update
@@ -1,67 +1,231 @@
-from itertools import chain
-from collections import defaultdict, namedtuple
-from . utils.nodes import iter_compute_node_trees, iter_base_nodes_in_tree
+from array import array
+from collections import defaultdict
+from . node_base import NodeBase
+from . snapshot import NodeSnapshot
+from . node_parameters import has_runtime_parameters
+from . utils.nodes import iter_compute_node_trees
 
 class TreeInfo:
+    '''
+    Nodes and sockets are mapped to dense integer ids, so that most
+    lookups are just array indexing:
+        - the sockets of a node are stored next to each other,
+          first the inputs and then the outputs
+        - links are stored per socket, data targets in CSR format
+        - the data origin of every socket is resolved through reroutes
+        - inputs returned by get_unused_inputs of a node are not read,
+          they get no global and nothing is calculated for them
+    Nodes and sockets are stored as snapshots, see snapshot.py. The
+    accessors accept snapshots as well as the Blender objects.
+    '''
     def __init__(self, node_tree):
-        self.nodes = dict(node_tree.nodes)
-        self.links = list(node_tree.links)
-
-        self._create_nodes_data()
-        self._create_links_data()
+        self._create_nodes_data(node_tree)
+        self._create_links_data(node_tree)
         self._find_data_connections()
+        self._find_topological_order()
+        self.values = None
+        self.values_version = 0
+        self.update_values()
 
-    def _create_nodes_data(self):
-        self.reroutes = set()
-        self.node_by_socket = dict()
+    def _create_nodes_data(self, node_tree):
+        self.nodes = []
+        self.node_ids = dict()
         self.nodes_by_type = defaultdict(list)
+        self.is_reroute = array("b")
+        self.is_base_node = array("b")
+        self.runtime_parameter_nodes = []
 
-        for node in self.nodes.values():
-            if node.bl_idname == "NodeReroute":
-                self.reroutes.add(name)
-
-            for socket in chain(node.inputs, node.outputs):
-                self.node_by_socket[socket] = node
+        self.sockets = []
+        self.socket_ids = dict()
+        self.socket_node = array("i")
+        self.socket_is_output = array("b")
+        self.socket_is_read = array("b")
+        self.node_inputs_start = array("i")
+        self.node_outputs_start = array("i")
 
-            self.nodes_by_type[node.bl_idname].append(node)
+        for node_id, node in enumerate(node_tree.nodes):
+            snapshot = NodeSnapshot(node, node_tree)
+            self.nodes.append(snapshot)
+            self.node_ids[node] = node_id
+            self.node_ids[snapshot] = node_id
+            self.nodes_by_type[snapshot.bl_idname].append(snapshot)
+            self.is_reroute.append(snapshot.bl_idname == "NodeReroute")
+            self.is_base_node.append(isinstance(node, NodeBase))
+            if hasattr(node, "enum_parameters") and has_runtime_parameters(node_tree, node):
+                snapshot.has_runtime_parameters = True
+                self.runtime_parameter_nodes.append(snapshot)
 
-    def _create_links_data(self):
-        self.direct_origin = defaultdict(lambda: None)
-        self.direct_targets = defaultdict(list)
+            self.node_inputs_start.append(len(self.sockets))
+            self._add_sockets(node_id, snapshot.inputs, False)
+            self.node_outputs_start.append(len(self.sockets))
+            self._add_sockets(node_id, snapshot.outputs, True)
+            if hasattr(node, "get_unused_inputs"):
+                for socket in snapshot.get_unused_inputs():
+                    self.socket_is_read[self.socket_ids[socket]] = False
+        self.node_inputs_start.append(len(self.sockets))
 
-        for link in self.links:
-            origin = link.from_socket
-            target = link.to_socket
+    def _add_sockets(self, node_id, sockets, is_output):
+        for snapshot in sockets:
+            self.socket_ids[snapshot.source] = len(self.sockets)
+            self.socket_ids[snapshot] = len(self.sockets)
+            self.sockets.append(snapshot)
+            self.socket_node.append(node_id)
+            self.socket_is_output.append(is_output)
+            self.socket_is_read.append(True)
 
-            self.direct_origin[target] = origin
-            self.direct_targets[origin].append(target)
+    def _create_links_data(self, node_tree):
+        self.direct_origin = array("i", [-1]) * len(self.sockets)
+        for link in node_tree.links:
+            origin_id = self.socket_ids.get(link.from_socket)
+            target_id = self.socket_ids.get(link.to_socket)
+            if origin_id is not None and target_id is not None:
+                self.direct_origin[target_id] = origin_id
 
     def _find_data_connections(self):
-        self.data_origin = defaultdict(lambda: None)
-        self.data_targets = defaultdict(list)
+        '''
+        Links that go through reroutes are resolved to the real origin.
+        Every reroute chain is only followed once, afterwards all sockets
+        on the chain know the resolved origin (path compression).
+        '''
+        unresolved = -2
+        self.data_origin = array("i", [unresolved]) * len(self.sockets)
+
+        for socket_id in range(len(self.sockets)):
+            path = []
+            on_path = set()
+            current = socket_id
+            while self.data_origin[current] == unresolved:
+                origin = self.direct_origin[current]
+                if origin == -1 or not self.is_reroute[self.socket_node[origin]]:
+                    self.data_origin[current] = origin
+                    break
+                if current in on_path:
+                    print("Reroute recursion detected")
+                    self.data_origin[current] = -1
+                    break
+                path.append(current)
+                on_path.add(current)
+                # follow the link into the input of the reroute
+                current = self.get_input_ids(self.socket_node[origin])[0]
+
+            resolved = self.data_origin[current]
+            for path_socket_id in path:
+                self.data_origin[path_socket_id] = resolved
+
+        # sockets of reroutes are not data targets themselves
+        target_amounts = array("i", [0]) * len(self.sockets)
+        for target_id, origin_id in enumerate(self.data_origin):
+            if origin_id != -1 and not self.is_reroute[self.socket_node[target_id]]:
+                target_amounts[origin_id] += 1
+
+        self.data_targets_start = array("i", [0])
+        for amount in target_amounts:
+            self.data_targets_start.append(self.data_targets_start[-1] + amount)
+
+        self.data_targets = array("i", [0]) * self.data_targets_start[-1]
+        fill = array("i", self.data_targets_start[:-1])
+        for target_id, origin_id in enumerate(self.data_origin):
+            if origin_id != -1 and not self.is_reroute[self.socket_node[target_id]]:
+                self.data_targets[fill[origin_id]] = target_id
+                fill[origin_id] += 1
+
+    def _find_topological_order(self):
+        '''
+        Kahn's algorithm on the node dependencies. Reroutes and nodes that
+        are part of a cycle are not in the order.
+        '''
+        dependency_amounts = array("i", [0]) * len(self.nodes)
+        for node_id in range(len(self.nodes)):
+            dependency_amounts[node_id] = len(list(self.iter_dependency_ids(node_id)))
+
+        self.topological_order = array("i")
+        self.topological_order.extend(i for i, amount in enumerate(dependency_amounts)
+                                      if amount == 0 and not self.is_reroute[i])
+
+        index = 0
+        while index < len(self.topological_order):
+            node_id = self.topological_order[index]
+            index += 1
+            for output_id in self.get_output_ids(node_id):
+                for target_id in self.get_data_target_ids(output_id):
+                    target_node_id = self.socket_node[target_id]
+                    dependency_amounts[target_node_id] -= 1
+                    if dependency_amounts[target_node_id] == 0:
+                        self.topological_order.append(target_node_id)
+
+        if len(self.topological_order) < len(self.nodes) - sum(self.is_reroute):
+            print("Node cycle detected")
+
+    def iter_dependency_ids(self, node_id):
+        for input_id in self.get_input_ids(node_id):
+            origin_id = self.data_origin[input_id]
+            if origin_id != -1:
+                yield self.socket_node[origin_id]
+
+    def get_input_ids(self, node_id):
+        return range(self.node_inputs_start[node_id], self.node_outputs_start[node_id])
+
+    def get_output_ids(self, node_id):
+        return range(self.node_outputs_start[node_id], self.node_inputs_start[node_id + 1])
 
-        for target, origin in self.direct_origin.items():
-            if target in self.reroutes:
+    def get_data_target_ids(self, socket_id):
+        return self.data_targets[self.data_targets_start[socket_id]:self.data_targets_start[socket_id + 1]]
+
+    def get_topological_order(self):
+        return [self.nodes[node_id] for node_id in self.topological_order]
+
+    def get_nodes_to_calculate(self, required_sockets, known_sockets):
+        '''
+        The nodes that have to be executed to calculate the required
+        sockets, in topological order. Nothing is calculated for the
+        known sockets.
+        '''
+        known_ids = {self.socket_ids[socket] for socket in known_sockets if socket in self.socket_ids}
+        required_nodes = array("b", [0]) * len(self.nodes)
+        checked_sockets = set()
+        ids_to_check = [self.socket_ids[socket] for socket in required_sockets]
+
+        while len(ids_to_check) > 0:
+            socket_id = ids_to_check.pop()
+            if socket_id in known_ids or socket_id in checked_sockets:
                 continue
+            checked_sockets.add(socket_id)
 
-            real_origin = self._find_real_data_origin(target, set())
-            if real_origin is not None:
-                self.data_origin[target] = real_origin
-                self.data_targets[real_origin].append(target)
-
-    def _find_real_data_origin(self, target, visited_reroutes):
-        direct_origin = self.direct_origin[target]
-        if direct_origin is None:
-            return None
-
-        if direct_origin in visited_reroutes:
-            print("Reroute recursion detected")
-            return None
-        elif direct_origin in self.reroutes:
-            visited_reroutes.add(direct_origin)
-            return self._find_real_data_origin(direct_origin, visited_reroutes)
-        else:
-            return direct_origin
+            if self.socket_is_output[socket_id]:
+                node_id = self.socket_node[socket_id]
+                if not required_nodes[node_id]:
+                    required_nodes[node_id] = True
+                    ids_to_check.extend(self.iter_read_input_ids(node_id))
+            else:
+                origin_id = self.data_origin[socket_id]
+                if origin_id != -1:
+                    ids_to_check.append(origin_id)
+
+        return [self.nodes[node_id] for node_id in self.topological_order if required_nodes[node_id]]
+
+    def update_values(self):
+        '''The values version is incremented when a socket value or a node parameter has changed.'''
+        values = []
+        for node_id, node in enumerate(self.nodes):
+            if self.is_base_node[node_id]:
+                node.update_values()
+                values.extend(self.sockets[i].value for i in self.iter_unlinked_input_ids(node_id))
+        for node in self.runtime_parameter_nodes:
+            values.extend(getattr(node, name) for name in node.enum_parameters)
+
+        if values != self.values:
+            self.values = values
+            self.values_version += 1
+
+    def iter_unlinked_input_ids(self, node_id):
+        for input_id in self.iter_read_input_ids(node_id):
+            if self.data_origin[input_id] == -1:
+                yield input_id
+
+    def iter_read_input_ids(self, node_id):
+        for input_id in self.get_input_ids(node_id):
+            if self.socket_is_read[input_id]:
+                yield input_id
 
 
 tree_info_by_hash = dict()
@@ -71,6 +235,10 @@ def tag_update(tree):
     updated_trees.add(hash(tree))
 
 def update_if_necessary():
+    '''
+    Socket values are captured on every call, because changing
+    them does not tag the tree for an update.
+    '''
     new_tree_info_by_hash = dict()
     for tree in iter_compute_node_trees():
         tree_hash = hash(tree)
@@ -79,6 +247,7 @@ def update_if_necessary():
             updated_trees.discard(tree_hash)
         else:
             new_tree_info_by_hash[tree_hash] = tree_info_by_hash[tree_hash]
+            new_tree_info_by_hash[tree_hash].update_values()
 
     tree_info_by_hash.clear()
     tree_info_by_hash.update(new_tree_info_by_hash)
@@ -88,31 +257,50 @@ def update_if_necessary():
 
 # Access tree info utilities
 
+def get_tree_info(tree):
+    return tree_info_by_hash[hash(tree)]
+
 def iter_all_unlinked_inputs(tree):
-    for node in iter_base_nodes_in_tree(tree):
-        for socket in iter_unlinked_inputs(node):
-            yield node, socket
+    info = get_tree_info(tree)
+    for node_id, node in enumerate(info.nodes):
+        if info.is_base_node[node_id]:
+            for socket_id in info.iter_unlinked_input_ids(node_id):
+                yield node, info.sockets[socket_id]
 
 def iter_unlinked_inputs(node):
-    info = tree_info_by_hash[hash(node.id_data)]
-    for socket in node.inputs:
-        if info.data_origin[socket] is None:
-            yield socket
+    info = get_tree_info(node.id_data)
+    for socket_id in info.iter_unlinked_input_ids(info.node_ids[node]):
+        yield info.sockets[socket_id]
 
 def iter_linked_inputs(node):
-    info = tree_info_by_hash[hash(node.id_data)]
-    for socket in node.inputs:
-        if info.data_origin[socket] is not None:
-            yield socket
+    info = get_tree_info(node.id_data)
+    for socket_id in info.get_input_ids(info.node_ids[node]):
+        if info.data_origin[socket_id] != -1:
+            yield info.sockets[socket_id]
+
+def is_read_input(socket):
+    info = get_tree_info(socket.id_data)
+    return info.socket_is_read[info.socket_ids[socket]]
 
 def get_data_origin_socket(socket):
-    info = tree_info_by_hash[hash(socket.id_data)]
-    return info.data_origin[socket]
+    info = get_tree_info(socket.id_data)
+    origin_id = info.data_origin[info.socket_ids[socket]]
+    return None if origin_id == -1 else info.sockets[origin_id]
+
+def get_data_target_sockets(socket):
+    info = get_tree_info(socket.id_data)
+    return [info.sockets[target_id] for target_id in info.get_data_target_ids(info.socket_ids[socket])]
+
+def get_nodes_to_calculate(tree, required_sockets, known_sockets):
+    return get_tree_info(tree).get_nodes_to_calculate(required_sockets, known_sockets)
+
+def get_runtime_parameter_nodes(tree):
+    return get_tree_info(tree).runtime_parameter_nodes
 
 def get_nodes_by_type(tree, idname):
-    info = tree_info_by_hash[hash(tree)]
+    info = get_tree_info(tree)
     return info.nodes_by_type[idname]
 
 def get_node_by_socket(socket):
-    info = tree_info_by_hash[hash(socket.id_data)]
-    return info.node_by_socket[socket]
+    info = get_tree_info(socket.id_data)
+    return info.nodes[info.socket_node[info.socket_ids[socket]]]
@@ -0,0 +1,50 @@
+'''
+Batch kernels evaluate the tree for many elements, but usually only a
+part of the tree depends on the per-element inputs. The remaining
+sockets are uniform: their value is the same for all elements, so they
+only have to be computed once before the loop.
+'''
+
+from . tree_info import get_data_origin_socket, get_data_target_sockets, get_node_by_socket, is_read_input
+
+def find_varying_sockets(element_sockets):
+    '''
+    Returns all sockets whose value depends on one of the given sockets.
+    These are the output sockets that provide the per-element values.
+    '''
+    varying_sockets = set()
+    sockets_to_check = list(element_sockets)
+    while len(sockets_to_check) > 0:
+        socket = sockets_to_check.pop()
+        if socket in varying_sockets:
+            continue
+        varying_sockets.add(socket)
+
+        if socket.is_output:
+            sockets_to_check.extend(get_data_target_sockets(socket))
+        else:
+            sockets_to_check.extend(get_node_by_socket(socket).outputs)
+    return varying_sockets
+
+def find_uniform_sockets_to_hoist(required_sockets, varying_sockets):
+    '''
+    Returns the uniform sockets that are used by the varying part of the
+    tree or are required directly. Computing them computes all other
+    uniform sockets that are needed as well.
+    '''
+    uniform_sockets = []
+    visited_sockets = set()
+    sockets_to_check = list(required_sockets)
+    while len(sockets_to_check) > 0:
+        socket = sockets_to_check.pop()
+        if socket in visited_sockets:
+            continue
+        visited_sockets.add(socket)
+
+        if socket not in varying_sockets:
+            uniform_sockets.append(socket)
+        elif socket.is_output:
+            sockets_to_check.extend(s for s in get_node_by_socket(socket).inputs if is_read_input(s))
+        else:
+            sockets_to_check.append(get_data_origin_socket(socket))
+    return uniform_sockets
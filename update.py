@@ -2,13 +2,25 @@ import bpy
 from . utils.recursion import no_recursion
 from . tree_context import update_contexts
 from . tree_info import update_if_necessary
+from . node_parameters import specialize_unchanged_trees
+from . node_tree import update_execution_data_cache
+from . frame_range import remove_unused_frame_results
+from . compile_scheduler import process_scheduled_compiles
+from . object_cache import write_pending_object_code
+from . driver_functions import update_driver_functions
 from bpy.app.handlers import scene_update_post, persistent
 
 @persistent
 @no_recursion
 def update(scene):
+    specialize_unchanged_trees()
     update_if_necessary()
-    update_contexts()
+    update_execution_data_cache()
+    remove_unused_frame_results()
+    process_scheduled_compiles(scene)
+    update_driver_functions()
+    update_contexts(fused = scene.compute_nodes_fused_update)
+    write_pending_object_code()
 
 
 def register():
@@ -0,0 +1,372 @@
+'''
+Benchmarks that have to run inside Blender, e.g. from the Python console:
+    from compute_nodes.utils import benchmark
+    benchmark.benchmark_mesh_deform()
+'''
+
+import bpy
+import time
+from . timing import prettyTime
+
+def new_benchmark_tree(name = "Benchmark", backend = "LLVM"):
+    tree = bpy.data.node_groups.new(name, "cn_ComputeNodeTree")
+    tree.backend = backend
+    return tree
+
+def remove_tree(tree):
+    bpy.data.node_groups.remove(tree)
+
+def measure(function, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    end = time.perf_counter()
+    return (end - start) / repetitions
+
+def print_result(name, seconds, frame_rate = 24):
+    print("{:<40} {:>12} ({:.1f}% of a frame at {} fps)".format(
+        name, prettyTime(seconds), seconds * frame_rate * 100, frame_rate))
+
+
+# Mesh Deformation
+##########################################
+
+def create_wave_deform_tree():
+    tree = new_benchmark_tree("Wave Deform")
+    vertex_input = tree.nodes.new("cn_VertexInputNode")
+    separate = tree.nodes.new("cn_SeparateVectorNode")
+    sin = tree.nodes.new("cn_FloatMathNode")
+    sin.operation = "SIN"
+    add = tree.nodes.new("cn_FloatMathNode")
+    add.operation = "ADD"
+    combine = tree.nodes.new("cn_CombineVectorNode")
+    output = tree.nodes.new("cn_OutputNode")
+
+    tree.links.new(vertex_input.outputs[0], separate.inputs[0])
+    tree.links.new(separate.outputs[0], sin.inputs[0])
+    tree.links.new(sin.outputs[0], add.inputs[0])
+    tree.links.new(separate.outputs[2], add.inputs[1])
+    tree.links.new(separate.outputs[0], combine.inputs[0])
+    tree.links.new(separate.outputs[1], combine.inputs[1])
+    tree.links.new(add.outputs[0], combine.inputs[2])
+    tree.links.new(combine.outputs[0], output.inputs["out2"])
+    return tree
+
+def benchmark_mesh_deform(vertex_amount = 10**6, threads = 8, repetitions = 10):
+    from .. mesh_deform import deform_mesh
+    from .. tree_info import update_if_necessary
+
+    tree = create_wave_deform_tree()
+    mesh = bpy.data.meshes.new("Benchmark")
+    mesh.vertices.add(vertex_amount)
+    update_if_necessary()
+
+    tree.get_vertex_function()
+    print_result("deform {} vertices, {} threads".format(vertex_amount, threads),
+        measure(lambda: deform_mesh(tree, mesh, threads = threads), repetitions))
+    print_result("deform {} vertices, 1 thread".format(vertex_amount),
+        measure(lambda: deform_mesh(tree, mesh, threads = 1), repetitions))
+
+    bpy.data.meshes.remove(mesh)
+    remove_tree(tree)
+
+
+# Vector Code Generation
+##########################################
+
+def create_vector_chain_tree(length):
+    tree = new_benchmark_tree("Vector Chain")
+    vertex_input = tree.nodes.new("cn_VertexInputNode")
+    output = tree.nodes.new("cn_OutputNode")
+
+    last_socket = vertex_input.outputs[0]
+    for i in range(length):
+        add = tree.nodes.new("cn_VectorMathNode")
+        add.operation = "ADD"
+        add.inputs[1].value = (0.1, 0.2, 0.3)
+        tree.links.new(last_socket, add.inputs[0])
+
+        dot = tree.nodes.new("cn_VectorMathNode")
+        dot.operation = "DOT"
+        dot.inputs[1].value = (0.5, 0.5, 0.5)
+        tree.links.new(add.outputs[0], dot.inputs[0])
+
+        scale = tree.nodes.new("cn_VectorMathNode")
+        scale.operation = "SCALE"
+        tree.links.new(add.outputs[0], scale.inputs[0])
+        tree.links.new(dot.outputs[1], scale.inputs[2])
+        last_socket = scale.outputs[0]
+
+    tree.links.new(last_socket, output.inputs["out2"])
+    return tree
+
+def benchmark_vector_modes(vertex_amount = 10**6, length = 20, repetitions = 10):
+    from .. mesh_deform import deform_mesh
+    from .. tree_info import update_if_necessary
+
+    tree = create_vector_chain_tree(length)
+    mesh = bpy.data.meshes.new("Benchmark")
+    mesh.vertices.add(vertex_amount)
+
+    for mode in ("ARRAY", "SIMD"):
+        tree.vector_mode = mode
+        update_if_necessary()
+        tree.get_vertex_function()
+        print_result("{} vector chain of {}, {} vertices".format(mode, length, vertex_amount),
+            measure(lambda: deform_mesh(tree, mesh, threads = 1), repetitions))
+
+    bpy.data.meshes.remove(mesh)
+    remove_tree(tree)
+
+
+# Branchless Code Generation
+##########################################
+
+def create_divide_chain_tree(length):
+    tree = new_benchmark_tree("Divide Chain")
+    input_node = tree.nodes.new("cn_InputNode")
+    output = tree.nodes.new("cn_OutputNode")
+
+    last_socket = input_node.outputs[0]
+    for i in range(length):
+        divide = tree.nodes.new("cn_FloatMathNode")
+        divide.operation = "DIVIDE"
+        tree.links.new(last_socket, divide.inputs[0])
+        tree.links.new(input_node.outputs[1], divide.inputs[1])
+        last_socket = divide.outputs[0]
+
+    tree.links.new(last_socket, output.inputs["out1"])
+    return tree
+
+def benchmark_branchless(amount = 10**6, length = 10, repetitions = 10):
+    '''
+    Compares batch kernels with branching and branchless conditionals.
+    Also reports whether LLVM managed to vectorize the loop.
+    '''
+    from ctypes import CFUNCTYPE, POINTER, c_int
+    from .. execution import generate_batch_module, BATCH_OPT_LEVEL
+    from .. tree_info import update_if_necessary
+
+    tree = create_divide_chain_tree(length)
+    update_if_necessary()
+    execution_data = tree.get_execution_data()
+    input_sockets = execution_data.get_all_input_sockets()
+    # the unused outputs would only add constant stores to the loop
+    output_sockets = [execution_data.output_node.inputs["out1"]]
+    sockets = input_sockets + output_sockets
+
+    arrays = [(s.c_type * amount)() for s in sockets]
+    for array in arrays[:len(input_sockets)]:
+        for i in range(amount):
+            array[i] = i % 7
+    execution_data.update_globals()
+
+    for branchless in (False, True):
+        function_name = "Branchless" if branchless else "Branching"
+        module_ir = generate_batch_module(function_name + " module", function_name,
+            input_sockets, output_sockets, branchless = branchless)
+        execution_data._compile_ir_module(module_ir, BATCH_OPT_LEVEL)
+        vectorized = is_vectorized(module_ir, function_name, execution_data.target_machine)
+
+        address = execution_data.engine.get_function_address(function_name)
+        func_type = CFUNCTYPE(None, c_int, *[POINTER(s.c_type) for s in sockets])
+        function = func_type(address)
+
+        print_result("{}, divide chain of {}, {} elements, {}".format(
+                function_name, length, amount, "vectorized" if vectorized else "scalar"),
+            measure(lambda: function(amount, *arrays), repetitions))
+
+    remove_tree(tree)
+
+def is_vectorized(module_ir, function_name, target_machine):
+    # the module in the engine is not optimized when its code is in the object cache
+    from .. lazy_imports import llvm
+    from .. execution import BATCH_OPT_LEVEL
+    from . compile_worker import optimize_module
+
+    module = llvm.parse_assembly(str(module_ir))
+    optimize_module(module, BATCH_OPT_LEVEL, target_machine)
+    return "x float>" in str(module.get_function(function_name))
+
+
+# Deep Trees
+##########################################
+
+def create_float_chain_tree(length):
+    tree = new_benchmark_tree("Float Chain")
+    input_node = tree.nodes.new("cn_InputNode")
+    output = tree.nodes.new("cn_OutputNode")
+
+    last_socket = input_node.outputs[0]
+    for i in range(length):
+        math_node = tree.nodes.new("cn_FloatMathNode")
+        math_node.operation = "ADD"
+        math_node.inputs[1].value = 1
+        tree.links.new(last_socket, math_node.inputs[0])
+        last_socket = math_node.outputs[0]
+
+    tree.links.new(last_socket, output.inputs["out1"])
+    return tree
+
+def benchmark_deep_chain(length = 10000):
+    '''
+    Code generation must not depend on the recursion limit.
+    Measures code generation and the first call for every backend.
+    '''
+    from .. execution import generate_compute_module
+    from .. tree_info import update_if_necessary
+
+    tree = create_float_chain_tree(length)
+    update_if_necessary()
+
+    execution_data = tree.get_execution_data()
+    input_sockets = execution_data.get_all_input_sockets()
+    output_sockets = execution_data.get_all_output_sockets()
+    print_result("generate LLVM IR for chain of {}".format(length),
+        measure(lambda: generate_compute_module("chain", "Main", input_sockets, output_sockets), 1))
+
+    for backend in ("LLVM", "NUMPY", "PYTHON"):
+        tree.backend = backend
+        update_if_necessary()
+        print_result("{} first call, chain of {}".format(backend, length),
+            measure(lambda: tree.get_function()(0, 0), 1))
+        print_result("{} call, chain of {}".format(backend, length),
+            measure(lambda: tree.get_function()(0, 0), 10))
+
+    remove_tree(tree)
+
+def benchmark_tree_info(length = 10000, repetitions = 10):
+    '''
+    Building the tree info of a large tree should take milliseconds.
+    Measures the construction and a dependency query over the whole tree.
+    '''
+    from .. tree_info import TreeInfo, update_if_necessary
+
+    tree = create_float_chain_tree(length)
+    update_if_necessary()
+
+    input_sockets = list(tree.nodes["Input Node"].outputs)
+    output_sockets = list(tree.nodes["Output Node"].inputs)
+
+    print_result("build tree info for chain of {}".format(length),
+        measure(lambda: TreeInfo(tree), repetitions))
+    info = TreeInfo(tree)
+    print_result("nodes to calculate, chain of {}".format(length),
+        measure(lambda: info.get_nodes_to_calculate(output_sockets, input_sockets), repetitions))
+
+    remove_tree(tree)
+
+
+# Python Drivers
+##########################################
+
+def create_driver_tree(name):
+    '''Computes the same as the driver expression  sin(a) * b + 2'''
+    tree = new_benchmark_tree(name)
+    input_node = tree.nodes.new("cn_InputNode")
+    output = tree.nodes.new("cn_OutputNode")
+    sin = tree.nodes.new("cn_FloatMathNode")
+    sin.operation = "SIN"
+    multiply = tree.nodes.new("cn_FloatMathNode")
+    multiply.operation = "MULTIPLY"
+    add = tree.nodes.new("cn_FloatMathNode")
+    add.operation = "ADD"
+    add.inputs[1].value = 2
+
+    tree.links.new(input_node.outputs[0], sin.inputs[0])
+    tree.links.new(sin.outputs[0], multiply.inputs[0])
+    tree.links.new(input_node.outputs[1], multiply.inputs[1])
+    tree.links.new(multiply.outputs[0], add.inputs[0])
+    tree.links.new(add.outputs[0], output.inputs["out1"])
+    tree.driver_function = True
+    return tree
+
+def benchmark_driver_functions(driver_amount = 1000, repetitions = 20):
+    '''
+    Evaluates the expressions like Blender evaluates Python drivers:
+    compiled once, then evaluated with the driver namespace as globals
+    and the driver variables as locals.
+    '''
+    import math
+    from .. tree_info import update_if_necessary
+    from .. driver_functions import update_driver_functions, get_driver_function_name
+
+    tree = create_driver_tree("Driver Benchmark")
+    update_if_necessary()
+    update_driver_functions()
+    name = get_driver_function_name(tree)
+
+    namespace = dict(vars(math))
+    namespace.update(bpy.app.driver_namespace)
+    variables = {"a" : 0.5, "b" : 3.0}
+
+    def evaluate_drivers(expression):
+        code = compile(expression, "<driver>", "eval")
+        def evaluate():
+            for _ in range(driver_amount):
+                eval(code, namespace, dict(variables))
+        return evaluate
+
+    expressions = [
+        ("Python expression", "sin(a) * b + 2"),
+        ("tree function", "{}(a, b)".format(name))]
+    for description, expression in expressions:
+        evaluate_drivers(expression)()
+        print_result("{} drivers, {}".format(driver_amount, description),
+            measure(evaluate_drivers(expression), repetitions))
+
+    function = tree.get_function()
+    print_result("{} calls of tree.get_function()".format(driver_amount),
+        measure(lambda: [function(0.5, 3.0) for _ in range(driver_amount)], repetitions))
+    print("results: {} (Python), {} (tree)".format(
+        eval("sin(a) * b + 2", namespace, variables), bpy.app.driver_namespace[name](0.5, 3.0)))
+
+    remove_tree(tree)
+    update_driver_functions()
+
+
+# Add-on Import
+##########################################
+
+import_script = '''
+import sys, json, time, importlib
+sys.path.insert(0, {directory!r})
+heavy_modules = ("numpy", "llvmlite.binding", "concurrent.futures", "subprocess")
+loaded_before = [name for name in heavy_modules if name in sys.modules]
+start = time.perf_counter()
+addon = importlib.import_module({package!r})
+imported = time.perf_counter()
+addon.register()
+registered = time.perf_counter()
+print("IMPORT_RESULT " + json.dumps({{
+    "import" : imported - start,
+    "register" : registered - imported,
+    "loaded" : [name for name in heavy_modules if name in sys.modules and name not in loaded_before]}}))
+'''
+
+def benchmark_addon_import(repetitions = 5):
+    '''
+    Every import runs in a new Blender process in the background,
+    because the modules of the add-on stay loaded otherwise.
+    Also lists the heavy modules that were loaded by the import.
+    '''
+    import json
+    import subprocess
+    from pathlib import Path
+
+    addon_path = Path(__file__).parents[1]
+    script = import_script.format(directory = str(addon_path.parent), package = addon_path.name)
+    command = [bpy.app.binary_path, "--background", "--factory-startup", "--python-expr", script]
+
+    results = []
+    for _ in range(repetitions):
+        output = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE).stdout.decode()
+        lines = [line for line in output.splitlines() if line.startswith("IMPORT_RESULT ")]
+        if len(lines) == 0:
+            print("Cannot import the add-on in a new Blender process:\n" + output)
+            return
+        results.append(json.loads(lines[0][len("IMPORT_RESULT "):]))
+
+    print_result("import add-on", min(result["import"] for result in results))
+    print_result("register add-on", min(result["register"] for result in results))
+    print("loaded by the import: {}".format(", ".join(results[0]["loaded"]) or "no heavy modules"))
@@ -0,0 +1,77 @@
+'''
+Compiles LLVM IR to object code in a separate process, so that every
+worker has its own LLVM context. It is started by warm_up.py:
+    python compile_worker.py < request.json > response.json
+The request contains a list of {"ir" : ..., "opt_level" : ...} entries.
+The response contains the base64 encoded object code for each of them.
+'''
+
+import sys
+import json
+import base64
+from pathlib import Path
+
+def setup_llvmlite():
+    try: import llvmlite
+    except ImportError:
+        sys.path.append(str(Path(__file__).parents[1] / "libs"))
+        import llvmlite
+    initialize_llvm()
+
+_llvm_initialized = False
+
+def initialize_llvm():
+    '''Only the first call initializes LLVM, the add-on calls it before every use.'''
+    global _llvm_initialized
+    if not _llvm_initialized:
+        import llvmlite.binding as llvm
+        llvm.initialize()
+        llvm.initialize_native_target()
+        llvm.initialize_native_asmprinter()
+        _llvm_initialized = True
+
+def create_target_machine():
+    import llvmlite.binding as llvm
+    initialize_llvm()
+    llvm_target = llvm.Target.from_default_triple()
+    return llvm_target.create_target_machine(
+        cpu = llvm.get_host_cpu_name(), features = get_host_cpu_features())
+
+def get_host_cpu_features():
+    import llvmlite.binding as llvm
+    try: return llvm.get_host_cpu_features().flatten()
+    except RuntimeError: return ""
+
+def optimize_module(module, opt_level, target_machine, inlining_threshold = None):
+    import llvmlite.binding as llvm
+    pmb = llvm.PassManagerBuilder()
+    pmb.opt_level = opt_level
+    if inlining_threshold is not None:
+        pmb.inlining_threshold = inlining_threshold
+    pmb.loop_vectorize = opt_level >= 2
+    pmb.slp_vectorize = opt_level >= 2
+    pm = llvm.ModulePassManager()
+    # the vectorizers need to know the target to estimate the costs
+    target_machine.add_analysis_passes(pm)
+    pmb.populate(pm)
+    pm.run(module)
+
+def compile_to_object(target_machine, ir_text, opt_level):
+    import llvmlite.binding as llvm
+    module = llvm.parse_assembly(ir_text)
+    module.verify()
+    optimize_module(module, opt_level, target_machine)
+    return target_machine.emit_object(module)
+
+def main():
+    setup_llvmlite()
+    request = json.load(sys.stdin)
+    target_machine = create_target_machine()
+    results = []
+    for entry in request["modules"]:
+        object_code = compile_to_object(target_machine, entry["ir"], entry["opt_level"])
+        results.append(base64.b64encode(object_code).decode("ascii"))
+    json.dump({"objects" : results}, sys.stdout)
+
+if __name__ == "__main__":
+    main()
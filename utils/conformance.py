@@ -0,0 +1,248 @@
+'''
+Compare the results of a tree with different compilation settings.
+Has to run inside Blender, e.g. from the Python console:
+    from compute_nodes.utils import conformance
+    conformance.compare_fast_math(bpy.data.node_groups["My Tree"])
+    conformance.check_fast_math_conformance()
+    conformance.check_backend_conformance()
+The check functions raise an exception that lists all outputs whose
+errors exceed the tolerance.
+'''
+
+import math
+import random
+from .. tree_info import update_if_necessary
+
+# (absolute, relative) error that is allowed for a value
+EXACT = (0, 0)
+
+# operation -> tolerance of the NumPy and Python backends compared to LLVM
+# for inputs between -10 and 10. All other operations have to be exact.
+# The math libraries differ by a few ulp for transcendental functions.
+# The Python backend rounds the result of every node to float32, but the
+# steps within a node are computed with double precision, so the errors
+# of intermediate results (up to 200 for Lerp) are missing.
+# One float32 ulp is 6e-8 relative.
+backend_tolerances = {
+    "SIN" : (1e-6, 1e-6),
+    "COS" : (1e-6, 1e-6),
+    "POWER" : (0, 1e-6),
+    "EXP" : (0, 1e-6),
+    "LOG" : (1e-6, 1e-6),
+    "MULTIPLY_ADD" : (1e-5, 1e-6),
+    "DOT" : (1e-5, 1e-6),
+    "CROSS" : (1e-5, 1e-6),
+    "LENGTH" : (0, 1e-6),
+    "NORMALIZE" : (1e-6, 1e-6),
+    "DISTANCE" : (0, 1e-6),
+    "LERP" : (5e-5, 1e-6),
+    "REFLECT" : (1e-5, 1e-6)
+}
+
+# fast math policy -> tolerance compared to the strict IEEE results
+# for inputs between -10 and 10 and trees with a few operations:
+#     NONE:     has to be bit exact, also after the other policies were used
+#     CONTRACT: a fused multiply add skips the rounding of the product,
+#               which is at most half an ulp of the product (ulp(100) = 8e-6)
+#     FULL:     reassociation and reciprocals add a few ulp per operation
+fast_math_tolerances = {
+    "NONE" : EXACT,
+    "CONTRACT" : (1e-5, 4.8e-7),
+    "FULL" : (1e-4, 1e-5)
+}
+
+# FULL assumes that there are no inf and nan values
+policies_without_special_values = {"FULL"}
+
+# inputs that are always tested besides the random values
+special_values = [0.0, -0.0, 1.0, -1.0, math.inf, -math.inf, math.nan]
+
+def compare_fast_math(tree, amount = 1000, seed = 0, tolerances = fast_math_tolerances):
+    '''
+    Evaluates the tree with random inputs for every fast math policy.
+    Returns a description of every output whose errors compared to the
+    strict IEEE results exceed the tolerance of the policy.
+    '''
+    original_policy = tree.fast_math
+    original_backend = tree.backend
+    tree.backend = "LLVM"
+    failures = []
+    try:
+        for policy in ("CONTRACT", "FULL", "NONE"):
+            special = policy not in policies_without_special_values
+            reference = evaluate_with_setting(tree, "fast_math", "NONE", amount, seed, special)
+            results = evaluate_with_setting(tree, "fast_math", policy, amount, seed, special)
+            failures.extend(find_violations("fast math {}".format(policy), tree,
+                                            reference, results, tolerances[policy]))
+    finally:
+        tree.fast_math = original_policy
+        tree.backend = original_backend
+    return failures
+
+def check_fast_math_conformance(length = 12, amount = 1000, seed = 0):
+    '''
+    Compares every fast math policy with the strict results for a chain
+    of all arithmetic operations, see fast_math_tolerances.
+    '''
+    import bpy
+    operations = ("MULTIPLY", "ADD", "DIVIDE", "MULTIPLY_ADD", "SUBTRACT")
+
+    tree = bpy.data.node_groups.new("Fast Math Conformance", "cn_ComputeNodeTree")
+    try:
+        input_node = tree.nodes.new("cn_InputNode")
+        output_node = tree.nodes.new("cn_OutputNode")
+        last_socket = input_node.outputs[0]
+        for i in range(length):
+            node = tree.nodes.new("cn_FloatMathNode")
+            node.operation = operations[i % len(operations)]
+            node.inputs[2].value = 0.3
+            tree.links.new(last_socket, node.inputs[0])
+            tree.links.new(input_node.outputs[1], node.inputs[1])
+            last_socket = node.outputs[0]
+        tree.links.new(last_socket, output_node.inputs["out1"])
+
+        failures = compare_fast_math(tree, amount, seed)
+    finally:
+        bpy.data.node_groups.remove(tree)
+
+    report_failures("fast math conformance", failures)
+
+def compare_backends(tree, amount = 1000, seed = 0, tolerance = EXACT):
+    '''
+    Evaluates the tree with random inputs with every backend. Returns a
+    description of every output whose errors compared to the compiled
+    results exceed the tolerance.
+    '''
+    original_backend = tree.backend
+    failures = []
+    try:
+        reference = evaluate_with_setting(tree, "backend", "LLVM", amount, seed)
+        for backend in ("NUMPY", "PYTHON"):
+            results = evaluate_with_setting(tree, "backend", backend, amount, seed)
+            failures.extend(find_violations("backend {}".format(backend), tree, reference, results, tolerance))
+    finally:
+        tree.backend = original_backend
+    return failures
+
+def check_backend_conformance(amount = 1000, seed = 0):
+    '''
+    Builds a small tree for every operation of the math nodes and
+    compares the backends for each of them with the tolerance of the
+    operation, see backend_tolerances.
+    '''
+    import bpy
+    from .. math_node import operation_items as float_operations
+    from .. vector_math_node import operation_items as vector_operations
+
+    tree = bpy.data.node_groups.new("Conformance", "cn_ComputeNodeTree")
+    failures = []
+    try:
+        input_node = tree.nodes.new("cn_InputNode")
+        output_node = tree.nodes.new("cn_OutputNode")
+        combine_node = tree.nodes.new("cn_CombineVectorNode")
+        tree.links.new(input_node.outputs[0], combine_node.inputs[0])
+        tree.links.new(input_node.outputs[1], combine_node.inputs[1])
+        combine_node.inputs[2].value = 0.5
+
+        for node_type, operations in (("cn_FloatMathNode", float_operations),
+                                      ("cn_VectorMathNode", vector_operations)):
+            node = tree.nodes.new(node_type)
+            if node_type == "cn_FloatMathNode":
+                tree.links.new(input_node.outputs[0], node.inputs[0])
+                tree.links.new(input_node.outputs[1], node.inputs[1])
+                tree.links.new(node.outputs[0], output_node.inputs["out1"])
+            else:
+                tree.links.new(combine_node.outputs[0], node.inputs[0])
+                node.inputs[1].value = (1, 2, 3)
+                tree.links.new(input_node.outputs[1], node.inputs[2])
+                tree.links.new(node.outputs[0], output_node.inputs["out2"])
+                tree.links.new(node.outputs[1], output_node.inputs["out1"])
+
+            for operation, *_ in operations:
+                node.operation = operation
+                tolerance = backend_tolerances.get(operation, EXACT)
+                failures.extend("{} {}, {}".format(node.bl_label, operation, failure)
+                                for failure in compare_backends(tree, amount, seed, tolerance))
+            tree.nodes.remove(node)
+    finally:
+        bpy.data.node_groups.remove(tree)
+
+    report_failures("backend conformance", failures)
+
+def evaluate_with_setting(tree, attribute, value, amount, seed, special = True):
+    setattr(tree, attribute, value)
+    update_if_necessary()
+    function = tree.get_batch_function()
+    inputs = create_random_inputs(tree, amount, seed, special = special)
+    return function(amount, *inputs)
+
+def create_random_inputs(tree, amount, seed, value_range = 10, special = True):
+    from .. execution import find_interface_nodes
+    input_node, _, _ = find_interface_nodes(tree)
+    rng = random.Random(seed)
+
+    def random_value(socket):
+        if socket.bl_idname == "cn_FloatSocket":
+            return rng.uniform(-value_range, value_range)
+        if socket.bl_idname == "cn_VectorSocket":
+            return tuple(rng.uniform(-value_range, value_range) for _ in range(3))
+        return None
+
+    sockets = list(getattr(input_node, "outputs", []))
+    inputs = [[random_value(s) for _ in range(amount)] for s in sockets]
+    if not special:
+        return inputs
+
+    # all combinations of special values for the first two float inputs
+    float_inputs = [values for s, values in zip(sockets, inputs) if s.bl_idname == "cn_FloatSocket"][:2]
+    for i, values in enumerate(float_inputs):
+        for j in range(min(amount, len(special_values) ** len(float_inputs))):
+            values[j] = special_values[j // len(special_values) ** i % len(special_values)]
+    return inputs
+
+def find_violations(name, tree, reference, results, tolerance):
+    from .. execution import find_interface_nodes
+    _, output_node, _ = find_interface_nodes(tree)
+
+    failures = []
+    for socket, expected, actual in zip(output_node.inputs, reference, results):
+        if socket.bl_idname == "cn_ObjectSocket":
+            continue
+        absolute, relative, violations = get_errors(flatten(expected), flatten(actual), tolerance)
+        if violations > 0:
+            failures.append("{}, {}: {} values differ, max absolute error: {:.3e}, "
+                "max relative error: {:.3e}, allowed: {:.1e} + {:.1e} * |value|".format(
+                name, socket.name, violations, absolute, relative, *tolerance))
+    return failures
+
+def get_errors(expected, actual, tolerance):
+    '''
+    Returns the max absolute and relative errors and how many values are
+    not within absolute + relative * |expected|. Infinities and nan have
+    to be the same.
+    '''
+    allowed_absolute, allowed_relative = tolerance
+    max_absolute = 0
+    max_relative = 0
+    violations = 0
+    for a, b in zip(expected, actual):
+        if a == b or (math.isnan(a) and math.isnan(b)):
+            continue
+        error = abs(a - b) if math.isfinite(a) and math.isfinite(b) else math.inf
+        max_absolute = max(max_absolute, error)
+        max_relative = max(max_relative, error / max(abs(a), 1e-30))
+        if not error <= allowed_absolute + allowed_relative * abs(a):
+            violations += 1
+    return max_absolute, max_relative, violations
+
+def report_failures(name, failures):
+    if len(failures) > 0:
+        raise Exception("{} failed:\n    {}".format(name, "\n    ".join(failures)))
+    print("{} passed".format(name))
+
+def flatten(values):
+    for value in values:
+        if isinstance(value, float):
+            yield value
+        else:
+            yield from value
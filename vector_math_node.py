@@ -0,0 +1,147 @@
+import bpy
+from . lazy_imports import numpy
+from bpy.props import *
+from llvmlite import ir
+from . compute_node import ComputeNode
+from . node_parameters import parameter_changed, insert_parameter_switch
+
+operation_items = [
+    ("ADD", "Add", "A + B", "NONE", 0),
+    ("SUBTRACT", "Subtract", "A - B", "NONE", 1),
+    ("SCALE", "Scale", "A * Factor", "NONE", 2),
+    ("DOT", "Dot Product", "Value = A . B", "NONE", 3),
+    ("CROSS", "Cross Product", "A x B", "NONE", 4),
+    ("LENGTH", "Length", "Value = |A|", "NONE", 5),
+    ("NORMALIZE", "Normalize", "A / |A|", "NONE", 6),
+    ("DISTANCE", "Distance", "Value = |A - B|", "NONE", 7),
+    ("LERP", "Lerp", "A + (B - A) * Factor", "NONE", 8),
+    ("REFLECT", "Reflect", "Reflect A on the plane with normal B", "NONE", 9)
+]
+
+value_operations = {"DOT", "LENGTH", "DISTANCE"}
+
+class VectorMathNode(bpy.types.Node, ComputeNode):
+    bl_idname = "cn_VectorMathNode"
+    bl_label = "Vector Math"
+
+    def propChanged(self, context):
+        parameter_changed(self)
+
+    operation = EnumProperty(name = "Operation", items = operation_items, update = propChanged)
+    enum_parameters = {"operation" : operation_items}
+
+    def init(self, context):
+        self.inputs.new("cn_VectorSocket", "A", "a")
+        self.inputs.new("cn_VectorSocket", "B", "b")
+        self.inputs.new("cn_FloatSocket", "Factor", "factor")
+        self.outputs.new("cn_VectorSocket", "Vector", "vector")
+        self.outputs.new("cn_FloatSocket", "Value", "value")
+
+    def draw(self, layout):
+        layout.prop(self, "operation", text = "")
+
+    def create_llvm_ir(self, builder, a, b, factor):
+        '''
+        Only one of the outputs is meaningful for every operation,
+        the other one is zero.
+        '''
+        vector, value = insert_parameter_switch(builder, self, "operation",
+            lambda op: self.create_operation_ir(builder, op, a, b, factor))
+        return builder, vector, value
+
+    def create_operation_ir(self, builder, op, a, b, factor):
+        vector = builder.vector_constant([0, 0, 0])
+        value = ir.Constant(ir.FloatType(), 0)
+
+        if op == "ADD":
+            vector = builder.vector_add(a, b)
+        elif op == "SUBTRACT":
+            vector = builder.vector_sub(a, b)
+        elif op == "SCALE":
+            vector = builder.vector_scale(a, factor)
+        elif op == "DOT":
+            value = builder.vector_dot(a, b)
+        elif op == "CROSS":
+            vector = builder.vector_cross(a, b)
+        elif op == "LENGTH":
+            value = vector_length(builder, a)
+        elif op == "NORMALIZE":
+            vector = vector_normalize(builder, a)
+        elif op == "DISTANCE":
+            value = vector_length(builder, builder.vector_sub(a, b))
+        elif op == "LERP":
+            vector = builder.vector_add(a, builder.vector_scale(builder.vector_sub(b, a), factor))
+        elif op == "REFLECT":
+            normal = vector_normalize(builder, b)
+            double_dot = builder.fmul(ir.Constant(ir.FloatType(), 2), builder.vector_dot(a, normal))
+            vector = builder.vector_sub(a, builder.vector_scale(normal, double_dot))
+
+        return vector, value
+
+    def execute_numpy(self, a, b, factor):
+        op = self.operation
+
+        vector = numpy.zeros(3, dtype = numpy.float32)
+        value = numpy.float32(0)
+        factor = numpy.expand_dims(factor, -1)
+
+        if op == "ADD":
+            vector = a + b
+        elif op == "SUBTRACT":
+            vector = a - b
+        elif op == "SCALE":
+            vector = a * factor
+        elif op == "DOT":
+            value = array_dot(a, b)
+        elif op == "CROSS":
+            vector = numpy.cross(a, b)
+        elif op == "LENGTH":
+            value = array_length(a)
+        elif op == "NORMALIZE":
+            vector = array_normalize(a)
+        elif op == "DISTANCE":
+            value = array_length(a - b)
+        elif op == "LERP":
+            vector = a + (b - a) * factor
+        elif op == "REFLECT":
+            normal = array_normalize(b)
+            double_dot = numpy.float32(2) * array_dot(a, normal)
+            vector = a - normal * numpy.expand_dims(double_dot, -1)
+
+        return vector, value
+
+    def create_python_code(self, a, b, factor):
+        op = self.operation
+
+        vector = "(0.0, 0.0, 0.0)"
+        value = "0.0"
+
+        if op in value_operations:
+            value = "vector_{}({}, {})".format(op.lower(), a, b)
+        else:
+            vector = "vector_{}({}, {}, {})".format(op.lower(), a, b, factor)
+
+        return vector, value
+
+def vector_length(builder, vector):
+    return builder.call_intrinsic("llvm.sqrt", [builder.vector_dot(vector, vector)])
+
+def vector_normalize(builder, vector):
+    zero = ir.Constant(ir.FloatType(), 0)
+    one = ir.Constant(ir.FloatType(), 1)
+    length = vector_length(builder, vector)
+    is_not_zero = builder.fcmp_ordered("!=", length, zero)
+    inverse_length = builder.select(is_not_zero, builder.fdiv(one, length), zero)
+    return builder.vector_scale(vector, inverse_length)
+
+def array_dot(a, b):
+    return numpy.sum(a * b, axis = -1)
+
+def array_length(vectors):
+    return numpy.sqrt(array_dot(vectors, vectors))
+
+def array_normalize(vectors):
+    # scaled with the inverse length like in the compiled code
+    length = numpy.expand_dims(array_length(vectors), -1)
+    inverse_length = numpy.where((length != 0) & (length == length), numpy.float32(1) / length, numpy.float32(0))
+    return vectors * inverse_length
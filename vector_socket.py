@@ -1,4 +1,5 @@
 import bpy
+from . lazy_imports import numpy
 from bpy.props import *
 from llvmlite import ir
 from mathutils import Vector
@@ -10,6 +11,8 @@ class VectorSocket(bpy.types.NodeSocket, BaseSocket):
     bl_idname = "cn_VectorSocket"
     ir_type = ir.ArrayType(ir.FloatType(), 3)
     c_type = c_float * 3
+    buffer_dtype = "float32"
+    buffer_shape = (3, )
 
     value = FloatVectorProperty(name = "Value", size = 3, subtype = "XYZ")
 
@@ -22,9 +25,38 @@ class VectorSocket(bpy.types.NodeSocket, BaseSocket):
         return (0.2, 0.2, 0.8, 1)
 
     def update_at_address(self, address):
-        c_float.from_address(address + 0).value = self.value.x
-        c_float.from_address(address + 4).value = self.value.y
-        c_float.from_address(address + 8).value = self.value.z
+        c_float.from_address(address + 0).value = self.value[0]
+        c_float.from_address(address + 4).value = self.value[1]
+        c_float.from_address(address + 8).value = self.value[2]
+
+    def to_register(self, builder, value):
+        return builder.vector_from_array(value)
+
+    def from_register(self, builder, value):
+        return builder.vector_to_array(value)
+
+    def get_property_value(self):
+        return tuple(self.value)
+
+    def value_from_python(self, value):
+        return Vector(value)
 
     def value_from_cvalue(self, cvalue):
         return Vector((cvalue[0], cvalue[1], cvalue[2]))
+
+    def cvalue_from_value(self, value):
+        return tuple(value)
+
+    def array_from_property(self):
+        return numpy.array(self.value, dtype = numpy.float32)
+
+    def array_from_values(self, values):
+        return numpy.array([tuple(v) for v in values], dtype = numpy.float32).reshape(-1, 3)
+
+    def values_from_array(self, array, amount):
+        return [Vector(v) for v in numpy.broadcast_to(array, (amount, 3)).tolist()]
+
+    def buffer_from_values(self, values):
+        if isinstance(values, numpy.ndarray):
+            return numpy.ascontiguousarray(values, dtype = numpy.float32).reshape(-1, 3)
+        return self.array_from_values(values)
@@ -0,0 +1,20 @@
+import bpy
+from . lazy_imports import numpy
+from . node_base import NodeBase
+
+class VertexInputNode(bpy.types.Node, NodeBase):
+    bl_idname = "cn_VertexInputNode"
+    bl_label = "Vertex Input"
+
+    def init(self, context):
+        self.outputs.new("cn_VectorSocket", "Position", "position")
+
+    def create_llvm_ir(self, builder):
+        # only used when the tree is not evaluated per vertex
+        return builder, builder.vector_constant([0, 0, 0])
+
+    def create_python_code(self):
+        return ("(0.0, 0.0, 0.0)", )
+
+    def execute_numpy(self):
+        return (numpy.zeros(3, dtype = numpy.float32), )
@@ -0,0 +1,104 @@
+import os
+import bpy
+import sys
+import json
+import time
+from pathlib import Path
+from bpy.app.handlers import load_post, persistent
+from . utils.timing import prettyTime
+from . utils.nodes import iter_compute_node_trees
+from . tree_info import update_if_necessary
+from . execution import generate_warm_up_modules
+from . object_cache import get_module_key, load_object_code, store_object_code, decode_object_code
+
+worker_path = Path(__file__).parent / "utils" / "compile_worker.py"
+
+class TreeSnapshot:
+    '''
+    Contains the IR of all modules of a tree that are not compiled yet.
+    The IR has to be generated in the main thread, because it accesses
+    the node tree. Afterwards it can be compiled anywhere.
+    '''
+    def __init__(self, tree):
+        self.tree = tree
+        self.modules = []
+
+        for module_ir, opt_level in generate_warm_up_modules(tree):
+            ir_text = str(module_ir)
+            key = get_module_key(ir_text, opt_level)
+            if load_object_code(tree, module_ir.name, key) is None:
+                self.modules.append((module_ir.name, key, ir_text, opt_level))
+
+
+def warm_up_trees(max_workers = None):
+    '''
+    Compiles all trees concurrently in separate processes.
+    The object code ends up in the object cache, so that the first
+    evaluation of a tree does not have to compile anything.
+    '''
+    start = time.perf_counter()
+    update_if_necessary()
+
+    snapshots = []
+    for tree in iter_compute_node_trees():
+        if tree.backend not in ("LLVM", "AUTO"):
+            continue
+        try: snapshot = TreeSnapshot(tree)
+        except Exception as e:
+            print("Warm-up: skipping '{}': {}".format(tree.name, e))
+            continue
+        if len(snapshot.modules) > 0:
+            snapshots.append(snapshot)
+
+    if len(snapshots) == 0:
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    with ThreadPoolExecutor(max_workers or os.cpu_count()) as executor:
+        futures = {executor.submit(compile_in_worker, s.modules) : s for s in snapshots}
+        for i, future in enumerate(as_completed(futures)):
+            snapshot = futures[future]
+            try: objects = future.result()
+            except Exception as e:
+                print("Warm-up: cannot compile '{}': {}".format(snapshot.tree.name, e))
+                continue
+
+            for (module_name, key, _, _), object_code in zip(snapshot.modules, objects):
+                store_object_code(snapshot.tree, module_name, key, object_code)
+            print("Warm-up: compiled '{}' ({}/{})".format(snapshot.tree.name, i + 1, len(snapshots)))
+
+    end = time.perf_counter()
+    print("Warm-up: {} trees in {}".format(len(snapshots), prettyTime(end - start)))
+
+def compile_in_worker(modules, started = None):
+    '''
+    started: called with the worker process before it gets the request,
+             so that it can be killed from another thread
+    '''
+    import subprocess
+    request = {"modules" : [{"ir" : ir_text, "opt_level" : opt_level}
+                            for _, _, ir_text, opt_level in modules]}
+    process = subprocess.Popen([get_python_executable(), str(worker_path)],
+                               stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    if started is not None:
+        started(process)
+    stdout, stderr = process.communicate(json.dumps(request).encode())
+    if process.returncode != 0:
+        raise Exception(stderr.decode())
+    response = json.loads(stdout.decode())
+    return [decode_object_code(data) for data in response["objects"]]
+
+def get_python_executable():
+    # inside of Blender sys.executable is the Blender binary
+    return getattr(bpy.app, "binary_path_python", sys.executable)
+
+
+@persistent
+def warm_up_after_load(dummy):
+    warm_up_trees()
+
+def register():
+    load_post.append(warm_up_after_load)
+
+def unregister():
+    load_post.remove(warm_up_after_load)